@@ -0,0 +1,59 @@
+""" Measures how much memory a book takes when held as a slotted Book object, as the stored dict, and as an old-style object with a __dict__.
+
+    The loaded data (and so the memory the program uses) is made of the stored dicts, the Book objects only live while a book is being added.
+    The slotted Book figure is what a Book costs while it's alive, not what the library saves at runtime.
+
+    Usage: python -m benchmarks.model_memory [--count 1000000] """
+
+from model import Book
+import argparse
+import gc
+import tracemalloc
+
+
+class LegacyBook:
+    """ The Book blueprint before it used __slots__, kept here only for comparison. """
+    def __init__(self, title: str, author: str, quantity: int, date_published='unknown', genre='unknown', age_restriction='all-ages', is_available=True):
+        self.title = title
+        self.author = author
+        self.quantity = quantity
+        self.date_published = date_published
+        self.genre = genre
+        self.age_restriction = age_restriction
+        self.is_available = is_available
+
+
+
+def measure(build, count: int):
+    """ Builds count records with build(number) and measures the memory they hold.
+
+        Returns:
+            float: The average number of bytes per record. """
+    # the titles are made beforehand so only the records themselves are measured.
+    titles = [f'Book {number}' for number in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    records = [build(title) for title in titles]
+    used, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return used / count
+
+
+def run(count: int):
+    """ Returns:
+            dict: The average bytes per record for each way of holding a book. """
+    return {'slotted Book': measure(lambda title: Book(title, 'Author', 1), count),
+            'stored dict (what the data holds)': measure(lambda title: Book(title, 'Author', 1).to_record(), count),
+            'legacy __dict__ Book': measure(lambda title: LegacyBook(title, 'Author', 1), count)}
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-record memory of the book model.')
+    parser.add_argument('--count', type=int, default=1_000_000)
+    arguments = parser.parse_args()
+
+    print(f'MEMORY PER RECORD ({arguments.count:,} books):')
+    for label, size in run(arguments.count).items():
+        print(f'{label}: {size:.0f} bytes ({size * arguments.count / 2**20:.0f} MiB total)')
@@ -0,0 +1,188 @@
+""" Times the key paths of the service layer on a synthetic storage (see benchmarks.synthetic) and writes a JSON report,
+    so runs on different commits can be compared.
+
+    Usage: python -m benchmarks.service_paths [--records 10000] [--backend journal] [--repeat 200] [--output report.json] [--compare baseline.json]
+    --records sets the number of users, books, and borrows (and a tenth as many authors), each can also be set on its own. """
+
+from .synthetic import generate, write_storage, username_of
+from data import Repository, SQLiteStorage, get_repository
+from data.shards import split_storage
+from services import GeneralServices, LibrarianServices, MemberServices, Check
+from presentation import login
+from contextlib import redirect_stdout
+from datetime import datetime
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# the paths that are timed, in the order they're run. Writes come last so the reads see the generated data as it is.
+PATHS = ['startup', 'login', 'first_search', 'search', 'search_user', 'field_exists', 'add_user', 'add_book', 'borrow_book', 'return_book']
+
+
+
+def summarize(samples: list):
+    """ Returns:
+            dict: How many times the path ran, and its mean/median/p95/min/max time in milliseconds. """
+    ordered = sorted(samples)
+    return {'count': len(ordered),
+            'mean_ms': statistics.fmean(ordered) * 1000,
+            'median_ms': statistics.median(ordered) * 1000,
+            'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            'min_ms': ordered[0] * 1000,
+            'max_ms': ordered[-1] * 1000}
+
+
+def timed(function, arguments: list):
+    """ Calls function(*argument) for each argument, keeping whatever it prints to itself.
+
+        Returns:
+            list: How long each call took, in seconds. """
+    samples = []
+    with redirect_stdout(io.StringIO()):
+        for argument in arguments:
+            start = time.perf_counter()
+            function(*argument)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def prepare_storage(directory: str, backend: str, data: dict):
+    """ Writes the data in the format of the backend.
+
+        Returns:
+            str: The path to open the storage with. """
+    json_file = os.path.join(directory, 'storage.json')
+    write_storage(json_file, data)
+    if backend == 'sqlite':
+        file = os.path.join(directory, 'storage.db')
+        SQLiteStorage(file).import_data(data)
+        return file
+    if backend == 'sharded':
+        file = os.path.join(directory, 'storage')
+        split_storage(json_file, file)
+        return file
+    return json_file
+
+
+def current_commit():
+    """ Returns:
+            str: The commit the benchmark was run on, or None outside of a git checkout. """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(users=10_000, books=10_000, authors=1_000, borrows=10_000, backend='journal', repeat=200, seed=0):
+    """ Generates the storage, then times every path in PATHS on it.
+
+        Returns:
+            dict: The report, with the sizes and timings of every path. """
+    rng = random.Random(seed)
+    data = generate(users, books, authors, borrows, seed)
+    titles = list(data['library'])
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        file = prepare_storage(directory, backend, data)
+        del data
+
+        # loading everything from disk, like a new session does.
+        startup = lambda: GeneralServices(file, backend, repository=Repository(file, backend))
+        results['startup'] = timed(startup, [()] * min(repeat, 3))
+
+        repository = get_repository(file, backend)
+        librarian = LibrarianServices(file, backend, repository)
+        member = MemberServices(file, backend, repository)
+
+        def log_in(username: str):
+            sys.stdin = io.StringIO(f'{username}\n')
+            try:
+                login(file)
+            finally:
+                sys.stdin = sys.__stdin__
+        # login always opens the storage with the default backend, it's loaded beforehand so only the login itself is timed.
+        get_repository(file)
+        results['login'] = timed(log_in, [(username_of(rng.randint(1, users)),) for sample in range(repeat)])
+
+        # the catalog index is built by the first search.
+        words = [title.split()[rng.randrange(2)].lower() for title in rng.sample(titles, min(repeat, len(titles)))]
+        results['first_search'] = timed(librarian.search_catalog, [(words[0],)])
+        results['search'] = timed(librarian.search_catalog, [(word,) for word in words])
+        results['search_user'] = timed(librarian.search, [('user', username_of(rng.randint(1, users))) for sample in range(repeat)])
+
+        fields = [(field, dataset) for dataset in ['accounts', 'library', 'authors', 'borrows'] for field in ['age', 'genre', 'quantity', 'role']]
+        results['field_exists'] = timed(Check.field_exists, [rng.choice(fields) for sample in range(repeat)])
+
+        results['add_user'] = timed(librarian.add_user, [(f'bench_user{number}', f'bench_user{number}@gmail.com', 30) for number in range(repeat)])
+        results['add_book'] = timed(librarian.add_book, [(f'Bench Book {number}', 'Author 0', 5) for number in range(repeat)])
+
+        # the new users haven't borrowed anything yet, so none of their borrows are turned down.
+        borrows_made = [(f'Bench Book {number}', f'bench_user{number}') for number in range(repeat)]
+        results['borrow_book'] = timed(member.borrow_book, borrows_made)
+        results['return_book'] = timed(member.return_book, borrows_made)
+
+    return {'commit': current_commit(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'backend': backend,
+            'sizes': {'users': users, 'books': books, 'authors': authors, 'borrows': borrows},
+            'results': {path: summarize(results[path]) for path in PATHS}}
+
+
+def compare(report: dict, baseline: dict):
+    """ Returns:
+            dict: How many times slower (>1) or faster (<1) each path's median is than in the baseline. """
+    ratios = {}
+    for path, result in report['results'].items():
+        before = baseline.get('results', {}).get(path)
+        if before and before['median_ms'] > 0:
+            ratios[path] = result['median_ms'] / before['median_ms']
+    return ratios
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times the key paths of the service layer.')
+    parser.add_argument('--records', type=int, default=10_000)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--books', type=int)
+    parser.add_argument('--authors', type=int)
+    parser.add_argument('--borrows', type=int)
+    parser.add_argument('--backend', default='journal', choices=['json', 'journal', 'sqlite', 'sharded'])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='where to write the JSON report')
+    parser.add_argument('--compare', help='a previous JSON report to compare against')
+    arguments = parser.parse_args()
+
+    records = arguments.records
+    report = run(arguments.users or records, arguments.books or records, arguments.authors or max(records // 10, 1),
+                 arguments.borrows if arguments.borrows is not None else records, arguments.backend, arguments.repeat, arguments.seed)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as save:
+            json.dump(report, save, indent=4)
+
+    ratios = {}
+    if arguments.compare:
+        with open(arguments.compare, 'r') as f:
+            ratios = compare(report, json.load(f))
+
+    sizes = report['sizes']
+    print(f"SERVICE PATHS ({sizes['users']:,} users, {sizes['books']:,} books, {sizes['authors']:,} authors, {sizes['borrows']:,} borrows, {report['backend']}):")
+    for path, result in report['results'].items():
+        line = f"{path}: median {result['median_ms']:.3f} ms, p95 {result['p95_ms']:.3f} ms ({result['count']} runs)"
+        if path in ratios:
+            line += f', {ratios[path]:.2f}x baseline'
+        print(line)
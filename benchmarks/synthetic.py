@@ -0,0 +1,109 @@
+""" Generates synthetic storage files with any number of users, books, authors, and borrow records, for the benchmarks.
+
+    Usage: python -m benchmarks.synthetic storage.json [--users 10000] [--books 10000] [--authors 1000] [--borrows 10000] [--seed 0] """
+
+from model import User, Author, Book, Borrow, to_timestamp
+from services.generate_id import LAST_ID_KEY, format_id
+from datetime import datetime, timedelta
+import argparse
+import json
+import random
+
+
+GENRES = ['fantasy', 'science fiction', 'mystery', 'romance', 'horror', 'history', 'biography', 'poetry', 'philosophy', 'travel']
+NATIONALITIES = ['American', 'British', 'Filipino', 'Japanese', 'French', 'German', 'Nigerian', 'Brazilian']
+
+# made-up words the titles are built from, so catalog searches match a realistic number of books.
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'shi', 'vor', 'an', 'del', 'qua', 'zen', 'rho', 'bel', 'tar', 'ni', 'os']
+
+
+
+def make_word(rng: random.Random):
+    return ''.join(rng.choice(SYLLABLES) for syllable in range(rng.randint(2, 4)))
+
+
+def username_of(number: int):
+    return f'user{number}'
+
+
+def title_of(number: int, rng: random.Random):
+    return f'{make_word(rng).capitalize()} {make_word(rng).capitalize()} {number}'
+
+
+def author_of(number: int):
+    return f'Author {number}'
+
+
+def generate(users=10_000, books=10_000, authors=1_000, borrows=10_000, seed=0):
+    """ Builds the datasets in the same shape the services save them in. Borrows are spread over random (book, user) pairs,
+        about a third of them already returned.
+
+        Returns:
+            dict: The generated datasets. """
+    rng = random.Random(seed)
+    today = datetime.now()
+    authors = max(authors, 1) if books else authors
+
+    accounts = {}
+    for number in range(1, users + 1):
+        accounts[username_of(number)] = User(username_of(number), f'{username_of(number)}@gmail.com', rng.randint(13, 80), format_id(number)).to_record()
+
+    author_records = {}
+    for number in range(authors):
+        author_records[author_of(number)] = Author(author_of(number), rng.randint(25, 90), 'unknown', rng.choice(NATIONALITIES)).to_record()
+
+    library = {}
+    for number in range(books):
+        title = title_of(number, rng)
+        author = author_of(rng.randrange(authors))
+        library[title] = Book(title, author, rng.randint(1, 20), str(rng.randint(1900, 2024)), rng.choice(GENRES),
+                              rng.choice(['all-ages', 'mature'])).to_record()
+
+    # a user can't borrow the same book twice, so there can't be more borrows than (book, user) pairs.
+    borrow_records = {}
+    titles = list(library)
+    borrows = min(borrows, len(titles) * users)
+    made = 0
+    while made < borrows:
+        title, number = rng.choice(titles), rng.randint(1, users)
+        borrower = username_of(number)
+        if borrower in borrow_records.get(title, {}):
+            continue
+        made += 1
+
+        borrowed_on = today - timedelta(days=rng.randint(0, 60))
+        returned = rng.random() < 1 / 3
+        borrow = Borrow(title, borrower, to_timestamp(borrowed_on), to_timestamp(borrowed_on + timedelta(days=14)),
+                        to_timestamp(borrowed_on + timedelta(days=rng.randint(1, 20))) if returned else 'unknown')
+        borrow_records.setdefault(title, {})[borrower] = borrow.to_record()
+
+        account = accounts[borrower]
+        if returned:
+            account['borrow_count'] += 1
+        else:
+            account['borrowed_books'].append(title)
+
+    return {'accounts': accounts, 'authors': author_records, 'library': library, 'borrows': borrow_records, 'meta': {LAST_ID_KEY: users}}
+
+
+def write_storage(file, data):
+    """ Writes the datasets as a storage.json file. """
+    with open(file, 'w') as save:
+        json.dump(data, save, separators=(',', ':'))
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates a synthetic storage file.')
+    parser.add_argument('file')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--books', type=int, default=10_000)
+    parser.add_argument('--authors', type=int, default=1_000)
+    parser.add_argument('--borrows', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args()
+
+    data = generate(arguments.users, arguments.books, arguments.authors, arguments.borrows, arguments.seed)
+    write_storage(arguments.file, data)
+    print(f"Generated {len(data['accounts']):,} users, {len(data['library']):,} books, {len(data['authors']):,} authors, "
+          f"and {sum(len(borrowers) for borrowers in data['borrows'].values()):,} borrows into '{arguments.file}'.")
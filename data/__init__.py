@@ -1 +1,11 @@
-from .storage import GeneralDataHandling, Create, Update, Delete
\ No newline at end of file
+from .journal import Journal
+from .sqlite_storage import SQLiteStorage, migrate_json_to_sqlite
+from .storage import GeneralDataHandling, Create, Update, Delete, JsonStorage, records_under, open_storage, load_data
+from .transaction import Transaction
+from .indexes import IndexManager
+from .repository import Repository, get_repository
+from .migrations import Migration, MIGRATIONS, LATEST_VERSION, SCHEMA_VERSION_KEY, migrate
+from .instrumentation import instrumented, instrumented_class, record_bytes, dump_metrics
+from .locking import FileLock, ReadWriteLock, StorageConflictError, read_locked, write_locked
+from .codecs import CODECS, SnapshotCorruptedError, register_codec, get_codec, read_snapshot, write_snapshot
+from .catalog import Catalog, write_catalog, catalog_path_of
\ No newline at end of file
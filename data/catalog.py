@@ -0,0 +1,268 @@
+""" This is where the read-only catalog is handled. It's a copy of the books ('library') and 'authors' made for lookups: each dataset has a
+    directory of its names, sorted, pointing to where each record is in the file. The file is opened with mmap, so a lookup only reads
+    (and decodes) the directory entries it goes through and the one record it found, and every process that opens the catalog shares
+    the same pages of it instead of holding its own copy of the library.
+
+    Usage: python -m data.catalog data/storage.json [--output data/storage.json.catalog]
+
+    Each book's copies lent out when the catalog was built are kept as well ('copies_out'), so availability can be answered from it, and
+    each author's record lists their books ('books'), looked up from the library when the catalog is built.
+
+    The catalog doesn't change when the data does. Build it again (eg, after a nightly batch) to pick up the changes, readers that have
+    it open switch to the new one on their next lookup. """
+
+from .instrumentation import instrumented_class
+from model import NO_DATE
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+
+
+DATASETS = ['library', 'authors', 'copies_out']
+
+MAGIC = b'LIBCAT\x00\x01'
+# magic, data version the catalog was built from, number of datasets.
+HEADER = struct.Struct('<8sqI')
+# dataset name (padded), number of records, where its directory starts.
+SECTION = struct.Struct('<16sQQ')
+# where the name starts, its length, where the record starts, its length. Entries are sorted by name.
+ENTRY = struct.Struct('<QIQI')
+
+
+
+def catalog_path_of(file):
+    """ Returns:
+            str: Where the catalog of the storage file is kept by default. """
+    return f'{file}.catalog'
+
+
+def _copies_out(data):
+    """ Returns:
+            dict: title -> copies lent out (loans not returned yet), for every book that has any. """
+    copies = {}
+    for title, borrowers in data.get('borrows', {}).items():
+        out = sum(borrow_info.get('returned_on', NO_DATE) in (NO_DATE, None) for borrow_info in borrowers.values())
+        if out:
+            copies[title] = out
+    return copies
+
+
+def _authors_with_books(data):
+    """ Returns:
+            dict: name -> author record with the titles of their books in the library ('books'), for every author. """
+    books = {}
+    for title, book in data.get('library', {}).items():
+        books.setdefault(book.get('author'), []).append(title)
+    return {name: {**author, 'books': sorted(books.get(name, []))} for name, author in data.get('authors', {}).items()}
+
+
+def write_catalog(path, data):
+    """ Writes the books and authors of the data into a catalog file.
+
+        Returns:
+            int: The size of the catalog. """
+    sections = []
+    blobs = []
+    # the header and the sections come first, the directories and records after them.
+    position = HEADER.size + SECTION.size * len(DATASETS)
+
+    for dataset in DATASETS:
+        if dataset == 'copies_out':
+            records = _copies_out(data)
+        elif dataset == 'authors':
+            records = _authors_with_books(data)
+        else:
+            records = data.get(dataset, {})
+        names = sorted(records, key=lambda name: name.encode('utf-8'))
+
+        # names and records are laid out after the directory, in the directory's order.
+        directory_start = position
+        position += ENTRY.size * len(names)
+        entries, contents = [], []
+        for name in names:
+            encoded_name = name.encode('utf-8')
+            record = json.dumps(records[name], separators=(',', ':')).encode('utf-8')
+            entries.append(ENTRY.pack(position, len(encoded_name), position + len(encoded_name), len(record)))
+            contents.append(encoded_name + record)
+            position += len(encoded_name) + len(record)
+
+        sections.append(SECTION.pack(dataset.encode('utf-8'), len(names), directory_start))
+        blobs.extend(entries)
+        blobs.extend(contents)
+
+    version = data.get('meta', {}).get('version', 0)
+    # written to a temporary file first so readers never open a half-written catalog.
+    temporary_file = f'{path}.tmp'
+    with open(temporary_file, 'wb') as save:
+        save.write(HEADER.pack(MAGIC, version, len(DATASETS)))
+        save.writelines(sections)
+        save.writelines(blobs)
+    os.replace(temporary_file, path)
+    return position
+
+
+
+class _CatalogFile():
+    """ One opened catalog file. Kept apart from Catalog so a lookup that's still going keeps using the file it started with,
+        even if the catalog is switched to a newer file in the meantime. """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, self.version, dataset_count = HEADER.unpack_from(self.handle)
+        if magic != MAGIC:
+            self.handle.close()
+            raise ValueError(f"'{path}' is not a catalog file.")
+
+        # dataset -> (number of records, where its directory starts)
+        self.sections = {}
+        for number in range(dataset_count):
+            name, count, directory_start = SECTION.unpack_from(self.handle, HEADER.size + SECTION.size * number)
+            self.sections[name.rstrip(b'\x00').decode('utf-8')] = (count, directory_start)
+
+
+    def count(self, dataset: str):
+        return self.sections.get(dataset, (0, 0))[0]
+
+
+    def entry(self, dataset: str, position: int):
+        count, directory_start = self.sections[dataset]
+        return ENTRY.unpack_from(self.handle, directory_start + ENTRY.size * position)
+
+
+    def name_at(self, dataset: str, position: int):
+        name_start, name_length, record_start, record_length = self.entry(dataset, position)
+        return self.handle[name_start:name_start + name_length]
+
+
+    def search(self, dataset: str, encoded_name: bytes):
+        """ Binary search over the dataset's directory, comparing the names as bytes (the order they were sorted in).
+
+            Returns:
+                int: The position of the first name that isn't before encoded_name. """
+        low, high = 0, self.count(dataset)
+        while low < high:
+            middle = (low + high) // 2
+            if self.name_at(dataset, middle) < encoded_name:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+
+@instrumented_class('catalog')
+class Catalog():
+    """ A read-only catalog file, opened with mmap. Use get() and names() to look records up. """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = _CatalogFile(path)
+
+
+    @property
+    def version(self):
+        """ The data version the catalog was built from, so callers can tell how up to date it is. """
+        return self.file.version
+
+
+    def refresh(self):
+        """ Switches to the catalog on disk if it was built again since it was opened.
+
+            Returns:
+                bool: True if it switched, otherwise False. """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self.file.signature:
+            return False
+
+        with self.lock:
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) != self.file.signature:
+                # the old file is unmapped once the lookups still using it are done with it.
+                self.file = _CatalogFile(self.path)
+        return True
+
+
+    def close(self):
+        self.file.handle.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def __len__(self):
+        return sum(count for count, directory_start in self.file.sections.values())
+
+
+    def count(self, dataset: str):
+        """ Returns:
+                int: The number of records in the dataset. """
+        return self.file.count(dataset)
+
+
+    def get(self, dataset: str, name: str):
+        """ Looks up a single record. Only that record is decoded.
+
+            Returns:
+                dict: The record, or None if there's none with that name. """
+        file = self.file
+        encoded_name = name.encode('utf-8')
+        position = file.search(dataset, encoded_name)
+        if position >= file.count(dataset):
+            return None
+
+        name_start, name_length, record_start, record_length = file.entry(dataset, position)
+        if file.handle[name_start:name_start + name_length] != encoded_name:
+            return None
+        return json.loads(file.handle[record_start:record_start + record_length])
+
+
+    def __contains__(self, item):
+        dataset, name = item
+        return self.get(dataset, name) is not None
+
+
+    def names(self, dataset: str, prefix=''):
+        """ Goes through the names of the dataset in sorted order, only the ones that start with the prefix if one is given.
+
+            Returns:
+                generator: Each name. """
+        file = self.file
+        encoded_prefix = prefix.encode('utf-8')
+        for position in range(file.search(dataset, encoded_prefix), file.count(dataset)):
+            name = file.name_at(dataset, position)
+            if not name.startswith(encoded_prefix):
+                return
+            yield name.decode('utf-8')
+
+
+
+if __name__ == '__main__':
+    from .locking import FileLock
+    from .storage import open_storage
+
+    parser = argparse.ArgumentParser(description='Builds the read-only catalog of the stored books and authors.')
+    parser.add_argument('file')
+    parser.add_argument('--backend', default='journal', choices=['json', 'journal', 'sqlite', 'sharded'])
+    parser.add_argument('--output', help='where the catalog is written (next to the storage by default)')
+    arguments = parser.parse_args()
+
+    # holds the lock so the catalog isn't built from a half-saved change.
+    with FileLock(arguments.file):
+        data = open_storage(arguments.file, arguments.backend).load()
+        output = arguments.output or catalog_path_of(arguments.file)
+        size = write_catalog(output, data)
+    print(f"Wrote {len(data.get('library', {})):,} books and {len(data.get('authors', {})):,} authors into '{output}' ({size:,} bytes).")
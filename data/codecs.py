@@ -0,0 +1,218 @@
+""" This is where snapshots (the whole data, eg, storage.json) are turned into bytes and back. Snapshots can be saved as:
+
+        'json'          pretty-printed json (the default, easy to read and edit by hand)
+        'json-compact'  minified json
+        'binary'        pickle (protocol 5), behind a header with a checksum. Loads faster than json, eg, for large catalogs.
+
+    The format is found from the file itself when it's loaded, and kept when it's saved again. To convert a snapshot:
+
+        python -m data.codecs data/storage.json --to binary
+
+    New snapshots use LIBRARY_SNAPSHOT_CODEC if it's set, otherwise 'json'. Other codecs can be added with register_codec.
+
+    Decoding is still most of the load: on a 500k-book snapshot, 'binary' loads in about 1.7s against 2.9s for 'json-compact'.
+    Starting in well under a second on catalogs that size isn't reached by the codec alone. Processes that only look books up
+    can use the memory-mapped catalog instead (see data.catalog). """
+
+from .instrumentation import instrumented
+import argparse
+import io
+import json
+import os
+import pickle
+import struct
+import zlib
+
+
+DEFAULT_CODEC = os.environ.get('LIBRARY_SNAPSHOT_CODEC') or 'json'
+
+# binary snapshots start with the magic bytes, then the codec's code, the payload's length, and its crc32 checksum.
+MAGIC = b'LIBSNAP\x01'
+HEADER = struct.Struct('<8sBQI')
+
+
+
+class SnapshotCorruptedError(ValueError):
+    def __init__(self, file, reason: str):
+        super().__init__(f"Snapshot, '{file}', is corrupted: {reason}")
+        self.file = file
+
+
+
+class JsonCodec():
+    """ Plain json, readable by anything. It has no header, so it's recognized by not having one. """
+    code = None
+
+    def __init__(self, name: str, indent=None):
+        self.name = name
+        self.indent = indent
+
+
+    def encode(self, data):
+        separators = None if self.indent is not None else (',', ':')
+        return json.dumps(data, indent=self.indent, separators=separators).encode('utf-8')
+
+
+    def decode(self, payload: bytes):
+        return json.loads(payload)
+
+
+
+class _PlainValuesUnpickler(pickle.Unpickler):
+    """ Only rebuilds plain values (dicts, lists, strings, numbers). Snapshots never hold anything else, so a snapshot naming
+        a class or function is refused instead of loaded. """
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"snapshots can't hold '{module}.{name}'.")
+
+
+
+class PickleCodec():
+    """ Pickle protocol 5, which stays readable across python versions. Loading is restricted to plain values. """
+    code = 1
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+    def encode(self, data):
+        return pickle.dumps(data, protocol=5)
+
+
+    def decode(self, payload: bytes):
+        return _PlainValuesUnpickler(io.BytesIO(payload)).load()
+
+
+
+CODECS = {}
+CODES = {}
+
+
+def register_codec(codec):
+    """ Makes the codec usable by name. Codecs with a code (1-255) are saved behind the binary header, and are recognized by it on load. """
+    CODECS[codec.name] = codec
+    if codec.code is not None:
+        CODES[codec.code] = codec
+
+
+register_codec(JsonCodec('json', indent=4))
+register_codec(JsonCodec('json-compact'))
+register_codec(PickleCodec('binary'))
+
+
+
+def get_codec(name=None):
+    """ Returns:
+            obj: The codec with the name, the default codec if it's None. """
+    name = name or DEFAULT_CODEC
+    if name not in CODECS:
+        raise ValueError(f"Snapshot codec, '{name}', is not supported. Use one of {', '.join(CODECS)}.")
+    return CODECS[name]
+
+
+def is_binary(file):
+    """ Returns:
+            bool: True if the file is a binary snapshot, otherwise False. """
+    try:
+        with open(file, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (FileNotFoundError, IsADirectoryError):
+        return False
+
+
+def encode_snapshot(data, codec):
+    """ Returns:
+            bytes: The data in the codec's format, behind the binary header if the codec has a code. """
+    payload = codec.encode(data)
+    if codec.code is None:
+        return payload
+    return HEADER.pack(MAGIC, codec.code, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_snapshot(content: bytes, file=''):
+    """ Finds the snapshot's format and reads it.
+
+        Returns:
+            tuple: The data, and the codec it was saved with. """
+    if not content.startswith(MAGIC):
+        # json snapshots saved by this program are pretty-printed if their first line ends right after the '{'.
+        codec = CODECS['json'] if content[:2] in (b'{\n', b'{\r') else CODECS['json-compact']
+        return codec.decode(content), codec
+
+    if len(content) < HEADER.size:
+        raise SnapshotCorruptedError(file, 'the header is cut off.')
+    magic, code, length, checksum = HEADER.unpack_from(content)
+    payload = memoryview(content)[HEADER.size:]
+    if code not in CODES:
+        raise SnapshotCorruptedError(file, f'unknown codec {code}.')
+    if len(payload) != length:
+        raise SnapshotCorruptedError(file, f'expected {length:,} bytes of data, found {len(payload):,}.')
+    if zlib.crc32(payload) != checksum:
+        raise SnapshotCorruptedError(file, 'the checksum does not match.')
+
+    codec = CODES[code]
+    try:
+        data = codec.decode(payload)
+    except (pickle.UnpicklingError, ValueError, EOFError, TypeError) as e:
+        raise SnapshotCorruptedError(file, str(e))
+    return data, codec
+
+
+@instrumented('snapshot.read')
+def read_snapshot(file):
+    """ Reads the snapshot file, whatever format it was saved in.
+
+        Returns:
+            tuple: The data, and the codec it was saved with. """
+    with open(file, 'rb') as f:
+        return decode_snapshot(f.read(), file)
+
+
+@instrumented('snapshot.write')
+def write_snapshot(file, data, codec):
+    """ Writes the data into the snapshot file in the codec's format.
+
+        Returns:
+            int: The size of the file. """
+    content = encode_snapshot(data, codec)
+    # written to a temporary file first so a crash never leaves a half-written snapshot.
+    # it's on disk before it replaces the old one, and the rename is on disk before returning (eg, before the journal is emptied).
+    temporary_file = f'{file}.tmp'
+    with open(temporary_file, 'wb') as save:
+        save.write(content)
+        save.flush()
+        os.fsync(save.fileno())
+    os.replace(temporary_file, file)
+    sync_directory(file)
+    return len(content)
+
+
+def sync_directory(file):
+    """ Makes sure a file renamed into the file's directory stays renamed after a power loss.
+        Does nothing where directories can't be synced (eg, Windows). """
+    try:
+        directory = os.open(os.path.dirname(os.path.abspath(file)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
+
+
+
+if __name__ == '__main__':
+    from .journal import Journal
+    from .locking import FileLock
+
+    parser = argparse.ArgumentParser(description='Converts a snapshot (eg, storage.json) to another format.')
+    parser.add_argument('file')
+    parser.add_argument('--to', required=True, choices=list(CODECS))
+    arguments = parser.parse_args()
+
+    # holds the lock so no session saves in the middle of it. Changes still waiting in the journal are merged in as well.
+    with FileLock(arguments.file):
+        journal = Journal(arguments.file, codec=arguments.to)
+        journal.checkpoint(journal.load())
+    print(f"Converted '{arguments.file}' to {arguments.to} ({os.path.getsize(arguments.file):,} bytes).")
@@ -0,0 +1,169 @@
+""" This is where secondary indexes are kept. They are updated on every Create/Update/Delete call (as an observer of the data handlers) instead of being rebuilt by scanning the datasets.
+    Storages that can look records up through their own indexes (eg, SQLite) answer the lookups instead, and only the records changed since the last save are indexed here. """
+
+import threading
+
+
+class IndexManager():
+    def __init__(self, data):
+        self.rebuild(data)
+
+
+    def rebuild(self, data):
+        """ Drops every index. Each is built again from the data the first time it's used, so datasets nobody looks up are never loaded. """
+        self.data = data
+        self.built = set()
+        self.build_lock = threading.Lock()
+
+        # looks records up in the storage (see SQLiteDatasets.find), if it can.
+        self.find = getattr(data, 'find', None)
+        # (dataset, keys) of the records changed since the last save, when the lookups go through the storage.
+        self.changed = set()
+
+        self.titles_by_borrower = {}
+        self.borrowers_by_title = {}
+        self.books_by_author = {}
+        self.username_by_id = {}
+        self.username_by_email = {}
+
+
+    def _build(self, dataset: str):
+        """ Builds the indexes that come from the dataset, if they weren't built yet. """
+        if dataset in self.built:
+            return
+
+        # several readers may use the same index at the same time, only the first one builds it.
+        with self.build_lock:
+            if dataset in self.built:
+                return
+
+            if dataset == 'borrows':
+                for title, borrowers in self.data.get('borrows', {}).items():
+                    for borrower, borrow_info in borrowers.items():
+                        self._index('borrows', (title, borrower), None, borrow_info)
+            else:
+                for name, record in self.data.get(dataset, {}).items():
+                    self._index(dataset, (name,), None, record)
+
+            # only marked as built once it's complete, so other readers never use a half-built index.
+            self.built.add(dataset)
+
+
+    def on_change(self, dataset: str, keys: tuple, old, new):
+        """ Updates the indexes after a record was added (old is None), changed, or removed (new is None). """
+        if self.find is not None:
+            # the storage still has the record as it was at the last save, so what it looked like then isn't indexed here.
+            if (dataset, keys) not in self.changed:
+                self.changed.add((dataset, keys))
+                old = None
+            self._index(dataset, keys, old, new)
+
+        # indexes that weren't built yet will see the change when they're built.
+        elif dataset in self.built:
+            self._index(dataset, keys, old, new)
+
+
+    def mark_saved(self):
+        """ Forgets the changed records once they're saved, since the storage finds them now. """
+        if self.find is not None and self.changed:
+            self.rebuild(self.data)
+
+
+    def _look_up(self, lookup: str, value, dataset: str, keys_of, unsaved: set):
+        """ Looks the value up in the storage, leaving out the records changed since the last save, then adds the changed ones that match (unsaved).
+
+            Returns:
+                set: The names of the records found. """
+        if value is None:
+            return set(unsaved)
+        found = {name for name in self.find(lookup, value) if (dataset, keys_of(name)) not in self.changed}
+        return found | unsaved
+
+
+    def _index(self, dataset: str, keys: tuple, old, new):
+        if dataset == 'accounts':
+            username, = keys
+            self._replace(self.username_by_id, old, new, 'id', username)
+            self._replace(self.username_by_email, old, new, 'email', username)
+
+        elif dataset == 'library':
+            title, = keys
+            if old is not None:
+                _discard(self.books_by_author, old.get('author'), title)
+            if new is not None:
+                self.books_by_author.setdefault(new.get('author'), set()).add(title)
+
+        elif dataset == 'borrows':
+            title, borrower = keys
+            if old is not None and new is None:
+                _discard(self.titles_by_borrower, borrower, title)
+                _discard(self.borrowers_by_title, title, borrower)
+            elif new is not None:
+                self.titles_by_borrower.setdefault(borrower, set()).add(title)
+                self.borrowers_by_title.setdefault(title, set()).add(borrower)
+
+
+    @staticmethod
+    def _replace(index: dict, old, new, field: str, name: str):
+        """ Points the index from the record's old field value to its new one. """
+        if old is not None and index.get(old.get(field)) == name:
+            del index[old.get(field)]
+        if new is not None:
+            index[new.get(field)] = name
+
+
+    def borrowed_titles(self, borrower: str):
+        """ Returns:
+                set: The titles with borrow info for the borrower. """
+        if self.find is not None:
+            return self._look_up('borrowed_titles', borrower, 'borrows', lambda title: (title, borrower), self.titles_by_borrower.get(borrower, set()))
+        self._build('borrows')
+        return self.titles_by_borrower.get(borrower, set())
+
+
+    def borrowers_of(self, title: str):
+        """ Returns:
+                set: The borrowers with borrow info for the book. """
+        if self.find is not None:
+            return self._look_up('borrowers_of', title, 'borrows', lambda borrower: (title, borrower), self.borrowers_by_title.get(title, set()))
+        self._build('borrows')
+        return self.borrowers_by_title.get(title, set())
+
+
+    def books_of(self, author: str):
+        """ Returns:
+                set: The titles in the library written by the author. """
+        if self.find is not None:
+            return self._look_up('books_of', author, 'library', lambda title: (title,), self.books_by_author.get(author, set()))
+        self._build('library')
+        return self.books_by_author.get(author, set())
+
+
+    def user_ids(self):
+        """ Returns:
+                dict: Every user id, pointing to its username. """
+        if self.find is not None:
+            return {record.get('id'): username for username, record in self.data.get('accounts', {}).items()}
+        self._build('accounts')
+        return self.username_by_id
+
+
+    def username_of_email(self, email: str):
+        """ Returns:
+                str: The username registered with the email, or None. """
+        if self.find is not None:
+            unsaved = self.username_by_email.get(email)
+            return unsaved or next(iter(self._look_up('username_of_email', email, 'accounts', lambda username: (username,), set())), None)
+        self._build('accounts')
+        return self.username_by_email.get(email)
+
+
+
+def _discard(index: dict, key, value):
+    """ Removes the value from the set under key, dropping the key once its set is empty. """
+    values = index.get(key)
+    if values is None:
+        return
+    values.discard(value)
+    if not values:
+        del index[key]
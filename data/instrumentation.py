@@ -0,0 +1,173 @@
+""" This is where the program's own timings and counters are kept: how many times each service method, validation, and storage call ran,
+    how long they took (as a histogram), and how many bytes were written to disk.
+
+    Turned on by setting LIBRARY_METRICS to the file the metrics are dumped to when the program exits, eg:
+
+        LIBRARY_METRICS=metrics.json python main.py     (JSON)
+        LIBRARY_METRICS=metrics.prom python main.py     (Prometheus text format, for files ending in '.prom' or '.txt')
+
+    When it's not set, the decorators leave the methods untouched, so nothing is measured and nothing is slowed down. """
+
+from bisect import bisect_left
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+
+METRICS_FILE = os.environ.get('LIBRARY_METRICS') or None
+
+# upper bounds (in seconds) of the latency histogram buckets, anything slower goes in the last (+Inf) bucket.
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+
+class Metrics():
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # operation -> [call count, error count, total seconds, count per latency bucket]
+        self.operations = {}
+        # where bytes were written (eg, 'journal') -> number of bytes
+        self.bytes_written = {}
+
+
+    def observe(self, operation: str, seconds: float, failed=False):
+        """ Counts one call of the operation and how long it took. """
+        with self.lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = self.operations[operation] = [0, 0, 0.0, [0] * (len(LATENCY_BUCKETS) + 1)]
+            stats[0] += 1
+            stats[1] += failed
+            stats[2] += seconds
+            stats[3][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+
+    def add_bytes(self, target: str, count: int):
+        with self.lock:
+            self.bytes_written[target] = self.bytes_written.get(target, 0) + count
+
+
+    def to_json(self):
+        """ Returns:
+                dict: Every operation's counts, mean time, and histogram (bucket upper bound in seconds -> calls), plus the bytes written. """
+        with self.lock:
+            operations = {}
+            for operation, (count, errors, total, buckets) in sorted(self.operations.items()):
+                operations[operation] = {'count': count,
+                                         'errors': errors,
+                                         'total_seconds': total,
+                                         'mean_ms': total / count * 1000 if count else 0.0,
+                                         'buckets': {str(bound): calls for bound, calls in zip(LATENCY_BUCKETS + ['+Inf'], buckets)}}
+            return {'operations': operations, 'bytes_written': dict(sorted(self.bytes_written.items()))}
+
+
+    def to_prometheus(self):
+        """ Returns:
+                str: The metrics in Prometheus' text exposition format. """
+        with self.lock:
+            lines = ['# HELP library_operation_seconds Time spent in each operation.',
+                     '# TYPE library_operation_seconds histogram']
+            for operation, (count, errors, total, buckets) in sorted(self.operations.items()):
+                cumulative = 0
+                for bound, calls in zip(LATENCY_BUCKETS + ['+Inf'], buckets):
+                    cumulative += calls
+                    lines.append(f'library_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+                lines.append(f'library_operation_seconds_sum{{operation="{operation}"}} {total}')
+                lines.append(f'library_operation_seconds_count{{operation="{operation}"}} {count}')
+
+            lines += ['# HELP library_operation_errors_total Calls of each operation that raised an error.',
+                      '# TYPE library_operation_errors_total counter']
+            for operation, (count, errors, total, buckets) in sorted(self.operations.items()):
+                lines.append(f'library_operation_errors_total{{operation="{operation}"}} {errors}')
+
+            lines += ['# HELP library_bytes_written_total Bytes written to disk.',
+                      '# TYPE library_bytes_written_total counter']
+            for target, count in sorted(self.bytes_written.items()):
+                lines.append(f'library_bytes_written_total{{target="{target}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+    def dump(self, file):
+        """ Writes the metrics to the file, in Prometheus' format if it ends in '.prom' or '.txt', otherwise as JSON. """
+        temporary_file = f'{file}.tmp'
+        with open(temporary_file, 'w') as save:
+            if str(file).endswith(('.prom', '.txt')):
+                save.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), save, indent=4)
+        os.replace(temporary_file, file)
+
+
+
+# the metrics of the whole program, or None when they're turned off.
+metrics = Metrics() if METRICS_FILE else None
+
+if metrics is not None:
+    atexit.register(lambda: metrics.dump(METRICS_FILE))
+
+
+
+def instrumented(operation: str):
+    """ Decorator that times every call of the function under the operation's name. Does nothing when metrics are off.
+
+        Returns:
+            function: The timed function (or the same function when metrics are off). """
+    def decorator(function):
+        if metrics is None:
+            return function
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                metrics.observe(operation, time.perf_counter() - start, failed)
+        return timed
+    return decorator
+
+
+def instrumented_class(prefix: str):
+    """ Class decorator that times every public method (and classmethod/staticmethod) the class defines, as '<prefix>.<method>'.
+        Methods inherited from a parent class are timed by the parent's decorator. Does nothing when metrics are off.
+
+        Returns:
+            function: The class decorator. """
+    def decorator(cls):
+        if metrics is None:
+            return cls
+
+        for name, attribute in list(vars(cls).items()):
+            if name.startswith('_'):
+                continue
+            operation = f'{prefix}.{name}'
+            if isinstance(attribute, (classmethod, staticmethod)):
+                setattr(cls, name, type(attribute)(instrumented(operation)(attribute.__func__)))
+            elif callable(attribute) and not isinstance(attribute, type):
+                setattr(cls, name, instrumented(operation)(attribute))
+        return cls
+    return decorator
+
+
+def record_bytes(target: str, count: int):
+    """ Counts bytes written to disk for the target (eg, 'journal'). Does nothing when metrics are off. """
+    if metrics is not None:
+        metrics.add_bytes(target, count)
+
+
+def dump_metrics(file=None):
+    """ Writes the metrics now instead of waiting for the program to exit.
+
+        Returns:
+            bool: True if they were written, False if metrics are off. """
+    if metrics is None:
+        return False
+    metrics.dump(file or METRICS_FILE)
+    return True
@@ -0,0 +1,178 @@
+""" This is where the write-ahead journal is handled. Instead of rewriting the whole json file on every change, each change is appended to a log file and only merged into the main file (checkpoint) once in a while. """
+
+from .instrumentation import instrumented_class, record_bytes
+from .codecs import get_codec, read_snapshot, write_snapshot
+import json
+import os
+
+
+# minimum number of journaled changes before everything is merged back into the main json file.
+# on top of that, the journal also has to be at least as big as the json file, so large imports don't rewrite a big file over and over.
+CHECKPOINT_EVERY = 500
+
+
+def apply_change(data, change: dict):
+    """ Applies a single journaled change to the data.
+        Changes are in the form of {'op': 'set'/'pop'/'extend', 'path': [dataset, name, ...], 'value': ...}.
+        'extend' adds the items in value to the list at the path (eg, an author's books), the ones already in it are skipped.
+
+        Returns:
+            None """
+    *parents, key = change['path']
+
+    # walks down to the parent of the changed item, creating missing levels along the way (eg, a new book in 'borrows').
+    target = data
+    for parent in parents:
+        target = target.setdefault(parent, {})
+
+    if change['op'] == 'set':
+        target[key] = change['value']
+    elif change['op'] == 'extend':
+        # a new list is put in its place instead of changing it, since undo records and observers may still hold the old one.
+        # items already in it are skipped, so replaying the same change twice is harmless.
+        current = target.get(key) or []
+        present = set(current)
+        target[key] = current + [item for item in change['value'] if item not in present]
+    elif change['op'] == 'pop':
+        # popping a missing key is ignored so replaying the same change twice is harmless.
+        target.pop(key, None)
+
+
+
+@instrumented_class('storage.journal')
+class Journal():
+    """ Journaled json storage. Changes are appended to '<file>.journal' and merged into the json file every once in a while. """
+    def __init__(self, file, checkpoint_every=CHECKPOINT_EVERY, codec=None):
+        self.file = file
+        self.path = f'{file}.journal'
+        self.checkpoint_every = checkpoint_every
+        # the snapshot's format (see data.codecs). If None, the format it was loaded in is kept.
+        self.codec = get_codec(codec) if codec is not None else None
+        self.pending = self._count_entries()
+        self.journal_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.snapshot_size = os.path.getsize(file) if os.path.exists(file) else 0
+
+
+    def _count_entries(self):
+        """ Counts the changes currently waiting in the journal.
+
+            Returns:
+                int: The number of journaled changes. """
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r') as log:
+            return sum(1 for line in log if line.strip())
+
+
+    def load(self):
+        """ Loads the json file, then replays the changes that haven't been merged into it yet.
+
+            Returns:
+                dict: The loaded datasets. """
+        data, loaded_codec = read_snapshot(self.file)
+        self.codec = self.codec or loaded_codec
+        self.pending = self.replay(data)
+
+        # another session may have appended to (or merged) the journal since it was opened here.
+        self.journal_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.snapshot_size = os.path.getsize(self.file)
+        return data
+
+
+    def save(self, changes: list[dict], data):
+        """ Saves the changes by appending them to the journal, checkpointing if it has grown too much. """
+        if not changes:
+            return
+        self.append(changes)
+        if self.needs_checkpoint():
+            self.checkpoint(data)
+
+
+    def append(self, changes: list[dict]):
+        """ Appends a compact record of each change at the end of the journal. Called while holding the storage's lock. """
+        records = ''.join(json.dumps(change, separators=(',', ':')) + '\n' for change in changes)
+        # the new records must start on their own line, not at the end of one a crash cut short.
+        self._trim_partial_line()
+        with open(self.path, 'a') as log:
+            log.write(records)
+            log.flush()
+            os.fsync(log.fileno())
+        self.pending += len(changes)
+        self.journal_size += len(records)
+        record_bytes('journal', len(records))
+
+
+    def replay(self, data):
+        """ Re-applies every change in the journal on top of the data loaded from the main json file.
+
+            Returns:
+                int: The number of changes replayed. """
+        if not os.path.exists(self.path):
+            return 0
+
+        replayed = 0
+        with open(self.path, 'r') as log:
+            for line in log:
+                if not line.strip():
+                    continue
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    # a half-written line means the program crashed mid-write, before its changes were saved. Only that line is skipped,
+                    # the changes saved after the crash come after it.
+                    continue
+                apply_change(data, change)
+                replayed += 1
+        return replayed
+
+
+    def _trim_partial_line(self):
+        """ Cuts a half-written last line (left by a crash mid-write) off the end of the journal. """
+        try:
+            log = open(self.path, 'r+b')
+        except FileNotFoundError:
+            return
+        with log:
+            end = log.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            log.seek(end - 1)
+            if log.read(1) == b'\n':
+                return
+
+            # looks for the end of the last whole line, going back a block at a time.
+            position = end
+            while position > 0:
+                start = max(position - 65536, 0)
+                log.seek(start)
+                newline = log.read(position - start).rfind(b'\n')
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            log.truncate(position)
+            log.flush()
+            os.fsync(log.fileno())
+        self.journal_size = position
+
+
+    def needs_checkpoint(self):
+        """ Checks if the journal has grown enough to be merged back into the main json file.
+
+            Returns:
+                bool: True if a checkpoint is due, otherwise False. """
+        return self.pending >= self.checkpoint_every and self.journal_size >= self.snapshot_size
+
+
+    def checkpoint(self, data):
+        """ Writes the whole data into the main json file and empties the journal. """
+        # the snapshot is written to a temporary file first so a crash never leaves a half-written json file.
+        # write_snapshot only returns once the new snapshot is synced to disk.
+        write_snapshot(self.file, data, self.codec or get_codec())
+
+        # only truncated after the snapshot is safe on disk. If it crashes in between, replaying the journal again is harmless.
+        open(self.path, 'w').close()
+        self.pending = 0
+        self.journal_size = 0
+        self.snapshot_size = os.path.getsize(self.file)
+        record_bytes('snapshot', self.snapshot_size)
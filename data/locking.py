@@ -0,0 +1,150 @@
+""" This is where locking is handled. File locks keep several programs running on the same storage from overwriting each other's changes,
+    and reader/writer locks keep several threads sharing the same loaded data from seeing (or making) half-done changes. """
+
+from contextlib import contextmanager
+import functools
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # advisory locks are only available on unix-like systems. Elsewhere saving simply isn't locked.
+    fcntl = None
+
+
+
+class StorageConflictError(Exception):
+    """ Raised when a change can't be saved because another program changed the same record first. """
+    def __init__(self, records: list):
+        names = ', '.join('/'.join(str(key) for key in record) for record in records)
+        super().__init__(f'Changes were rejected, another session already changed: {names}. Please try again.')
+
+
+
+class FileLock():
+    """ Exclusive advisory lock on '<file>.lock', used as 'with FileLock(file):'. Other sessions wait until it's released. """
+    def __init__(self, file):
+        self.path = f'{str(file).rstrip(os.sep)}.lock'
+        self.handle = None
+        self.depth = 0
+
+
+    def __enter__(self):
+        # the same session can take the lock again while already holding it.
+        self.depth += 1
+        if self.depth == 1:
+            self.handle = open(self.path, 'a')
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        return False
+
+
+
+class ReadWriteLock():
+    """ Lets any number of threads read at the same time, or a single thread write. Used as 'with lock.reading():' or 'with lock.writing():'.
+        Waiting writers go first, so a steady stream of lookups can't keep a borrow waiting forever. A thread already holding the lock can take it again
+        (eg, a write calling a read), but a reading thread can't start writing. """
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = None
+        self.waiting_writers = 0
+
+        # how many times the current thread took the lock for reading and for writing.
+        self.held = threading.local()
+
+
+    def _held(self):
+        if not hasattr(self.held, 'reads'):
+            self.held.reads = 0
+            self.held.writes = 0
+        return self.held
+
+
+    @contextmanager
+    def reading(self):
+        held = self._held()
+        # the thread already holds the lock, taking it again must not wait (for writers in line, or for itself).
+        if held.reads or held.writes:
+            held.reads += 1
+            try:
+                yield self
+            finally:
+                held.reads -= 1
+            return
+
+        with self.condition:
+            while self.writer is not None or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        held.reads += 1
+        try:
+            yield self
+        finally:
+            held.reads -= 1
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+
+    @contextmanager
+    def writing(self):
+        held = self._held()
+        if held.writes:
+            held.writes += 1
+            try:
+                yield self
+            finally:
+                held.writes -= 1
+            return
+        if held.reads:
+            # would wait forever for itself to stop reading.
+            raise RuntimeError('A thread reading the data cannot start writing to it.')
+
+        with self.condition:
+            self.waiting_writers += 1
+            try:
+                while self.writer is not None or self.readers:
+                    self.condition.wait()
+            finally:
+                self.waiting_writers -= 1
+            self.writer = threading.get_ident()
+        held.writes += 1
+        try:
+            yield self
+        finally:
+            held.writes -= 1
+            with self.condition:
+                self.writer = None
+                self.condition.notify_all()
+
+
+
+def read_locked(method):
+    """ Runs the method while holding its object's repository lock for reading. """
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.repository.lock.reading():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def write_locked(method):
+    """ Runs the method while holding its object's repository for writing (see Repository.writing), so it checks and changes the latest data. """
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.repository.writing():
+            return method(self, *args, **kwargs)
+    return locked
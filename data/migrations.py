@@ -0,0 +1,339 @@
+""" This is where the stored data is migrated from older formats. The format's version is stamped in 'meta' as 'schema_version', and every
+    migration step newer than it is applied, in order, one record at a time.
+
+    Usage: python -m data.migrations data/storage.json [--backend journal] [--dry-run]
+
+    Plain json files are streamed: records are read, migrated, and written out one by one, so even very large files are never fully
+    loaded (let alone copied) in memory. Other backends (sqlite, sharded) and binary snapshots are migrated through the storage,
+    rewriting only the changed records. """
+
+from model import Borrow, DATE_FIELDS, NO_DATE, to_timestamp
+from .journal import Journal, apply_change
+from .locking import FileLock
+from .codecs import is_binary, sync_directory
+from .storage import RECORD_DEPTH, open_storage
+import argparse
+import inspect
+import json
+import os
+import re
+
+
+SCHEMA_VERSION_KEY = 'schema_version'
+
+# how much of the file is read at a time while streaming.
+CHUNK_SIZE = 1 << 16
+WHITESPACE = re.compile(r'[ \t\r\n]*')
+
+
+
+class Migration():
+    def __init__(self, version: int, description: str, upgrade):
+        self.version = version
+        self.description = description
+        # upgrade(dataset, keys, record) gives the record in the new format. Must not change records already in it.
+        self.upgrade = upgrade
+
+
+
+def _dates_to_timestamps(dataset: str, keys: tuple, record):
+    """ Borrow dates were stored as display text (eg, 'Sunday, October 18, 2026'), they're now timestamps. """
+    if dataset != 'borrows' or not isinstance(record, dict):
+        return record
+
+    migrated = dict(record)
+    for field in DATE_FIELDS:
+        if field in migrated:
+            try:
+                timestamp = to_timestamp(migrated[field])
+            except ValueError:
+                # left as it is, it's shown as it was and can still be fixed with update_borrow.
+                continue
+            migrated[field] = NO_DATE if timestamp is None else timestamp
+    return migrated
+
+
+# the defaults of every borrow field, taken from the Borrow blueprint.
+BORROW_DEFAULTS = {name: parameter.default for name, parameter in inspect.signature(Borrow.__init__).parameters.items()
+                   if parameter.default is not inspect.Parameter.empty}
+
+
+def _normalize_records(dataset: str, keys: tuple, record):
+    """ Fills in missing borrow fields, turns availability saved as text into booleans, and missing borrow lists into empty ones. """
+    if not isinstance(record, dict):
+        return record
+
+    if dataset == 'borrows':
+        # missing (or empty, eg, from sqlite) fields get the blueprint's default.
+        return {**{field: BORROW_DEFAULTS.get(field, NO_DATE) for field in Borrow.FIELDS}, **{field: value for field, value in record.items() if value is not None}}
+    if dataset == 'library' and isinstance(record.get('is_available'), str):
+        return {**record, 'is_available': record['is_available'].strip().lower() in ('true', 'yes', '1')}
+    if dataset == 'accounts' and record.get('borrowed_books') is None:
+        return {**record, 'borrowed_books': []}
+    return record
+
+
+def _count_times_borrowed(dataset: str, keys: tuple, record):
+    """ Borrow records now keep how many times the user borrowed the book. Older records only kept the last time, so they count as one. """
+    if dataset != 'borrows' or not isinstance(record, dict) or record.get('times_borrowed') is not None:
+        return record
+    return {**record, 'times_borrowed': 1}
+
+
+def _drop_written_books(dataset: str, keys: tuple, record):
+    """ Authors kept a list of their books, which went stale as books were removed or changed authors. It's looked up from the library now. """
+    if dataset != 'authors' or not isinstance(record, dict) or 'books' not in record:
+        return record
+    return {field: value for field, value in record.items() if field != 'books'}
+
+
+# every migration, oldest first. Data without a schema_version is at version 0.
+MIGRATIONS = [Migration(1, 'Store borrow dates as timestamps', _dates_to_timestamps),
+              Migration(2, 'Complete borrow records and normalize availability and borrow lists', _normalize_records),
+              Migration(3, 'Count how many times each borrow record was borrowed', _count_times_borrowed),
+              Migration(4, "Look authors' books up from the library instead of keeping a list", _drop_written_books)]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+
+def pending_migrations(version: int):
+    """ Returns:
+            list: The migrations newer than the version, oldest first. """
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def _upgrade(migrations: list, dataset: str, keys: tuple, record):
+    for migration in migrations:
+        record = migration.upgrade(dataset, keys, record)
+    return record
+
+
+
+class _JsonStream():
+    """ Reads a json file piece by piece. Only the value being read (eg, a single record) is ever decoded at once. """
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ''
+        self.position = 0
+        self.finished = False
+        self.decoder = json.JSONDecoder()
+
+
+    def _read_more(self):
+        # drops what was already read so the buffer stays small.
+        chunk = self.file.read(CHUNK_SIZE)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        if not chunk:
+            self.finished = True
+
+
+    def peek(self):
+        """ Returns:
+                str: The next character that isn't whitespace, or '' at the end of the file. """
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or self.finished:
+                return self.buffer[self.position:self.position + 1]
+            self._read_more()
+
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise ValueError(f"Expected '{character}' in the json file, found '{self.peek()}'.")
+        self.position += 1
+
+
+    def value(self):
+        """ Returns:
+                obj: The next json value (eg, a key or a whole record). """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number right at the end of the buffer may continue in the next chunk.
+                if end < len(self.buffer) or self.finished:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.finished:
+                    raise
+            self._read_more()
+
+
+    def members(self):
+        """ Goes through the members of the json object that comes next. The caller has to read (or skip) each member's value.
+
+            Returns:
+                generator: Each member's key. """
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect('}')
+            return
+
+
+
+def _read_meta(file):
+    """ Reads the 'meta' dataset of a json file, going through the other datasets one record at a time (migrated files have meta first).
+
+        Returns:
+            dict: The meta dataset, empty if there's none. """
+    with open(file, 'r') as f:
+        stream = _JsonStream(f)
+        for dataset in stream.members():
+            if dataset == 'meta':
+                meta = stream.value()
+                return meta if isinstance(meta, dict) else {}
+            if stream.peek() == '{':
+                for name in stream.members():
+                    stream.value()
+            else:
+                stream.value()
+    return {}
+
+
+def _stamp(meta: dict):
+    """ Returns:
+            dict: The meta dataset at the latest schema version, with its data version bumped so running sessions reload it. """
+    return {**meta, SCHEMA_VERSION_KEY: LATEST_VERSION, 'version': meta.get('version', 0) + 1}
+
+
+def _write_member(output, key, value, first: bool):
+    output.write(('' if first else ',') + json.dumps(key) + ':' + json.dumps(value, separators=(',', ':')))
+
+
+def migrate_json_file(file, dry_run=False):
+    """ Migrates a json storage file to the latest version by streaming it into a new file, which then replaces the old one.
+        Changes still waiting in its journal are merged into the file first.
+
+        Returns:
+            dict: The version before and after, the migrations applied, and how many records were changed. """
+    journal = Journal(file)
+    if journal.pending and not dry_run:
+        journal.checkpoint(journal.load())
+
+    meta = _read_meta(file)
+    version = meta.get(SCHEMA_VERSION_KEY, 0)
+    migrations = pending_migrations(version)
+    report = {'from': version, 'to': LATEST_VERSION if migrations else version,
+              'applied': [migration.description for migration in migrations], 'changed': 0}
+    if not migrations:
+        return report
+
+    temporary_file = f'{file}.migrating'
+    with open(file, 'r') as f, open(temporary_file, 'w') as output:
+        stream = _JsonStream(f)
+
+        # meta goes first, so the version is found right away the next time.
+        output.write('{"meta":' + json.dumps(_stamp(meta), separators=(',', ':')))
+
+        for dataset in stream.members():
+            if dataset == 'meta':
+                stream.value()
+                continue
+            output.write(',' + json.dumps(dataset) + ':')
+
+            if stream.peek() != '{':
+                output.write(json.dumps(stream.value(), separators=(',', ':')))
+                continue
+
+            output.write('{')
+            for number, name in enumerate(stream.members()):
+                record = stream.value()
+                if RECORD_DEPTH.get(dataset, 1) == 2 and isinstance(record, dict):
+                    # borrows are grouped by book, each borrower's record is migrated on its own.
+                    migrated = {borrower: _upgrade(migrations, dataset, (name, borrower), info) for borrower, info in record.items()}
+                    report['changed'] += sum(migrated[borrower] != info for borrower, info in record.items())
+                else:
+                    migrated = _upgrade(migrations, dataset, (name,), record)
+                    report['changed'] += migrated != record
+                _write_member(output, name, migrated, number == 0)
+            output.write('}')
+        output.write('}')
+        output.flush()
+        os.fsync(output.fileno())
+
+    if dry_run:
+        os.remove(temporary_file)
+    else:
+        os.replace(temporary_file, file)
+        sync_directory(file)
+    return report
+
+
+def migrate_storage(file, backend='journal', dry_run=False):
+    """ Migrates a storage that isn't a plain json file (sqlite, sharded) to the latest version, rewriting only the records that changed.
+
+        Returns:
+            dict: The version before and after, the migrations applied, and how many records were changed. """
+    storage = open_storage(file, backend)
+    data = storage.load()
+    version = data.get('meta', {}).get(SCHEMA_VERSION_KEY, 0)
+    migrations = pending_migrations(version)
+    report = {'from': version, 'to': LATEST_VERSION if migrations else version,
+              'applied': [migration.description for migration in migrations], 'changed': 0}
+    if not migrations:
+        return report
+
+    changes = []
+    for dataset, records in data.items():
+        if dataset == 'meta' or not isinstance(records, dict):
+            continue
+        for name, record in records.items():
+            if RECORD_DEPTH.get(dataset, 1) == 2 and isinstance(record, dict):
+                for borrower, info in record.items():
+                    migrated = _upgrade(migrations, dataset, (name, borrower), info)
+                    if migrated != info:
+                        changes.append({'op': 'set', 'path': [dataset, name, borrower], 'value': migrated})
+            else:
+                migrated = _upgrade(migrations, dataset, (name,), record)
+                if migrated != record:
+                    changes.append({'op': 'set', 'path': [dataset, name], 'value': migrated})
+    report['changed'] = len(changes)
+
+    if not dry_run:
+        for key, value in _stamp(data.get('meta', {})).items():
+            changes.append({'op': 'set', 'path': ['meta', key], 'value': value})
+        for change in changes:
+            apply_change(data, change)
+        storage.save(changes, data)
+    return report
+
+
+def migrate(file, backend='journal', dry_run=False):
+    """ Migrates the storage to the latest version, while holding its lock so no session saves in the middle of it.
+
+        Returns:
+            dict: The version before and after, the migrations applied, and how many records were changed. """
+    with FileLock(file):
+        if backend in ('journal', 'json') and os.path.isfile(file) and not str(file).endswith(('.db', '.sqlite')) and not is_binary(file):
+            return migrate_json_file(file, dry_run)
+        return migrate_storage(file, backend, dry_run)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrates the stored data to the latest format.')
+    parser.add_argument('file')
+    parser.add_argument('--backend', default='journal', choices=['json', 'journal', 'sqlite', 'sharded'])
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be migrated")
+    arguments = parser.parse_args()
+
+    report = migrate(arguments.file, arguments.backend, arguments.dry_run)
+    if not report['applied']:
+        print(f"Already up to date (version {report['from']}).")
+    else:
+        print(f"{'Would migrate' if arguments.dry_run else 'Migrated'} from version {report['from']} to {report['to']}, "
+              f"{report['changed']:,} records changed:")
+        for description in report['applied']:
+            print(f'- {description}')
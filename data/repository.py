@@ -0,0 +1,279 @@
+""" This is where the loaded data is shared. Every service in the same process borrows one repository per storage file instead of loading the file again for every command. """
+
+from .storage import Create, Update, Delete, open_storage
+from .indexes import IndexManager
+from .journal import apply_change
+from .instrumentation import instrumented_class
+from .locking import FileLock, ReadWriteLock, StorageConflictError
+from contextlib import contextmanager
+import os
+
+
+# one repository per (file, backend) for the whole process.
+_repositories = {}
+
+
+
+def get_repository(file='data/storage.json', backend='journal'):
+    """ Gets the shared repository for the storage file, loading it only the first time.
+
+        Returns:
+            Repository: The shared repository for the file. """
+    key = (os.path.abspath(file), backend)
+    if key not in _repositories:
+        _repositories[key] = Repository(file, backend)
+    return _repositories[key]
+
+
+
+@instrumented_class('repository')
+class Repository():
+    def __init__(self, file, backend='journal'):
+        self.file = file
+        self.storage = open_storage(file, backend)
+
+        # lazy storages (eg, sharded) give datasets that are only read when first used.
+        self.data = self.storage.load() if getattr(self.storage, 'lazy', False) else {}
+
+        # signature of the files on disk (modification time and size) the last time they were loaded or saved.
+        self.disk_version = None
+
+        # only one session at a time can save to the storage.
+        self.file_lock = FileLock(file)
+
+        # threads sharing the data read it together, but change it one at a time (see read_locked and write_locked).
+        self.lock = ReadWriteLock()
+
+        # what each record changed since the last save looked like before it was changed. Used to detect
+        # if another session changed the same record in the meantime.
+        self.pending_bases = {}
+
+        # kept up to date on every change made through the handlers, and rebuilt whenever the data is reloaded.
+        self.indexes = IndexManager(self.data)
+        self.observers = [self.indexes, self]
+
+        # other observers attached by name (eg, the search index from the services), so each is only built once.
+        self.extensions = {}
+
+        # the data handlers save through the repository so it knows which changes on disk were its own.
+        self.create = Create(self.data, self.file, self, self.observers)
+        self.update = Update(self.data, self.file, self, self.observers)
+        self.delete = Delete(self.data, self.file, self, self.observers)
+
+        self.refresh()
+
+
+    def attach(self, name: str, factory):
+        """ Attaches an observer built from the data by factory(data), unless one was already attached under that name.
+            It gets on_change(dataset, keys, old, new) for every change and rebuild(data) on every reload.
+
+            Returns:
+                obj: The attached observer. """
+        if name not in self.extensions:
+            observer = factory(self.data)
+            self.extensions[name] = observer
+            self.observers.append(observer)
+        return self.extensions[name]
+
+
+    def _watched_files(self):
+        """ Gets the files whose changes mean the data has to be reloaded.
+
+            Returns:
+                list: The paths of the storage file and its journal. """
+        return [self.file, f'{self.file}.journal']
+
+
+    def _read_disk_version(self):
+        """ Reads the modification time and size of the storage files.
+
+            Returns:
+                tuple: The signature of the files currently on disk. """
+        version = []
+        for path in self._watched_files():
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+
+    def refresh(self):
+        """ Reloads the data, but only if the storage files were changed on disk by something else.
+
+            Returns:
+                bool: True if the data was reloaded, otherwise False. """
+        if getattr(self.storage, 'lazy', False):
+            # only the datasets that were already loaded (and changed on disk) are reloaded.
+            with self.lock.writing():
+                reloaded = self.data.refresh()
+                if reloaded:
+                    for observer in self.observers:
+                        observer.rebuild(self.data)
+            return reloaded
+
+        disk_version = self._read_disk_version()
+        if disk_version == self.disk_version:
+            return False
+
+        with self.lock.writing():
+            # another thread may have reloaded it while this one was waiting.
+            disk_version = self._read_disk_version()
+            if disk_version == self.disk_version:
+                return False
+            self._reload(disk_version)
+        return True
+
+
+    def _reload(self, disk_version):
+        """ Replaces the data with what's on disk. """
+        loaded = self.storage.load()
+
+        # reloads each dataset in place, so everything holding a reference to 'accounts', 'library', etc. stays in sync.
+        for dataset, records in loaded.items():
+            if isinstance(self.data.get(dataset), dict) and isinstance(records, dict):
+                self.data[dataset].clear()
+                self.data[dataset].update(records)
+            else:
+                self.data[dataset] = records
+        for dataset in set(self.data) - set(loaded):
+            del self.data[dataset]
+
+        for observer in self.observers:
+            observer.rebuild(self.data)
+
+        self.disk_version = disk_version
+
+
+    @contextmanager
+    def writing(self):
+        """ Holds the data for writing, along with the storage's lock so no other session can save in the meantime. Use as 'with repository.writing():'.
+            What other sessions saved is loaded first, so the changes made inside are checked against the latest data, not an old copy. """
+        with self.lock.writing(), self.file_lock:
+            self.refresh()
+            yield self
+
+
+    def on_change(self, dataset: str, keys: tuple, old, new):
+        """ Remembers what the record looked like before its first change since the last save. """
+        record = (dataset,) + tuple(keys)
+        if record not in self.pending_bases:
+            self.pending_bases[record] = old
+        elif self.pending_bases[record] == new:
+            # changed back to how it was (eg, a rollback), so there's nothing to save or check for it anymore.
+            del self.pending_bases[record]
+
+
+    def rebuild(self, data):
+        self.pending_bases = {}
+
+
+    def load(self):
+        """ Same as the storage's load(). Kept so the repository can stand in for the storage.
+
+            Returns:
+                dict: The loaded datasets. """
+        return self.storage.load()
+
+
+    def _changed_on_disk(self):
+        """ Returns:
+                bool: True if another session saved to the storage since it was last loaded or saved here, otherwise False. """
+        if getattr(self.storage, 'lazy', False):
+            return any(self.storage.dataset_version(dataset) != self.data.versions.get(dataset) for dataset in dict.keys(self.data))
+        return self._read_disk_version() != self.disk_version
+
+
+    def _merge_with_disk(self):
+        """ Loads what another session saved and puts this session's changed records on top of it.
+            If the other session changed one of the same records, nothing is merged and StorageConflictError is raised. """
+        if getattr(self.storage, 'lazy', False):
+            # lazy storages reload (or read again when used) only what changed on disk, so this session's changes are taken out
+            # first, otherwise they'd be left in the datasets that weren't reloaded.
+            changed = {record: _lookup(self.data, record) for record in self.pending_bases}
+            for record, base in self.pending_bases.items():
+                _put(self.data, record, base)
+            self.data.refresh()
+            fresh = self.data
+        else:
+            fresh = self.storage.load()
+            changed = {record: _lookup(self.data, record) for record in self.pending_bases}
+
+        # the other session changed the files, but not the data (eg, it only merged its journal).
+        if not getattr(self.storage, 'lazy', False) and _lookup(fresh, ('meta', 'version')) == _lookup(self.data, ('meta', 'version')):
+            conflicts = []
+        else:
+            conflicts = [record for record, base in self.pending_bases.items() if _lookup(fresh, record) != base]
+
+        if not conflicts:
+            for record, value in changed.items():
+                _put(fresh, record, value)
+
+        # either way, the session continues with what's on disk (plus its own changes if they were kept).
+        if fresh is not self.data:
+            for dataset, records in fresh.items():
+                if isinstance(dict.get(self.data, dataset), dict) and isinstance(records, dict):
+                    self.data[dataset].clear()
+                    self.data[dataset].update(records)
+                else:
+                    self.data[dataset] = records
+        for observer in self.observers:
+            observer.rebuild(self.data)
+
+        if conflicts:
+            self._mark_saved()
+            raise StorageConflictError(conflicts)
+
+
+    def _mark_saved(self):
+        """ Remembers the files' current signature so they aren't reloaded for nothing. """
+        if getattr(self.storage, 'lazy', False):
+            self.data.mark_saved()
+        else:
+            self.disk_version = self._read_disk_version()
+        self.indexes.mark_saved()
+
+
+    def save(self, changes: list[dict], data):
+        """ Saves the changes through the storage while holding the storage's lock. If another session saved in the meantime,
+            its changes are merged in first (or this session's changes are rejected if they touch the same records).
+            Changes made inside writing() never need merging, since nothing else could save after they were checked. """
+        if not changes:
+            return
+
+        with self.lock.writing(), self.file_lock:
+            if self._changed_on_disk():
+                self._merge_with_disk()
+
+            # every save bumps the data's version, so other sessions can tell it changed.
+            version_change = {'op': 'set', 'path': ['meta', 'version'], 'value': (_lookup(self.data, ('meta', 'version')) or 0) + 1}
+            apply_change(self.data, version_change)
+
+            self.storage.save(changes + [version_change], self.data)
+            self._mark_saved()
+        self.pending_bases = {}
+
+
+
+def _lookup(data, keys: tuple):
+    """ Returns:
+            obj: What's found at the keys (eg, ('borrows', title, borrower)), or None. """
+    target = data
+    for key in keys:
+        if not isinstance(target, dict) or key not in target:
+            return None
+        target = target[key]
+    return target
+
+
+def _put(data, keys: tuple, value):
+    """ Puts the value at the keys, or removes what's there if value is None. """
+    *parents, last = keys
+    target = data
+    for key in parents:
+        target = target.setdefault(key, {})
+    if value is None:
+        target.pop(last, None)
+    else:
+        target[last] = value
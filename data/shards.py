@@ -0,0 +1,285 @@
+""" This is where the sharded storage is handled. Each dataset is kept in its own file(s) inside a directory, only loaded when first used, and only the files that changed are rewritten. """
+
+from .instrumentation import instrumented_class, record_bytes
+from .codecs import sync_directory
+import json
+import os
+import threading
+import zlib
+
+
+DATASETS = ['accounts', 'authors', 'library', 'borrows', 'holds', 'meta']
+
+
+
+def shard_of(name: str, shard_count: int):
+    """ Picks the shard a record belongs to. Uses crc32 since python's hash() changes between runs.
+
+        Returns:
+            int: The shard number. """
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(str(name).encode('utf-8')) % shard_count
+
+
+def _write_json(path: str, content):
+    # written to a temporary file first so a crash never leaves a half-written shard.
+    temporary_file = f'{path}.tmp'
+    with open(temporary_file, 'w') as save:
+        json.dump(content, save, separators=(',', ':'))
+        record_bytes('shards', save.tell())
+        save.flush()
+        os.fsync(save.fileno())
+    os.replace(temporary_file, path)
+    sync_directory(path)
+
+
+
+@instrumented_class('storage.sharded')
+class ShardedStorage():
+    """ Sharded storage. The directory holds a manifest plus '<dataset>.json', or '<dataset>/<shard>.json' when a dataset is split into several shards. """
+    lazy = True
+
+    def __init__(self, directory, shards=None):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.shards = json.load(f)['shards']
+        else:
+            # new storage: every dataset starts empty, split into the requested number of shards (1 by default).
+            os.makedirs(directory, exist_ok=True)
+            self.shards = {dataset: (shards or {}).get(dataset, 1) for dataset in DATASETS}
+            for dataset in DATASETS:
+                self._write_dataset(dataset, {})
+            _write_json(self.manifest_path, {'shards': self.shards})
+
+        # names of the records in each shard, so a shard can be rewritten without going through the whole dataset.
+        self.members = {}
+
+
+    def _shard_path(self, dataset: str, shard: int):
+        if self.shards.get(dataset, 1) <= 1:
+            return os.path.join(self.directory, f'{dataset}.json')
+        return os.path.join(self.directory, dataset, f'{shard}.json')
+
+
+    def _shard_paths(self, dataset: str):
+        return [self._shard_path(dataset, shard) for shard in range(self.shards.get(dataset, 1))]
+
+
+    def _write_dataset(self, dataset: str, records: dict):
+        """ Writes every shard of the dataset. """
+        shard_count = self.shards.get(dataset, 1)
+        if shard_count > 1:
+            os.makedirs(os.path.join(self.directory, dataset), exist_ok=True)
+
+        contents = [{} for shard in range(shard_count)]
+        for name, record in records.items():
+            contents[shard_of(name, shard_count)][name] = record
+        for shard, content in enumerate(contents):
+            _write_json(self._shard_path(dataset, shard), content)
+
+
+    def dataset_version(self, dataset: str):
+        """ Reads the modification time and size of the dataset's shard files.
+
+            Returns:
+                tuple: The signature of the dataset's files currently on disk. """
+        version = []
+        for path in self._shard_paths(dataset):
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+
+    def load_dataset(self, dataset: str):
+        """ Loads every shard of a single dataset.
+
+            Returns:
+                dict: The records of the dataset. """
+        records = {}
+        members = []
+        for path in self._shard_paths(dataset):
+            try:
+                with open(path, 'r') as f:
+                    shard = json.load(f)
+            except FileNotFoundError:
+                shard = {}
+            records.update(shard)
+            members.append(set(shard))
+        self.members[dataset] = members
+        return records
+
+
+    def load(self):
+        """ Gets the datasets without reading anything yet. Each dataset is loaded the first time it's used.
+
+            Returns:
+                LazyDatasets: The datasets. """
+        return LazyDatasets(self)
+
+
+    def save(self, changes: list[dict], data):
+        """ Rewrites only the shards that hold a changed record. """
+        dirty = {}
+        for change in changes:
+            dataset, *keys = change['path']
+
+            # a dataset that didn't exist yet gets a single shard (unless another session already added it).
+            if dataset not in self.shards:
+                with open(self.manifest_path, 'r') as f:
+                    self.shards.update(json.load(f)['shards'])
+            if dataset not in self.shards:
+                self.shards[dataset] = 1
+                _write_json(self.manifest_path, {'shards': self.shards})
+            shard_count = self.shards[dataset]
+            records = data[dataset]
+            members = self.members.setdefault(dataset, [set() for shard in range(shard_count)])
+
+            # a change to a whole dataset touches all of its shards.
+            if not keys:
+                dirty.setdefault(dataset, set()).update(range(shard_count))
+                for shard in range(shard_count):
+                    members[shard] = {name for name in records if shard_of(name, shard_count) == shard}
+                continue
+
+            shard = shard_of(keys[0], shard_count)
+            dirty.setdefault(dataset, set()).add(shard)
+            if keys[0] in records:
+                members[shard].add(keys[0])
+            else:
+                members[shard].discard(keys[0])
+
+        for dataset, shards in dirty.items():
+            if self.shards.get(dataset, 1) > 1:
+                os.makedirs(os.path.join(self.directory, dataset), exist_ok=True)
+            records = data[dataset]
+            for shard in shards:
+                _write_json(self._shard_path(dataset, shard), {name: records[name] for name in self.members[dataset][shard] if name in records})
+
+
+
+class LazyDatasets(dict):
+    """ The usual datasets dict, except each dataset is only read from its shards the first time it's used. """
+    def __init__(self, storage: ShardedStorage):
+        super().__init__()
+        self.storage = storage
+        # signature of each loaded dataset's files when it was last loaded or saved.
+        self.versions = {}
+
+        # several readers may use a dataset for the first time at once, only the first one loads it.
+        self.load_lock = threading.Lock()
+
+
+    def _load(self, dataset: str):
+        with self.load_lock:
+            if dict.__contains__(self, dataset):
+                return dict.__getitem__(self, dataset)
+            self.versions[dataset] = self.storage.dataset_version(dataset)
+            records = self.storage.load_dataset(dataset)
+            dict.__setitem__(self, dataset, records)
+            return records
+
+
+    def _load_all(self):
+        for dataset in self.storage.shards:
+            if not dict.__contains__(self, dataset):
+                self._load(dataset)
+
+
+    def __missing__(self, dataset):
+        if dataset in self.storage.shards:
+            return self._load(dataset)
+        raise KeyError(dataset)
+
+
+    def get(self, dataset, default=None):
+        if dict.__contains__(self, dataset) or dataset in self.storage.shards:
+            return self[dataset]
+        return default
+
+
+    def __contains__(self, dataset):
+        return dict.__contains__(self, dataset) or dataset in self.storage.shards
+
+
+    def setdefault(self, dataset, default=None):
+        if dataset in self:
+            return self[dataset]
+        dict.__setitem__(self, dataset, default)
+        return default
+
+
+    # anything that goes through every dataset loads them all first.
+    def keys(self):
+        self._load_all()
+        return super().keys()
+
+    def values(self):
+        self._load_all()
+        return super().values()
+
+    def items(self):
+        self._load_all()
+        return super().items()
+
+    def __iter__(self):
+        self._load_all()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load_all()
+        return super().__len__()
+
+
+    def refresh(self):
+        """ Reloads (in place) the loaded datasets whose files were changed on disk by something else. Datasets not loaded yet are left alone.
+
+            Returns:
+                bool: True if anything was reloaded, otherwise False. """
+        reloaded = False
+        for dataset in list(dict.keys(self)):
+            version = self.storage.dataset_version(dataset)
+            if version == self.versions.get(dataset):
+                continue
+            records = dict.__getitem__(self, dataset)
+            records.clear()
+            records.update(self.storage.load_dataset(dataset))
+            self.versions[dataset] = version
+            reloaded = True
+        return reloaded
+
+
+    def mark_saved(self):
+        """ Remembers the new signature of the loaded datasets after saving, so they aren't reloaded for nothing. """
+        for dataset in dict.keys(self):
+            self.versions[dataset] = self.storage.dataset_version(dataset)
+
+
+
+def split_storage(json_file, directory, shards=None):
+    """ One-shot split of an existing storage.json (including its unmerged journal) into a sharded storage directory.
+        shards sets how many shards each dataset gets, eg {'borrows': 16}.
+
+        Returns:
+            ShardedStorage: The new sharded storage. """
+    from .journal import Journal
+
+    data = Journal(json_file).load()
+    storage = ShardedStorage(directory, shards)
+    for dataset in DATASETS:
+        storage._write_dataset(dataset, data.get(dataset, {}))
+    return storage
+
+
+
+if __name__ == '__main__':
+    # usage: python -m data.shards data/storage.json data/storage borrows=16 library=4
+    import sys
+    shard_counts = {dataset: int(count) for dataset, count in (argument.split('=') for argument in sys.argv[3:])}
+    split_storage(sys.argv[1], sys.argv[2], shard_counts)
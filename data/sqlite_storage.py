@@ -0,0 +1,461 @@
+""" This is where the SQLite storage backend is handled. Each dataset gets its own table, and only the rows touched by a change are written.
+
+    Nothing is loaded up front: a record is read (by its primary key) the first time it's looked up, and the secondary lookups
+    (eg, the username of an email, the borrowers of a book) are answered by the tables' indexes instead of an index kept in memory.
+    Only what goes through a whole dataset (eg, building the search index) reads the whole table. """
+
+from .instrumentation import instrumented_class
+import sqlite3
+import json
+import threading
+
+
+# table layout for each dataset: (table name, primary key columns, other columns)
+TABLES = {'accounts': ('accounts', ['username'], ['email', 'age', 'id', 'role', 'borrow_count', 'borrowed_books']),
+          'authors': ('authors', ['name'], ['age', 'birthday', 'nationality']),
+          'library': ('library', ['title'], ['author', 'quantity', 'date_published', 'genre', 'age_restriction', 'is_available']),
+          'borrows': ('borrows', ['book_title', 'borrower'], ['borrowed_on', 'borrow_deadline', 'returned_on', 'user_status', 'times_borrowed']),
+          'holds': ('holds', ['book_title', 'held_by'], ['placed_on']),
+          'meta': ('meta', ['key'], ['value'])}
+
+# datasets that hold plain values instead of records (eg, meta's counters), stored as json text in their 'value' column.
+SCALAR_DATASETS = ['meta']
+
+# columns that hold lists are stored as json text, booleans come back from sqlite as 0/1.
+LIST_COLUMNS = ['borrowed_books']
+BOOL_COLUMNS = ['is_available']
+
+# stands for a record that isn't in the database (None can't be used, since a value in 'meta' could be None).
+_MISSING = object()
+
+# columns are left untyped on purpose so values like age='unknown' are kept as they are.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (username TEXT PRIMARY KEY, email, age, id UNIQUE, role, borrow_count, borrowed_books);
+CREATE TABLE IF NOT EXISTS authors (name TEXT PRIMARY KEY, age, birthday, nationality);
+CREATE TABLE IF NOT EXISTS library (title TEXT PRIMARY KEY, author, quantity, date_published, genre, age_restriction, is_available);
+CREATE TABLE IF NOT EXISTS borrows (book_title TEXT, borrower TEXT, borrowed_on, borrow_deadline, returned_on, user_status, times_borrowed,
+                                    PRIMARY KEY (book_title, borrower));
+CREATE TABLE IF NOT EXISTS holds (book_title TEXT, held_by TEXT, placed_on, PRIMARY KEY (book_title, held_by));
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE INDEX IF NOT EXISTS accounts_email ON accounts (email);
+CREATE INDEX IF NOT EXISTS library_author ON library (author);
+CREATE INDEX IF NOT EXISTS borrows_borrower ON borrows (borrower);
+"""
+
+# secondary lookups answered through the tables' indexes: name -> (table, column returned, column looked up)
+LOOKUPS = {'username_of_email': ('accounts', 'username', 'email'),
+           'books_of': ('library', 'title', 'author'),
+           'borrowers_of': ('borrows', 'borrower', 'book_title'),
+           'borrowed_titles': ('borrows', 'book_title', 'borrower')}
+
+
+
+def _to_column(column: str, value):
+    if column in LIST_COLUMNS:
+        return json.dumps(value)
+    return value
+
+
+def _from_column(column: str, value):
+    if column in LIST_COLUMNS:
+        return json.loads(value) if value else []
+    if column in BOOL_COLUMNS:
+        return bool(value)
+    return value
+
+
+
+def _record_of(dataset: str, row):
+    """ Returns:
+            obj: The record stored in the row (without its primary key columns). """
+    table, keys, columns = TABLES[dataset]
+    if dataset in SCALAR_DATASETS:
+        return json.loads(row[len(keys)])
+    return {column: _from_column(column, value) for column, value in zip(columns, row[len(keys):])}
+
+
+
+@instrumented_class('storage.sqlite')
+class SQLiteStorage():
+    """ SQLite storage. Records are read from the database as they're used (see SQLiteDatasets), and saving only touches the changed rows. """
+    lazy = True
+
+    def __init__(self, file):
+        self.file = file
+        # shared by every thread of the program. Writes never overlap since they're done under the repository's write lock,
+        # but readers reading records for the first time at once take turns using it.
+        self.connection = sqlite3.connect(file, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self._add_missing_columns()
+        self.lock = threading.RLock()
+
+
+    def _add_missing_columns(self):
+        """ Adds the columns of fields added since the database was created (eg, times_borrowed). They're empty until the records are saved again. """
+        for table, keys, columns in TABLES.values():
+            existing = {row[1] for row in self.connection.execute(f'PRAGMA table_info({table})')}
+            for column in columns:
+                if column not in existing:
+                    self.connection.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+        self.connection.commit()
+
+
+    def load(self):
+        """ Gets the datasets without reading anything yet. Each record is read the first time it's used.
+
+            Returns:
+                SQLiteDatasets: The datasets. """
+        return SQLiteDatasets(self)
+
+
+    def dataset_version(self, dataset: str):
+        """ Gets a number that changes whenever another session saves to the database (any table, not only the dataset's).
+
+            Returns:
+                int: The database's version. """
+        with self.lock:
+            return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+
+    def load_record(self, dataset: str, name):
+        """ Reads a single record by its primary key. For 'borrows' and 'holds', it's every record of the book.
+
+            Returns:
+                obj: The record (a dict of borrower -> record for 'borrows' and 'holds'), or None if there's none. """
+        table, keys, columns = TABLES[dataset]
+        with self.lock:
+            # in the order the rows were added (eg, holds are served first come, first served).
+            rows = self.connection.execute(f"SELECT {', '.join(keys + columns)} FROM {table} WHERE {keys[0]} = ? ORDER BY rowid", (name,)).fetchall()
+        if not rows:
+            return None
+        if len(keys) == 2:
+            return {row[1]: _record_of(dataset, row) for row in rows}
+        return _record_of(dataset, rows[0])
+
+
+    def load_table(self, dataset: str):
+        """ Reads every record of the dataset.
+
+            Returns:
+                dict: The records of the dataset. """
+        table, keys, columns = TABLES[dataset]
+        records = {}
+        with self.lock:
+            rows = self.connection.execute(f"SELECT {', '.join(keys + columns)} FROM {table} ORDER BY rowid").fetchall()
+        for row in rows:
+            if len(keys) == 2:
+                records.setdefault(row[0], {})[row[1]] = _record_of(dataset, row)
+            else:
+                records[row[0]] = _record_of(dataset, row)
+        return records
+
+
+    def find(self, lookup: str, value):
+        """ Looks records up by something other than their primary key (see LOOKUPS), through the table's index.
+            Only sees what's saved, not changes that are still waiting to be saved.
+
+            Returns:
+                list: The names (eg, usernames, titles) of the records found. """
+        table, column, looked_up = LOOKUPS[lookup]
+        with self.lock:
+            return [row[0] for row in self.connection.execute(f'SELECT {column} FROM {table} WHERE {looked_up} = ?', (value,))]
+
+
+    def save(self, changes: list[dict], data):
+        """ Writes the rows affected by the changes, all in one sqlite transaction. """
+        # a row is rewritten once even if several of its fields changed.
+        affected = {}
+        for change in changes:
+            dataset, *keys = change['path']
+            key_size = len(TABLES[dataset][1])
+            affected[(dataset, tuple(keys[:key_size]))] = None
+
+        with self.lock, self.connection:
+            for dataset, keys in affected:
+                self._write_row(dataset, keys, data)
+
+
+    def _write_row(self, dataset: str, keys: tuple, data):
+        """ Replaces the row with whatever is in 'data' for it, or deletes it if it's gone. """
+        table, key_columns, columns = TABLES[dataset]
+
+        # a change on a whole book in 'borrows' (eg, ['borrows', title]) affects all of its borrowers.
+        if len(keys) < len(key_columns):
+            where = ' AND '.join(f'{column} = ?' for column in key_columns[:len(keys)])
+            self.connection.execute(f'DELETE FROM {table} WHERE {where}', keys)
+            for borrower in data[dataset].get(keys[0], {}):
+                self._write_row(dataset, keys + (borrower,), data)
+            return
+
+        record = data[dataset]
+        for key in keys:
+            record = record.get(key) if isinstance(record, dict) else None
+
+        if record is None:
+            where = ' AND '.join(f'{column} = ?' for column in key_columns)
+            self.connection.execute(f'DELETE FROM {table} WHERE {where}', keys)
+        else:
+            if dataset in SCALAR_DATASETS:
+                values = list(keys) + [json.dumps(record)]
+            else:
+                values = list(keys) + [_to_column(column, record.get(column)) for column in columns]
+            placeholders = ', '.join('?' for value in values)
+            self.connection.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(key_columns + columns)}) VALUES ({placeholders})", values)
+
+
+    def import_data(self, data):
+        """ Writes every record of the datasets into the database, replacing what's already there. """
+        with self.connection:
+            for dataset, (table, key_columns, columns) in TABLES.items():
+                self.connection.execute(f'DELETE FROM {table}')
+                for name in data.get(dataset, {}):
+                    if len(key_columns) == 2:
+                        for borrower in data[dataset][name]:
+                            self._write_row(dataset, (name, borrower), data)
+                    else:
+                        self._write_row(dataset, (name,), data)
+
+
+
+class SQLiteRecords(dict):
+    """ The records of a single table. Each is read from the database the first time it's looked up, and the whole table only when
+        something goes through all of them (eg, items()). Changes stay in memory until the repository saves them. """
+    def __init__(self, storage: SQLiteStorage, dataset: str):
+        super().__init__()
+        self.storage = storage
+        self.dataset = dataset
+
+        # the whole table was read, so a record that isn't here doesn't exist.
+        self.complete = False
+
+        # records removed since the last save. They're still in the database, so they must not be read back from it.
+        self.removed = set()
+
+
+    def _fetch(self, name):
+        """ Returns:
+                obj: The record, read from the database if it wasn't read yet, or _MISSING if there's none. """
+        if dict.__contains__(self, name):
+            return dict.__getitem__(self, name)
+        if self.complete or name in self.removed:
+            return _MISSING
+
+        with self.storage.lock:
+            # another reader may have read it while this one was waiting.
+            if dict.__contains__(self, name):
+                return dict.__getitem__(self, name)
+            record = self.storage.load_record(self.dataset, name)
+            if record is None:
+                return _MISSING
+            dict.__setitem__(self, name, record)
+            return record
+
+
+    def _load_all(self):
+        if self.complete:
+            return
+        with self.storage.lock:
+            if self.complete:
+                return
+            for name, record in self.storage.load_table(self.dataset).items():
+                # the records already read may have changes that aren't saved yet.
+                if not dict.__contains__(self, name) and name not in self.removed:
+                    dict.__setitem__(self, name, record)
+            self.complete = True
+
+
+    def __missing__(self, name):
+        record = self._fetch(name)
+        if record is _MISSING:
+            raise KeyError(name)
+        return record
+
+
+    def __contains__(self, name):
+        return self._fetch(name) is not _MISSING
+
+
+    def get(self, name, default=None):
+        record = self._fetch(name)
+        return default if record is _MISSING else record
+
+
+    def setdefault(self, name, default=None):
+        record = self._fetch(name)
+        if record is not _MISSING:
+            return record
+        self[name] = default
+        return default
+
+
+    def __setitem__(self, name, record):
+        self.removed.discard(name)
+        dict.__setitem__(self, name, record)
+
+
+    def pop(self, name, *default):
+        record = self._fetch(name)
+        if not self.complete:
+            self.removed.add(name)
+        if record is _MISSING:
+            if default:
+                return default[0]
+            raise KeyError(name)
+        return dict.pop(self, name)
+
+
+    def __delitem__(self, name):
+        self.pop(name)
+
+
+    def clear(self):
+        """ Forgets every record read so far, so they're read again from the database. """
+        dict.clear(self)
+        self.complete = False
+        self.removed = set()
+
+
+    # anything that goes through every record reads the whole table first.
+    def keys(self):
+        self._load_all()
+        return super().keys()
+
+    def values(self):
+        self._load_all()
+        return super().values()
+
+    def items(self):
+        self._load_all()
+        return super().items()
+
+    def __iter__(self):
+        self._load_all()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load_all()
+        return super().__len__()
+
+    def __repr__(self):
+        self._load_all()
+        return super().__repr__()
+
+
+
+class SQLiteDatasets(dict):
+    """ The usual datasets dict, with an SQLiteRecords for each table. """
+    def __init__(self, storage: SQLiteStorage):
+        super().__init__()
+        self.storage = storage
+        # the database's version when each dataset was last read or saved.
+        self.versions = {}
+
+
+    def __missing__(self, dataset):
+        if dataset not in TABLES:
+            raise KeyError(dataset)
+        with self.storage.lock:
+            if not dict.__contains__(self, dataset):
+                self.versions[dataset] = self.storage.dataset_version(dataset)
+                dict.__setitem__(self, dataset, SQLiteRecords(self.storage, dataset))
+            return dict.__getitem__(self, dataset)
+
+
+    def get(self, dataset, default=None):
+        if dict.__contains__(self, dataset) or dataset in TABLES:
+            return self[dataset]
+        return default
+
+
+    def __contains__(self, dataset):
+        return dict.__contains__(self, dataset) or dataset in TABLES
+
+
+    def setdefault(self, dataset, default=None):
+        if dataset in self:
+            return self[dataset]
+        dict.__setitem__(self, dataset, default)
+        return default
+
+
+    def _load_all(self):
+        for dataset in TABLES:
+            self[dataset]
+
+    def keys(self):
+        self._load_all()
+        return super().keys()
+
+    def values(self):
+        self._load_all()
+        return super().values()
+
+    def items(self):
+        self._load_all()
+        return super().items()
+
+    def __iter__(self):
+        self._load_all()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load_all()
+        return super().__len__()
+
+
+    def find(self, lookup: str, value):
+        """ Same as the storage's find(), only sees what's saved.
+
+            Returns:
+                list: The names of the records found. """
+        return self.storage.find(lookup, value)
+
+
+    def refresh(self):
+        """ Forgets the records read so far if another session saved to the database since, so they're read again when used.
+
+            Returns:
+                bool: True if anything was forgotten, otherwise False. """
+        reloaded = False
+        for dataset in list(dict.keys(self)):
+            version = self.storage.dataset_version(dataset)
+            if version == self.versions.get(dataset):
+                continue
+            dict.__getitem__(self, dataset).clear()
+            self.versions[dataset] = version
+            reloaded = True
+        return reloaded
+
+
+    def mark_saved(self):
+        """ Remembers the database's version after saving, so the records aren't read again for nothing. """
+        for dataset, records in dict.items(self):
+            self.versions[dataset] = self.storage.dataset_version(dataset)
+            # the removed rows are gone from the database now.
+            if isinstance(records, SQLiteRecords):
+                records.removed = set()
+
+
+
+def migrate_json_to_sqlite(json_file, sqlite_file):
+    """ One-shot migration of an existing storage.json (including its unmerged journal) into an SQLite database.
+
+        Returns:
+            dict: The number of records migrated per dataset. """
+    from .journal import Journal
+
+    data = Journal(json_file).load()
+    storage = SQLiteStorage(sqlite_file)
+    storage.import_data(data)
+
+    counts = {dataset: len(records) for dataset, records in data.items() if dataset not in ('borrows', 'holds')}
+    for dataset in ('borrows', 'holds'):
+        counts[dataset] = sum(len(users) for users in data.get(dataset, {}).values())
+    return counts
+
+
+
+if __name__ == '__main__':
+    # usage: python -m data.sqlite_storage data/storage.json data/storage.db
+    import sys
+    print(migrate_json_to_sqlite(sys.argv[1], sys.argv[2]))
@@ -1,69 +1,214 @@
 """ This is where data is handled for different CRUD operations. All info are stored in json file. """
 
-from model import User, Book, Author, Borrow
-import json
+from model import User, Book, Author, Borrow, Hold
+from .journal import Journal, apply_change
+from .sqlite_storage import SQLiteStorage
+from .shards import ShardedStorage
+from .instrumentation import instrumented_class, record_bytes
+from .codecs import get_codec, read_snapshot, write_snapshot
+import os
 
 
 
+@instrumented_class('storage.json')
+class JsonStorage():
+    """ Plain json storage. The whole file is rewritten on every save. """
+    def __init__(self, file, codec=None):
+        self.file = file
+        # the file's format (see data.codecs). If None, the format it was loaded in is kept.
+        self.codec = get_codec(codec) if codec is not None else None
+
+
+    def load(self):
+        """ Loads the datasets from the json file.
+
+            Returns:
+                dict: The loaded datasets. """
+        data, loaded_codec = read_snapshot(self.file)
+        self.codec = self.codec or loaded_codec
+        return data
+
+
+    def save(self, changes: list[dict], data):
+        """ Saves the data by rewriting the whole json file. """
+        # written to a temporary file first so a crash never leaves a half-written json file.
+        record_bytes('json', write_snapshot(self.file, data, self.codec or get_codec()))
+
+
+
+def open_storage(file, backend='journal', codec=None):
+    """ Picks the storage backend for the file. Files ending in '.db'/'.sqlite' always use SQLite, and directories are always sharded.
+        Backends: 'json' (full rewrite), 'journal' (append-only log with checkpoints), 'sqlite', 'sharded' (one or more files per dataset).
+        The json and journal backends save their snapshot with the codec (see data.codecs), or keep the format it's in if it's None.
+
+        Returns:
+            obj: The storage backend, which has load() and save(changes, data). """
+    if backend == 'sqlite' or str(file).endswith(('.db', '.sqlite')):
+        return SQLiteStorage(file)
+    elif backend == 'sharded' or os.path.isdir(file):
+        return ShardedStorage(file)
+    elif backend == 'journal':
+        return Journal(file, codec=codec)
+    elif backend == 'json':
+        return JsonStorage(file, codec)
+    raise ValueError(f"Storage backend, '{backend}', is not supported.")
+
+
+
+def load_data(file, storage=None):
+    """ Loads the data through the storage backend (the journaled json file by default).
+
+        Returns:
+            dict: The loaded datasets. """
+    storage = storage or open_storage(file)
+    return storage.load()
+
+
+
+# how many keys identify a single record in each dataset ('borrows' and 'holds' are keyed by the book's title, then the user).
+RECORD_DEPTH = {'accounts': 1, 'authors': 1, 'library': 1, 'borrows': 2, 'holds': 2, 'meta': 1}
+
+
+
+def records_under(data, path: list):
+    """ Gets a copy of every record found under the path. A path to a field gives its whole record,
+        while a shorter path (eg, ['borrows', title]) gives every record below it.
+
+        Returns:
+            dict: The records, keyed by (dataset, *keys). """
+    dataset = path[0]
+    depth = RECORD_DEPTH.get(dataset, 1)
+    prefix = path[:depth + 1]
+
+    target = data
+    for key in prefix:
+        if not isinstance(target, dict) or key not in target:
+            return {}
+        target = target[key]
+
+    records = {}
+    def collect(node, keys):
+        if len(keys) == depth + 1:
+            records[tuple(keys)] = dict(node) if isinstance(node, dict) else node
+        elif isinstance(node, dict):
+            for key, child in node.items():
+                collect(child, keys + [key])
+    collect(target, list(prefix))
+    return records
+
+
+
+@instrumented_class('data')
 class GeneralDataHandling():
-    def __init__(self, data, file):
+    def __init__(self, data, file, storage=None, observers=None):
         self.file = file
 
+        # where the changes end up being saved (json file, journal, sqlite database).
+        self.storage = storage or JsonStorage(file)
+
+        # notified of every record that changes (eg, indexes), through on_change(dataset, keys, old, new).
+        self.observers = observers if observers is not None else []
+
+        # set by Transaction while a unit of work is active; changes are then saved on commit instead of right away.
+        self.transaction = None
+
         if data is not None:
             self.data = data
 
 
-    def save_changes(self):
-        with open(self.file, 'w') as save:
-            json.dump(self.data, save, indent=4)
-        
+    def save_changes(self, changes=None):
+        self.storage.save(changes or [], self.data)
+
+
+    def _undo_for(self, path: list):
+        """ Figures out the change that would revert whatever is currently at the path. The current value is kept as it is, not copied:
+            changes always put a new value in place (see apply_change) and never change the old one.
+
+            Returns:
+                dict: The change that undoes a write to the path. """
+        target = self.data
+        for depth, key in enumerate(path):
+            if not isinstance(target, dict) or key not in target:
+                # removes the first missing level so that levels created along the way are cleaned up too.
+                return {'op': 'pop', 'path': path[:depth + 1]}
+            target = target[key]
+        return {'op': 'set', 'path': path, 'value': target}
+
+
+    def _apply(self, change: dict):
+        """ Applies the change to 'data' and lets the observers know which records changed. """
+        if not self.observers:
+            apply_change(self.data, change)
+            return
+
+        before = records_under(self.data, change['path'])
+        apply_change(self.data, change)
+        after = records_under(self.data, change['path'])
+
+        for keys in before.keys() | after.keys():
+            old, new = before.get(keys), after.get(keys)
+            if old != new:
+                for observer in self.observers:
+                    observer.on_change(keys[0], keys[1:], old, new)
+
+
+    def _commit_change(self, change: dict):
+        """ Applies the change to 'data', then saves it now or defers it until the active transaction commits. """
+        undo = self._undo_for(change['path']) if self.transaction is not None else None
+        self._apply(change)
+
+        if self.transaction is not None:
+            self.transaction.record(change, undo)
+        else:
+            self.save_changes([change])
+
+
+    def _set(self, path: list, value):
+        """ Sets the value found at the path (eg, ['accounts', name, field]) and saves the change. """
+        self._commit_change({'op': 'set', 'path': path, 'value': value})
 
 
+    def _extend(self, path: list, items: list):
+        """ Adds the items to the list found at the path (eg, ['accounts', username, 'borrowed_books']) and saves only them, not the whole list. """
+        self._commit_change({'op': 'extend', 'path': path, 'value': list(items)})
 
 
+    def _pop(self, path: list):
+        """ Removes the item found at the path (eg, ['library', title]) and saves the change. """
+        self._commit_change({'op': 'pop', 'path': path})
+
+
+
+
+
+@instrumented_class('data.create')
 class Create(GeneralDataHandling):
-    def __init__(self, data, file):
-        super().__init__(data, file)
+    def __init__(self, data, file, storage=None, observers=None):
+        super().__init__(data, file, storage, observers)
 
     def save_user(self, user: User):
-        self.data['accounts'][user.username] = {'email': user.email,
-                                                'age': user.age,
-                                                'id': user.id,
-                                                'role': user.role,
-                                                'borrow_count': user.borrow_count,
-                                                'borrowed_books': user.borrowed_books}
-        self.save_changes()
+        self._set(['accounts', user.username], user.to_record())
 
     def save_author(self, author: Author):
-        self.data['authors'][author.name] = {'age': author.age,
-                                            'birthday': author.birthday,
-                                            'nationality': author.nationality,
-                                            'books': author.books}
-        self.save_changes()
+        self._set(['authors', author.name], author.to_record())
 
     def save_book(self, book: Book):
-        self.data['library'][book.title] = {'author': book.author,
-                                            'quantity': book.quantity,
-                                            'date_published': book.date_published,
-                                            'genre': book.genre,
-                                            'age_restriction': book.age_restriction,
-                                            'is_available': book.is_available}
-        self.save_changes()
+        self._set(['library', book.title], book.to_record())
 
     def save_borrow(self, borrow_info: Borrow):
-        self.data['borrows'][borrow_info.book_title][borrow_info.borrowed_by] = {'borrowed_on': borrow_info.borrowed_on,
-                                                                                'borrow_deadline': borrow_info.borrow_deadline,
-                                                                                'returned_on': borrow_info.returned_on,
-                                                                                'user_status': borrow_info.user_status}
-        self.save_changes()
+        self._set(['borrows', borrow_info.book_title, borrow_info.borrowed_by], borrow_info.to_record())
+
+    def save_hold(self, hold: Hold):
+        self._set(['holds', hold.book_title, hold.held_by], hold.to_record())
 
 
 
 
 
+@instrumented_class('data.update')
 class Update(GeneralDataHandling):
-    def __init__(self, data, file):
-        super().__init__(data, file)
+    def __init__(self, data, file, storage=None, observers=None):
+        super().__init__(data, file, storage, observers)
 
     # This only works for accounts, authors, and books. Borrow has a specific dataset structure.
     def update_entry(self, change: list[str]):
@@ -73,36 +218,49 @@ class Update(GeneralDataHandling):
         # I dont think this is necessary, but just in case...
         if dataset not in accepted_datasets:
             return
-        
+
         # Saves the updated info to whichever dataset (only for accounts, authors, and library) you changed.
-        for valid_dataset in accepted_datasets:
-            if dataset == valid_dataset:
-                self.data[dataset][name][field] = new_value
-        self.save_changes()
-    
+        self._set([dataset, name, field], new_value)
+
+    # adds to a list field (eg, an author's books) without writing the whole list again. Items already in it are skipped.
+    def extend_entry(self, change: list):
+        dataset, name, field, new_items = change
+
+        if dataset not in ['accounts', 'authors', 'library']:
+            return
+        self._extend([dataset, name, field], new_items)
+
     def update_borrow(self, data: list[str]):
         book_title, borrower, field, new_value = data
-        self.data['borrows'][book_title][borrower][field] = new_value
-        self.save_changes()
-        
+        self._set(['borrows', book_title, borrower, field], new_value)
 
+    # 'meta' holds values about the data itself rather than records (eg, the last user id given out).
+    def update_meta(self, key: str, new_value):
+        self._set(['meta', key], new_value)
 
 
+
+
+@instrumented_class('data.delete')
 class Delete(GeneralDataHandling):
-    def __init__(self, data, file):
-        super().__init__(data, file)
+    def __init__(self, data, file, storage=None, observers=None):
+        super().__init__(data, file, storage, observers)
 
     # Again, this follows the same logic as with update, wherein this only works for accounts, authors, and library.
     def delete_entry(self, entry: list[str]):
         dataset, name = entry
         accepted_datasets = ['accounts', 'authors', 'library']
 
-        for valid_dataset in accepted_datasets:
-            if dataset == valid_dataset:
-                self.data[dataset].pop(name)
-        self.save_changes()
+        if dataset in accepted_datasets:
+            self._pop([dataset, name])
 
     def delete_borrow(self, data: list[str]):
         book_title, borrower = data
-        self.data['borrows'][book_title].pop(borrower)
-        self.save_changes()
\ No newline at end of file
+        self._pop(['borrows', book_title, borrower])
+
+    def delete_hold(self, data: list[str]):
+        book_title, username = data
+        self._pop(['holds', book_title, username])
+        # drops the book from 'holds' once no one is waiting for it anymore.
+        if not self.data['holds'].get(book_title, True):
+            self._pop(['holds', book_title])
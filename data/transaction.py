@@ -0,0 +1,72 @@
+""" This is where multiple writes are grouped into a single unit of work. Changes are applied to 'data' right away but only saved on commit, and undone if anything goes wrong. """
+
+
+
+class Transaction():
+    def __init__(self, *handlers):
+        # the Create, Update, and Delete handlers that share the same 'data'
+        self.handlers = handlers
+        self.changes = []
+        self.undo = []
+        self.depth = 0
+
+
+    def __enter__(self):
+        # nested transactions simply join the outer one, only the outermost commits or rolls back.
+        self.depth += 1
+        if self.depth == 1:
+            for handler in self.handlers:
+                handler.transaction = self
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth > 0:
+            return False
+
+        for handler in self.handlers:
+            handler.transaction = None
+
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        # the exception (if any) is still raised to the caller.
+        return False
+
+
+    def record(self, change: dict, undo: dict):
+        """ Keeps track of a change made during the transaction and how to undo it. """
+        self.changes.append(change)
+        self.undo.append(undo)
+
+
+    def commit(self):
+        """ Saves every change made during the transaction in one go. """
+        if self.changes:
+            self.handlers[0].save_changes(self.changes)
+        self.changes, self.undo = [], []
+
+
+    def rollback(self):
+        """ Undoes every change made during the transaction, latest change first. """
+        # goes through the handler so the observers (eg, indexes) are reverted as well.
+        for undo in reversed(self.undo):
+            self.handlers[0]._apply(undo)
+        self.changes, self.undo = [], []
+
+
+    def savepoint(self):
+        """ Marks how far the transaction got, so the changes made after it can be undone on their own (see rollback_to).
+
+            Returns:
+                int: The savepoint. """
+        return len(self.undo)
+
+
+    def rollback_to(self, savepoint: int):
+        """ Undoes the changes made after the savepoint, latest change first. The ones before it are kept for the commit. """
+        for undo in reversed(self.undo[savepoint:]):
+            self.handlers[0]._apply(undo)
+        del self.changes[savepoint:], self.undo[savepoint:]
@@ -1,6 +1,8 @@
 """ The CENTRAL POINT of the program. This is where you should only RUN the program for it to behave properly. """
 
-from presentation import UserInteraction
+from presentation import UserInteraction, run_server, run_batch, print_report
+import argparse
+import sys
 
 
 def run_packages():
@@ -12,4 +14,25 @@ def run_packages():
 
 
 if __name__ == '__main__':
-    run_packages()  
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Digital library system.')
+    parser.add_argument('--serve', action='store_true', help='serve the library as a JSON API instead of the CLI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--batch', metavar='FILE', help="run the commands in FILE ('-' for stdin) instead of asking for them")
+    parser.add_argument('--role', default='librarian', choices=['librarian', 'member'], help='the role batch commands start with')
+    parser.add_argument('--user', help='the user batch commands are run as (eg, for about_me)')
+    parser.add_argument('--dry-run', action='store_true', help='run the batch without saving its changes')
+    arguments = parser.parse_args()
+
+    if arguments.serve:
+        run_server(host=arguments.host, port=arguments.port)
+    elif arguments.batch:
+        if arguments.batch == '-':
+            summary = run_batch(sys.stdin, arguments.role, arguments.user, dry_run=arguments.dry_run)
+        else:
+            with open(arguments.batch, 'r') as commands:
+                summary = run_batch(commands, arguments.role, arguments.user, dry_run=arguments.dry_run)
+        print_report(summary)
+        sys.exit(1 if summary['failed'] else 0)
+    else:
+        run_packages()
\ No newline at end of file
@@ -1,4 +1,8 @@
+from .record import Record
 from .user import User
 from .author import Author
 from .book import Book
-from .borrow import Borrow
\ No newline at end of file
+from .borrow import Borrow
+from .hold import Hold
+from .schema import SCHEMAS, EntitySchema, Field, get_field, convert_value
+from .dates import DATE_FORMAT, DATE_FIELDS, NO_DATE, to_timestamp, format_date
\ No newline at end of file
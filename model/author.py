@@ -1,9 +1,14 @@
 """ Here is the blueprint for the author object """
 
-class Author:
-    def __init__(self, name: str, age='unknown', birthday='unknown', nationality='unknown', books=[]):
+from .record import Record
+
+class Author(Record):
+    __slots__ = ('name', 'age', 'birthday', 'nationality')
+    KEYS = ('name',)
+
+    # age stays 'unknown' until it's set. The author's books aren't kept here, they're looked up from the library (see IndexManager.books_of).
+    def __init__(self, name: str, age: int = 'unknown', birthday: str = 'unknown', nationality: str = 'unknown'):
         self.name = name
         self.age = age
         self.birthday = birthday
-        self.nationality = nationality
-        self.books = books
\ No newline at end of file
+        self.nationality = nationality
\ No newline at end of file
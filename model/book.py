@@ -1,9 +1,12 @@
 """ Here is the blueprint for the book object """
 
-from model import Author
+from .record import Record
 
-class Book:
-    def __init__(self, title: str, author: str, quantity: int, date_published='unknown', genre='unknown', age_restriction='all-ages', is_available=True):
+class Book(Record):
+    __slots__ = ('title', 'author', 'quantity', 'date_published', 'genre', 'age_restriction', 'is_available')
+    KEYS = ('title',)
+
+    def __init__(self, title: str, author: str, quantity: int, date_published: str = 'unknown', genre: str = 'unknown', age_restriction: str = 'all-ages', is_available: bool = True):
         self.title = title
         self.author = author
         self.quantity = quantity
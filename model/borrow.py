@@ -1,10 +1,19 @@
 """ Here is the blueprint for the borrow informations object """
 
-class Borrow:
-    def __init__(self, book_title: str, borrowed_by: str, borrowed_on: str, borrow_deadline: str, returned_on='unknown', user_status='active'):
+from .record import Record
+from .dates import NO_DATE
+
+class Borrow(Record):
+    # the dates are timestamps (see model.dates), returned_on stays 'unknown' until the book is returned.
+    # a user borrowing a book again replaces their record of it, times_borrowed keeps how many times they've borrowed it so far.
+    __slots__ = ('book_title', 'borrowed_by', 'borrowed_on', 'borrow_deadline', 'returned_on', 'user_status', 'times_borrowed')
+    KEYS = ('book_title', 'borrowed_by')
+
+    def __init__(self, book_title: str, borrowed_by: str, borrowed_on: int, borrow_deadline: int, returned_on: int = NO_DATE, user_status: str = 'active', times_borrowed: int = 1):
         self.book_title = book_title
         self.borrowed_by = borrowed_by
         self.borrowed_on = borrowed_on
         self.borrow_deadline = borrow_deadline
         self.returned_on = returned_on
-        self.user_status = user_status
\ No newline at end of file
+        self.user_status = user_status
+        self.times_borrowed = times_borrowed
\ No newline at end of file
@@ -0,0 +1,44 @@
+""" Here is how dates are stored and shown. Borrow dates are stored as timestamps (whole seconds since the epoch) so they can be compared
+    and sorted directly, and are only turned into readable text when shown. """
+
+from datetime import datetime
+
+
+# how dates are shown to the user (eg, 'Sunday, October 18, 2026'). Older data also stored its dates in this format.
+DATE_FORMAT = "%A, %B %d, %Y"
+
+# the borrow fields that hold dates.
+DATE_FIELDS = ('borrowed_on', 'borrow_deadline', 'returned_on')
+
+# what's stored for a date that isn't set yet (eg, a book that wasn't returned).
+NO_DATE = 'unknown'
+
+
+def to_timestamp(value):
+    """ Turns a date into a timestamp. Takes timestamps, datetime objects, dates in DATE_FORMAT (as stored by older data), or 'YYYY-MM-DD'.
+
+        Returns:
+            int: The timestamp, or None if the date isn't set. """
+    if value is None or value == NO_DATE:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"'{value}' is not a date.")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+
+    for parse in (lambda text: datetime.strptime(text, DATE_FORMAT), datetime.fromisoformat):
+        try:
+            return int(parse(str(value).strip()).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"'{value}' is not a date. Use the format 'YYYY-MM-DD'.")
+
+
+def format_date(value):
+    """ Returns:
+            str: The date as readable text (see DATE_FORMAT), or the value as it is if it isn't a timestamp (eg, 'unknown'). """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value).strftime(DATE_FORMAT)
+    return value
\ No newline at end of file
@@ -0,0 +1,13 @@
+""" Here is the blueprint for the hold object, a user waiting for a copy of a book """
+
+from .record import Record
+
+class Hold(Record):
+    # holds on a book are served in the order they were placed, placed_on is a timestamp (see model.dates).
+    __slots__ = ('book_title', 'held_by', 'placed_on')
+    KEYS = ('book_title', 'held_by')
+
+    def __init__(self, book_title: str, held_by: str, placed_on: int):
+        self.book_title = book_title
+        self.held_by = held_by
+        self.placed_on = placed_on
\ No newline at end of file
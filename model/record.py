@@ -0,0 +1,32 @@
+""" Here is the base blueprint shared by the user, book, author, and borrow objects """
+
+from operator import attrgetter
+
+
+class Record:
+    """ Base for the compact (__slots__) blueprints. Each subclass lists its attributes in __slots__
+        and the ones that identify it in KEYS; the converter to the stored dict is generated from those.
+        The objects only live while a record is being created, the data itself is held as the stored dicts. """
+    __slots__ = ()
+    KEYS = ()
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        # the stored fields are every attribute except the keys, which are the names the record is stored under.
+        cls.FIELDS = tuple(name for name in cls.__slots__ if name not in cls.KEYS)
+        cls._get_fields = attrgetter(*cls.FIELDS)
+        if len(cls.FIELDS) == 1:
+            # attrgetter gives the value itself (not a tuple) for a single attribute.
+            get_field = cls._get_fields
+            cls._get_fields = staticmethod(lambda record: (get_field(record),))
+
+    def to_record(self):
+        """ Converts the object into the dict that gets stored in its dataset.
+
+            Returns:
+                dict: The object's fields (without its keys). """
+        return dict(zip(self.FIELDS, self._get_fields(self)))
+
+    def __repr__(self):
+        attributes = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({attributes})'
\ No newline at end of file
@@ -0,0 +1,98 @@
+""" Here is the registry of fields for each entity, derived from the blueprints of the user, book, author, and borrow objects """
+
+import inspect
+from .user import User
+from .author import Author
+from .book import Book
+from .borrow import Borrow
+from .hold import Hold
+
+
+class Field:
+    def __init__(self, name: str, type: type, mutable=True, default=None):
+        self.name = name
+        self.type = type
+        self.mutable = mutable
+        # what's stored while the field isn't set. If it isn't of the field's type (eg, 'unknown' for a date), it's accepted as well.
+        self.default = default
+
+
+    def accepts(self, value):
+        """ Checks if the value can be stored in the field.
+
+            Returns:
+                bool: True if the value is of the field's type (or is its default), otherwise False. """
+        # True and False are ints in python, but they're no quantity or age.
+        if isinstance(value, bool) and self.type is not bool:
+            return False
+        if isinstance(value, self.type):
+            return True
+        return self.default is not None and not isinstance(self.default, self.type) and value == self.default
+
+
+    def convert(self, answer):
+        """ Turns a typed-in answer into the field's type (eg, '3' into 3 for 'quantity', 'yes' into True for 'is_available').
+            Answers that can't be turned into it are given back as they are, for the checks to reject (or, eg, for dates, to convert).
+
+            Returns:
+                obj: The converted answer. """
+        if not isinstance(answer, str) or self.type is str or answer == self.default:
+            return answer
+
+        if self.type is bool:
+            if answer.strip().lower() in ('true', 'yes', 'y'):
+                return True
+            if answer.strip().lower() in ('false', 'no', 'n'):
+                return False
+        elif self.type is int:
+            try:
+                return int(answer.strip())
+            except ValueError:
+                pass
+        return answer
+
+
+class EntitySchema:
+    def __init__(self, dataset: str, blueprint: type, keys: list[str], immutable=()):
+        self.dataset = dataset
+        self.blueprint = blueprint
+        self.keys = keys
+        self.fields = {}
+
+        # every argument of the blueprint that isn't part of the record's key is a stored field, with the type it's annotated with.
+        for parameter in list(inspect.signature(blueprint.__init__).parameters.values())[1:]:
+            if parameter.name in keys:
+                continue
+            if parameter.annotation is inspect.Parameter.empty:
+                raise TypeError(f"Field, '{parameter.name}', of {blueprint.__name__} has no type annotation.")
+
+            default = None if parameter.default is inspect.Parameter.empty else parameter.default
+            self.fields[parameter.name] = Field(parameter.name, parameter.annotation, parameter.name not in immutable, default)
+
+
+# which dataset each blueprint is stored in, what identifies its records, and which fields can't be changed.
+SCHEMAS = {'accounts': EntitySchema('accounts', User, ['username'], immutable=('id', 'borrow_count', 'borrowed_books')),
+           'authors': EntitySchema('authors', Author, ['name']),
+           'library': EntitySchema('library', Book, ['title']),
+           'borrows': EntitySchema('borrows', Borrow, ['book_title', 'borrowed_by'], immutable=('borrowed_on', 'borrow_deadline', 'times_borrowed')),
+           'holds': EntitySchema('holds', Hold, ['book_title', 'held_by'], immutable=('placed_on',))}
+
+
+def convert_value(dataset: str, field: str, answer):
+    """ Turns a typed-in answer (eg, from a prompt or a batch file) into the type of the entity's field (see Field.convert).
+
+        Returns:
+            obj: The converted answer, or the answer as it is if the entity has no such field. """
+    field_info = get_field(dataset, field)
+    return answer if field_info is None else field_info.convert(answer)
+
+
+def get_field(dataset: str, field: str):
+    """ Looks up a field of the entity stored in the dataset.
+
+        Returns:
+            Field: The field's name, type, and whether it can be changed, or None if the entity has no such field. """
+    schema = SCHEMAS.get(dataset)
+    if schema is None:
+        return None
+    return schema.fields.get(field)
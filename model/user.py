@@ -1,11 +1,16 @@
 """ Here is the blueprint for the user object """
 
-class User:
-    def __init__(self, username: str, email: str, age: int, id: str, role='member',borrow_count=0, borrowed_books=[]):
+from .record import Record
+
+class User(Record):
+    __slots__ = ('username', 'email', 'age', 'id', 'role', 'borrow_count', 'borrowed_books')
+    KEYS = ('username',)
+
+    def __init__(self, username: str, email: str, age: int, id: str, role: str = 'member', borrow_count: int = 0, borrowed_books: list = None):
         self.username = username
         self.email = email
         self.age = age
         self.id = id
         self.role = role
         self.borrow_count = borrow_count
-        self.borrowed_books = borrowed_books or []
+        self.borrowed_books = borrowed_books or []
\ No newline at end of file
@@ -1,4 +1,6 @@
 from .display import UserInteraction
 from .acc_verify import login, sign_up
 from .actions import action
-from .help import about_commands
\ No newline at end of file
+from .help import about_commands
+from .api import ApiServer, run_server
+from .batch import run_batch, print_report
\ No newline at end of file
@@ -1,6 +1,7 @@
 """ FOR USER RELATED AUTHENTICATION. """
 
 from services import LibrarianServices, EmptyValueError, NameNotFoundError, NameTakenError, InvalidAgeError, InvalidEmailError
+from data import get_repository, LATEST_VERSION, SCHEMA_VERSION_KEY, SnapshotCorruptedError
 import os, json
 
 
@@ -8,7 +9,9 @@ import os, json
 DEFAULT_DATASETS = {'accounts': {}, 
                 'authors': {},
                 'library': {},
-                'borrows': {}}
+                'borrows': {},
+                'holds': {},
+                'meta': {SCHEMA_VERSION_KEY: LATEST_VERSION}}
 
 # for aethetic purposes; used in making the presentation flow easier to understand.
 linebreak = "\n-----------------------------------------------------------------------------\n"
@@ -25,11 +28,13 @@ def login(file='data/storage.json'):
             json.dump(DEFAULT_DATASETS, create_file, indent=4)
 
     try:
-        with open(file, "r") as f:
-            data = json.load(f)
+        # uses the same loaded data as the services, reloading it only if the file changed (eg, an account was just signed up elsewhere).
+        repository = get_repository(file)
+        repository.refresh()
+        data = repository.data
 
     # to ensure that the program wouldn't break regardless of whether storage.json is empty or cannot be found.
-    except (json.JSONDecodeError, FileNotFoundError):
+    except (json.JSONDecodeError, SnapshotCorruptedError, FileNotFoundError):
         data = DEFAULT_DATASETS.copy()
 
     accounts = data['accounts']
@@ -1,23 +1,42 @@
 """ Handles user actions when prompted what to do. """
 
 from services import LibrarianServices, MemberServices
+from model import convert_value
 from .help import about_commands
-from services.error import EmptyValueError, NameNotFoundError, NameTakenError, InvalidAgeError, InvalidChangeError, InvalidEmailError, InvalidQuantityError, BookUnavailableError, BorrowLimitError
+from data import StorageConflictError
+from services.error import EmptyValueError, NameNotFoundError, NameTakenError, InvalidAgeError, InvalidChangeError, InvalidEmailError, InvalidQuantityError, BookUnavailableError, BorrowLimitError, HoldError, ReturnError
+from contextlib import contextmanager
 import sys, time
 
 
-def action(action, login_status):
+# answers to the prompts when the commands aren't typed in (eg, batch mode). None when the user is asked.
+answers = None
+
+
+
+def action(action, login_status, service=None):
     access, current_user = login_status
 
     # separates user access to different methods based on user's role.
-    if access == 'librarian':
+    if service is None and access == 'librarian':
         service = LibrarianServices()
-    elif access == 'member':
+    elif service is None and access == 'member':
         service = MemberServices()
 
     try:
         print(f"\nProceeding with '{action}'...\n")
-        match action.lower():
+        run_command(action, login_status, service)
+
+    except (EmptyValueError, NameNotFoundError, NameTakenError, InvalidAgeError, InvalidChangeError, InvalidEmailError, InvalidQuantityError, BookUnavailableError, ValueError, BorrowLimitError, HoldError, ReturnError, StorageConflictError) as e:
+        print(f"ERROR: {e}")
+
+
+
+def run_command(action, login_status, service):
+    """ Runs the command with the service of the user's role. Unlike action, errors are raised to the caller. """
+    access, current_user = login_status
+
+    match action.lower():
             # GENERAL ACCESS COMMAND
                 case 'is_available':
                     book_title = ask_for("book's title")
@@ -25,15 +44,15 @@ def action(action, login_status):
 
 
                 case 'search':
-                    what_to_search = input('What do you want to search for? -> ')
+                    what_to_search = ask('What do you want to search for? -> ')
                     
-                    if what_to_search.lower() not in ['user', 'book', 'author']:
-                        print('\nSearch invalid. Can only search for user, book, and author.')
+                    if what_to_search.lower() not in ['user', 'book', 'author', 'catalog']:
+                        print('\nSearch invalid. Can only search for user, book, author, and catalog.')
                         return 
                     
                     name = ask_for(what_to_search.lower())
                     print(f'\nYOU SEARCHED FOR: {name}\n')
-                    service.search(what_to_search, name)
+                    service.search(what_to_search.lower(), name)
 
 
                 case 'user_borrow_history':
@@ -51,6 +70,16 @@ def action(action, login_status):
                     service.get_written_books(username)
 
 
+                case 'holds_of':
+                    book_title = ask_for("book's title")
+                    service.holds_of(book_title)
+
+
+                case 'overdue_loans':
+                    as_of = ask('As of which date? (YYYY-MM-DD, leave empty for today) -> ').strip()
+                    service.overdue_loans(as_of)
+
+
                 case 'user_metrics':
                     service.user_metrics()
 
@@ -59,6 +88,14 @@ def action(action, login_status):
                     service.book_metrics()
 
 
+                case 'circulation_metrics':
+                    service.circulation_metrics()
+
+
+                case 'cache_metrics':
+                    service.cache_metrics()
+
+
 
                 # LIBRARIAN-ONLY COMMANDS
                 case 'add_user':
@@ -73,7 +110,7 @@ def action(action, login_status):
                     book_title = ask_for("book's title")
                     author = ask_for('author')
                     quantity = ask_for("book's quantity")
-                    ask_further_info = input('\nDo you want to continue adding more info? -> (y/n)') 
+                    ask_further_info = ask('\nDo you want to continue adding more info? -> (y/n)') 
                     
                     if ask_further_info == 'y':
                         publishing_date = ask_for('publishing date')
@@ -90,7 +127,7 @@ def action(action, login_status):
                 case 'update_user':
                     username = ask_for('username')
                     field = ask_for('field name')
-                    new_value = ask_for('new value')
+                    new_value = convert_value('accounts', field, ask_for('new value'))
                     service.update_user(username, field, new_value)
                     print(f"User's information has been updated!")
 
@@ -98,7 +135,7 @@ def action(action, login_status):
                 case 'update_book':
                     book_title = ask_for("book's title")
                     field = ask_for('field name')
-                    new_value = ask_for('new value')
+                    new_value = convert_value('library', field, ask_for('new value'))
                     service.update_book(book_title, field, new_value)
                     print(f"\nBook's information has been updated!")
 
@@ -106,8 +143,8 @@ def action(action, login_status):
                 case 'update_author':
                     author = ask_for("author's name")
                     field = ask_for('field name')
-                    new_value = ask_for('new value')
-                    service.update_user(author, field, new_value)
+                    new_value = convert_value('authors', field, ask_for('new value'))
+                    service.update_author(author, field, new_value)
                     print(f"\nAuthor's information has been updated!")
 
 
@@ -115,11 +152,20 @@ def action(action, login_status):
                     book_title = ask_for("book's title")
                     username = ask_for('username')
                     field = ask_for('field name')
-                    new_value = ask_for('new value')
-                    service.update_user(book_title, username, field, new_value)
+                    new_value = convert_value('borrows', field, ask_for('new value'))
+                    service.update_borrow(book_title, username, field, new_value)
                     print(f"\nUser's borrow information has been updated!")
 
 
+                case 'bulk_import':
+                    kind = ask_for('kind of records (books/users/authors)')
+                    path = ask_for('path of the CSV/JSONL file')
+                    report = service.import_records(kind, path)
+                    print(f"\nImported {report['imported']} {kind}, {report['failed']} failed.")
+                    for line_number, error in report['errors']:
+                        print(f'Line {line_number}: {error}')
+
+
                 case 'remove_user':
                     username = ask_for('username')
                     service.remove_user(username)
@@ -128,7 +174,7 @@ def action(action, login_status):
 
                 case 'remove_book':
                     book_title = ask_for("book's title")
-                    service.remove_user(book_title)
+                    service.remove_book(book_title)
                     print(f"\nBook, {book_title}, has been removed!")
 
 
@@ -146,11 +192,25 @@ def action(action, login_status):
                 case 'return_book':
                     book_title = ask_for("book's title")
                     borrower = ask_for("borrower's name")
-                    service.borrow_book(book_title, borrower)
+                    service.return_book(book_title, borrower)
                     print(f"\nBook, {book_title}, has been successfuly returned!")
                     print('Thank you for reading!')
 
 
+                case 'place_hold':
+                    book_title = ask_for("book's title")
+                    username = ask_for('username')
+                    service.place_hold(book_title, username)
+                    print(f"\n{username} is now waiting for '{book_title}'. It will be borrowed for them as soon as a copy is returned.")
+
+
+                case 'cancel_hold':
+                    book_title = ask_for("book's title")
+                    username = ask_for('username')
+                    service.cancel_hold(book_title, username)
+                    print(f"\n{username} is no longer waiting for '{book_title}'.")
+
+
 
                 # MISCELLANEOUS/SYSTEM COMMANDS
                 case 'stop' | 'end':
@@ -184,10 +244,6 @@ def action(action, login_status):
                     print('Invalid command. Try again.')
 
 
-    except (EmptyValueError, NameNotFoundError, NameTakenError, InvalidAgeError, InvalidChangeError, InvalidEmailError, InvalidQuantityError, BookUnavailableError, ValueError, BorrowLimitError) as e:
-        print(f"ERROR: {e}")
-
-
 
 def ask_for(object: str):
     """ Ask the user to enter a specific information.
@@ -195,7 +251,31 @@ def ask_for(object: str):
         Returns:
             str: The user's answer.  """
     if object == "age" or object == "book's quantity":
-        info = int(input(f"Enter the {object} here -> "))
+        info = int(ask(f"Enter the {object} here -> "))
     else:
-        info = input(f"Enter the {object} here -> ")
-    return info
\ No newline at end of file
+        info = ask(f"Enter the {object} here -> ")
+    return info
+
+
+def ask(prompt: str):
+    """ Asks the user, or takes the next of the given answers (see answers_from) instead.
+
+        Returns:
+            str: The answer. """
+    if answers is None:
+        return input(prompt)
+    try:
+        return next(answers)
+    except StopIteration:
+        raise ValueError(f"Missing an answer for: '{prompt.removesuffix(' -> ').strip()}'.")
+
+
+@contextmanager
+def answers_from(given_answers):
+    """ Answers the prompts with the given answers, in order, instead of asking the user. Use as 'with answers_from([...]):'. """
+    global answers
+    previous, answers = answers, iter(given_answers)
+    try:
+        yield answers
+    finally:
+        answers = previous
\ No newline at end of file
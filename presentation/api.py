@@ -0,0 +1,325 @@
+""" This is where the HTTP/JSON server is handled. Every client (eg, a self-service kiosk) talks to the same services and the same loaded data.
+
+    Usage: python main.py --serve [--host 127.0.0.1] [--port 8080]
+
+    Every call is 'POST /<service>/<method>' where service is 'general', 'librarian', or 'member', and the body is a JSON list of
+    arguments or a JSON object of keyword arguments, eg:
+
+        POST /member/borrow_book    {"title": "Dune", "borrower": "ann"}
+
+    The reply is {"ok": true, "result": ..., "output": "<what the method printed>"}, or {"ok": false, "error": ..., "message": ...}.
+    Listings (eg, book_borrow_history) take "limit" and "cursor", and their result is {"items": [...], "next_cursor": ...}.
+    'GET /metrics' gives the program's timings and counters when LIBRARY_METRICS is set.
+
+    The librarian endpoints are turned off unless LIBRARY_API_TOKEN is set, and then every call to them must send the token as
+    'Authorization: Bearer <token>'. Kiosks only ever need the general and member endpoints.
+
+    Member calls that act for a user (borrowing, returning, and holds) must send that user's token the same way. A librarian gets it
+    with 'POST /librarian/member_token {"username": "ann"}' and hands it to the user. It only works for calls made for that user, and
+    it's made from LIBRARY_API_TOKEN, so they're turned off without it as well (and changing it makes every member token stop working). """
+
+from services import GeneralServices, LibrarianServices, MemberServices
+from services.error import Error
+from data import StorageConflictError
+from data.instrumentation import metrics
+from .acc_verify import DEFAULT_DATASETS
+from contextlib import contextmanager
+import asyncio
+import hashlib
+import hmac
+import inspect
+import io
+import json
+import os
+import sys
+import threading
+
+
+# the methods each service exposes. Anything else is answered with 404.
+READ_METHODS = ['is_available', 'search', 'search_catalog', 'user_borrow_history', 'book_borrow_history', 'get_written_books', 'overdue_loans', 'holds_of', 'user_metrics', 'book_metrics', 'circulation_metrics', 'cache_metrics']
+ENDPOINTS = {'general': READ_METHODS,
+             'librarian': READ_METHODS + ['add_user', 'update_user', 'remove_user', 'add_book', 'update_book', 'remove_book', 'update_author', 'update_borrow', 'member_token'],
+             'member': READ_METHODS + ['borrow_book', 'return_book', 'place_hold', 'cancel_hold']}
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# member methods that act for a user, and the argument naming that user. Calls to them need the user's token (see member_token).
+MEMBER_ARGUMENTS = {'borrow_book': 'borrower', 'return_book': 'borrower', 'place_hold': 'username', 'cancel_hold': 'username'}
+
+# biggest request body accepted, in bytes.
+MAX_BODY_SIZE = 1_000_000
+
+# the token the librarian endpoints need, None turns them off.
+API_TOKEN = os.environ.get('LIBRARY_API_TOKEN') or None
+
+
+
+class _ThreadOutput(io.TextIOBase):
+    """ Stands in for sys.stdout while the server runs. Calls run side by side in threads, so what each one prints is kept apart
+        for its own reply, everything else goes to the real stdout. """
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+
+    def _target(self):
+        buffer = getattr(self.local, 'buffer', None)
+        return self.stdout if buffer is None else buffer
+
+
+    def write(self, text):
+        return self._target().write(text)
+
+
+    def flush(self):
+        self._target().flush()
+
+
+    @contextmanager
+    def capture(self):
+        """ Keeps what this thread prints while inside. Use as 'with output.capture() as printed:'. """
+        self.local.buffer = io.StringIO()
+        try:
+            yield self.local.buffer
+        finally:
+            self.local.buffer = None
+
+
+
+class ApiServer():
+    def __init__(self, file='data/storage.json', backend='journal', token=API_TOKEN):
+        # all three share the same repository, so a borrow made by one kiosk is seen by every other right away.
+        self.services = {'general': GeneralServices(file, backend),
+                         'librarian': LibrarianServices(file, backend),
+                         'member': MemberServices(file, backend)}
+        self.repository = self.services['general'].repository
+        self.token = token
+        self.output = _ThreadOutput(sys.stdout)
+
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """ Serves clients until the program is stopped. """
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f'Serving the library on http://{host}:{port}/ (Ctrl+C to stop)')
+        if self.token is None:
+            print('Librarian endpoints are turned off, set LIBRARY_API_TOKEN to turn them on.')
+
+        sys.stdout = self.output
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sys.stdout = self.output.stdout
+
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ Answers every request sent over one connection, until the client closes it. """
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and method is not None
+                if method is None:
+                    status, reply = 400, _error_reply('BadRequest', 'Malformed HTTP request.')
+                elif int(headers.get('content-length', 0) or 0) > MAX_BODY_SIZE:
+                    # the body was never read, so the connection can't be used for another request.
+                    status, reply = 413, _error_reply('BadRequest', 'Request body is too large.')
+                    keep_alive = False
+                else:
+                    status, reply = await self.dispatch(method, path, headers, body)
+                await self.write_response(writer, status, reply, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader):
+        """ Reads one HTTP request.
+
+            Returns:
+                tuple: The method, path, headers, and body, (None, None, {}, b'') if it's malformed, or None once the client is gone. """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+
+        parts = request_line.decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if len(parts) != 3:
+            return None, None, {}, b''
+
+        length = headers.get('content-length', '0')
+        if not length.isdigit():
+            return None, None, {}, b''
+        body = await reader.readexactly(int(length)) if 0 < int(length) <= MAX_BODY_SIZE else b''
+        return parts[0].upper(), parts[1], headers, body
+
+
+    @staticmethod
+    async def write_response(writer: asyncio.StreamWriter, status: int, reply: dict, keep_alive: bool):
+        content = json.dumps(reply, default=_to_json).encode('utf-8')
+        head = (f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(content)}\r\n'
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + content)
+        await writer.drain()
+
+
+    async def dispatch(self, method: str, path: str, headers: dict, body: bytes):
+        """ Finds the service method for the request and calls it.
+
+            Returns:
+                tuple: The HTTP status and the reply. """
+        # 'GET /' lists every endpoint.
+        if path.rstrip('/') == '' and method == 'GET':
+            return 200, {'ok': True, 'result': ENDPOINTS}
+
+        # 'GET /metrics' gives the timings and counters so far (see data.instrumentation), if they're turned on.
+        if path.rstrip('/') == '/metrics' and method == 'GET':
+            if metrics is None:
+                return 404, _error_reply('NotFound', 'Metrics are turned off, set LIBRARY_METRICS to turn them on.')
+            return 200, {'ok': True, 'result': metrics.to_json()}
+
+        service_name, _, method_name = path.strip('/').partition('/')
+        if method_name not in ENDPOINTS.get(service_name, []):
+            return 404, _error_reply('NotFound', f"No such endpoint: '{path}'.")
+        if method != 'POST':
+            return 405, _error_reply('MethodNotAllowed', 'Endpoints are only called with POST.')
+        if service_name == 'librarian':
+            if self.token is None:
+                return 403, _error_reply('Forbidden', 'Librarian endpoints are turned off, set LIBRARY_API_TOKEN to turn them on.')
+            if not self.is_authorized(headers):
+                return 401, _error_reply('Unauthorized', "Librarian endpoints need 'Authorization: Bearer <token>'.")
+
+        try:
+            arguments = json.loads(body) if body.strip() else []
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return 400, _error_reply('BadRequest', 'Request body is not valid JSON.')
+        if not isinstance(arguments, (list, dict)):
+            return 400, _error_reply('BadRequest', 'Request body must be a JSON list of arguments or an object of keyword arguments.')
+
+        if service_name == 'librarian' and method_name == 'member_token':
+            return self.issue_member_token(arguments)
+
+        service_method = getattr(self.services[service_name], method_name)
+        if service_name == 'member' and method_name in MEMBER_ARGUMENTS:
+            if self.token is None:
+                return 403, _error_reply('Forbidden', 'Member endpoints are turned off, set LIBRARY_API_TOKEN to turn them on.')
+            try:
+                username = _argument(service_method, arguments, MEMBER_ARGUMENTS[method_name])
+            except TypeError as e:
+                return 400, _error_reply('BadRequest', str(e))
+            if not self.is_authorized(headers, username):
+                return 401, _error_reply('Unauthorized', f"Calls for '{username}' need 'Authorization: Bearer <their member token>'.")
+
+        # calls run in worker threads so a slow one (eg, a reload or a save) doesn't hold up the other clients.
+        # the services' own locks let reads run side by side, and writes one at a time.
+        return await asyncio.to_thread(self.call, service_method, arguments)
+
+
+    def is_authorized(self, headers: dict, username=None):
+        """ Checks the request's token. Calls made for a user (username) also take that user's member token.
+
+            Returns:
+                bool: True if the request sent the librarian token (or the user's member token), otherwise False. """
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        if scheme.lower() != 'bearer':
+            return False
+        token = token.strip().encode('utf-8')
+        if hmac.compare_digest(token, self.token.encode('utf-8')):
+            return True
+        return isinstance(username, str) and hmac.compare_digest(token, self.member_token(username).encode('utf-8'))
+
+
+    def member_token(self, username: str):
+        """ Makes the user's token from the librarian token, so none has to be stored and it can't be made without it.
+
+            Returns:
+                str: The token. """
+        return hmac.new(self.token.encode('utf-8'), username.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+    def issue_member_token(self, arguments):
+        """ Gives a librarian the token of an existing user.
+
+            Returns:
+                tuple: The HTTP status and the reply. """
+        try:
+            username = _argument(self.member_token, arguments, 'username')
+        except TypeError as e:
+            return 400, _error_reply('BadRequest', str(e))
+        if not isinstance(username, str) or not self.services['general'].check.exists(username=username):
+            return 404, _error_reply('NameNotFoundError', f"User, '{username}', cannot be found in the database for 'accounts'!")
+        return 200, {'ok': True, 'result': self.member_token(username), 'output': ''}
+
+
+    def call(self, service_method, arguments):
+        """ Calls the service method, keeping what it prints for the reply.
+
+            Returns:
+                tuple: The HTTP status and the reply. """
+        # picks up changes saved by other programs (eg, a CLI session) on the same storage.
+        self.repository.refresh()
+
+        with self.output.capture() as output:
+            try:
+                if isinstance(arguments, dict):
+                    result = service_method(**arguments)
+                else:
+                    result = service_method(*arguments)
+            except StorageConflictError as e:
+                return 409, _error_reply(type(e).__name__, str(e), output.getvalue())
+            except (Error, ValueError) as e:
+                return 400, _error_reply(type(e).__name__, str(e), output.getvalue())
+            except TypeError as e:
+                # wrong arguments for the method.
+                return 400, _error_reply('BadRequest', str(e), output.getvalue())
+            except Exception as e:
+                return 500, _error_reply(type(e).__name__, str(e), output.getvalue())
+
+        return 200, {'ok': True, 'result': result, 'output': output.getvalue()}
+
+
+
+def _to_json(value):
+    # results like pages and model objects are sent as their records.
+    return value.to_record() if hasattr(value, 'to_record') else str(value)
+
+
+def _argument(method, arguments, name: str):
+    """ Finds the argument the call would pass as name, whether it's sent in the list or by keyword.
+
+        Returns:
+            obj: The argument's value. Raises TypeError if the arguments don't fit the method. """
+    bound = inspect.signature(method).bind(*arguments) if isinstance(arguments, list) else inspect.signature(method).bind(**arguments)
+    return bound.arguments.get(name)
+
+
+def _error_reply(error: str, message: str, output=''):
+    return {'ok': False, 'error': error, 'message': message, 'output': output}
+
+
+def run_server(file='data/storage.json', host='127.0.0.1', port=8080, backend='journal'):
+    """ Starts the server and serves clients until the program is stopped. """
+    if not os.path.exists(file):
+        with open(file, 'w') as create_file:
+            json.dump(DEFAULT_DATASETS, create_file, indent=4)
+
+    try:
+        asyncio.run(ApiServer(file, backend).serve(host, port))
+    except KeyboardInterrupt:
+        print('\nServer stopped. Goodbye!')
@@ -0,0 +1,150 @@
+""" This is where commands are run from a file (or stdin) instead of being typed in, eg, for nightly maintenance.
+
+    Usage: python main.py --batch commands.txt [--role librarian] [--user admin] [--dry-run]
+
+    Each line is a command followed by its answers, in the order the command asks for them (quote answers with spaces):
+
+        # lines starting with '#' are skipped
+        as member
+        return_book "The Hobbit" ann
+        as librarian
+        update_user ann role librarian
+        add_book Dune Herbert 3 n
+
+    'as <role> [username]' switches the role (and user) for the lines after it. Every line runs against the same loaded data and
+    everything is saved in one write at the end. A line that fails is undone on its own and reported, the other lines are still saved. """
+
+from services import LibrarianServices, MemberServices
+from services.error import Error
+from data import StorageConflictError
+from .acc_verify import DEFAULT_DATASETS
+from .actions import run_command, answers_from
+from .help import librarian_commands, member_commands
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import shlex
+
+
+ROLES = ['librarian', 'member']
+
+# commands only one of the roles can use. Everything else (general and system commands) can be used by both.
+ROLE_ONLY_COMMANDS = {'librarian': set(librarian_commands), 'member': set(member_commands)}
+
+
+
+class BatchReport():
+    def __init__(self):
+        # (line number, command, 'ok' or the error, what the command printed) of every command that was run.
+        self.results = []
+        self.failed = 0
+        self.saved = False
+
+
+    def add(self, line_number: int, command: str, error=None, output=''):
+        self.results.append((line_number, command, error or 'ok', output))
+        if error is not None:
+            self.failed += 1
+
+
+    def summary(self):
+        """ Returns:
+                dict: The number of commands that succeeded and failed, whether the changes were saved, and every line's result. """
+        return {'succeeded': len(self.results) - self.failed, 'failed': self.failed, 'saved': self.saved, 'results': self.results}
+
+
+
+def is_denied(command: str, role: str):
+    """ Returns:
+            bool: True if the command is only for the other role, otherwise False. """
+    command = command.lower()
+    return any(command in commands for other_role, commands in ROLE_ONLY_COMMANDS.items() if other_role != role)
+
+
+def read_commands(lines):
+    """ Splits each line into its command and answers. Blank lines and comments are skipped.
+
+        Returns:
+            generator: (line number, command, answers) of each command, or (line number, None, error) for lines that can't be read. """
+    for line_number, line in enumerate(lines, start=1):
+        try:
+            words = shlex.split(line, comments=True)
+        except ValueError as e:
+            yield line_number, None, f'Unreadable line: {e}'
+            continue
+        if words:
+            yield line_number, words[0], words[1:]
+
+
+def run_batch(lines, role='librarian', user=None, file='data/storage.json', backend='journal', dry_run=False):
+    """ Runs every command in lines and saves their changes together at the end (unless dry_run).
+
+        Returns:
+            dict: The number of commands that succeeded and failed, whether the changes were saved, and every line's result. """
+    if role not in ROLES:
+        raise ValueError(f"Role must be one of {', '.join(ROLES)}.")
+    if not os.path.exists(file):
+        with open(file, 'w') as create_file:
+            json.dump(DEFAULT_DATASETS, create_file, indent=4)
+
+    # both roles share one loaded copy of the data.
+    librarian = LibrarianServices(file, backend)
+    services = {'librarian': librarian, 'member': MemberServices(file, backend, librarian.repository)}
+    report = BatchReport()
+
+    try:
+        # no other thread or session saves in the middle of the batch, and everything is saved in one write when the transaction ends.
+        with librarian.repository.writing(), librarian.transaction() as transaction:
+            for line_number, command, answers in read_commands(lines):
+                if command is None:
+                    report.add(line_number, '', answers)
+                    continue
+                if command.lower() in ('stop', 'end'):
+                    break
+                if command.lower() == 'as':
+                    if not answers or answers[0] not in ROLES:
+                        report.add(line_number, command, f"Role must be one of {', '.join(ROLES)}.")
+                        continue
+                    role, user = answers[0], answers[1] if len(answers) > 1 else user
+                    continue
+
+                if is_denied(command, role):
+                    report.add(line_number, command, f"AccessDenied: '{command}' can't be used by a {role}.")
+                    continue
+
+                savepoint = transaction.savepoint()
+                output = io.StringIO()
+                try:
+                    with redirect_stdout(output), answers_from(answers) as remaining:
+                        run_command(command, (role, user), services[role])
+                        unused = list(remaining)
+                    if unused:
+                        raise ValueError(f"Too many answers, {', '.join(map(repr, unused))} weren't used.")
+                except (Error, ValueError, TypeError, AttributeError) as e:
+                    # anything else going wrong in the command (eg, a bug) is reported as what it is, and only that line is undone.
+                    transaction.rollback_to(savepoint)
+                    report.add(line_number, command, f'{type(e).__name__}: {e}', output.getvalue())
+                else:
+                    report.add(line_number, command, output=output.getvalue())
+
+            if dry_run:
+                transaction.rollback_to(0)
+    except StorageConflictError as e:
+        # nothing was saved, the whole batch has to be run again.
+        report.add(0, 'save', f'{type(e).__name__}: {e}')
+        return report.summary()
+
+    report.saved = not dry_run
+    return report.summary()
+
+
+def print_report(summary: dict):
+    """ Prints every line's result (with what the command printed), then the totals. """
+    for line_number, command, result, output in summary['results']:
+        print(f'Line {line_number} ({command}): {result}')
+        for line in output.strip('\n').splitlines():
+            print(f'    {line}')
+
+    saved = 'saved' if summary['saved'] else 'not saved'
+    print(f"\n{summary['succeeded']} succeeded, {summary['failed']} failed. Changes {saved}.")
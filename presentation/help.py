@@ -2,13 +2,17 @@
 
 
 general_commands = {
-    "search": "Let's you lookup more info about a specific user, book, or author.", 
+    "search": "Let's you lookup more info about a specific user, book, or author. Search 'catalog' to look through titles, authors, and genres by keywords.", 
     "is_available": "Let's you see if a book is currently available for borrow.",
     "user_borrow_history": "Lets's you see the list of books borrowed by the specified user.",
     "book_borrow_history": "Let's you see the list of users who are currently borrowing a specific book.",
     "get_written_books": "Let's you see all the books written by the specified author.",
+    "overdue_loans": "Let's you see the books that weren't returned by their deadline as of a given date (YYYY-MM-DD, or empty for today).",
+    "holds_of": "Let's you see the users waiting for a copy of a specific book, in the order they'll get it.",
     "user_metrics": "Let's you see all the users currently registered in the database.",
-    "book_metrics": "Let's you see all the books in the library."
+    "book_metrics": "Let's you see all the books in the library.",
+    "circulation_metrics": "Let's you see how many books are borrowed, and the most borrowed books, genres, authors, and the top borrowers.",
+    "cache_metrics": "Let's you see how many lookups were answered from the cache instead of being looked up again."
     }
 
 
@@ -20,13 +24,16 @@ librarian_commands = {
     "update_author": "For updating the details of the specified author. Can only update information one at a time.",
     "update_borrow": "For updating the details of the specified borrow information. Can only update information one at a time.",
     "remove_user": "For removing a specific user from the program.",
-    "remove_book": "For removing a book from the library."
+    "remove_book": "For removing a book from the library.",
+    "bulk_import": "For importing books, users, or authors all at once from a CSV or JSONL file."
 }
 
 
 member_commands = {
     "borrow_book": "Let's the user borrow a book from the library if available. Return deadline is two weeks.",
-    "return_book": "Let's the user return a book they have borrowed back to the library."
+    "return_book": "Let's the user return a book they have borrowed back to the library. The copy goes to the next user waiting for it, if any.",
+    "place_hold": "Let's the user wait for a book with no copies left. They borrow it automatically once a copy is returned.",
+    "cancel_hold": "Let's the user stop waiting for a book."
 }
 
 
@@ -1,4 +1,5 @@
-from .generate_id import generate_unique_id
+from .generate_id import IdAllocator
 from .validation import Check
-from .error import EmptyValueError, NameTakenError, NameNotFoundError, InvalidAgeError, InvalidChangeError, InvalidEmailError, InvalidQuantityError, BookUnavailableError, BorrowLimitError
-from .operations import GeneralServices, LibrarianServices, MemberServices
\ No newline at end of file
+from .error import EmptyValueError, NameTakenError, NameNotFoundError, InvalidAgeError, InvalidChangeError, InvalidEmailError, InvalidQuantityError, BookUnavailableError, BorrowLimitError, HoldError, ReturnError
+from .operations import GeneralServices, LibrarianServices, MemberServices
+from .catalog import CatalogServices
\ No newline at end of file
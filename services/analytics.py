@@ -0,0 +1,208 @@
+""" This is where circulation statistics are kept. They're updated on every change to the borrows and the library (as an observer of the data handlers),
+    so none of them ever has to go through the borrows dataset to be answered.
+
+    Every time a book is borrowed counts, including a user borrowing the same book again (see Borrow.times_borrowed). Only the borrows of
+    books in the library are counted, so a removed book drops out of every statistic at once (and comes back if it's added again). """
+
+from model import NO_DATE
+from itertools import islice
+import threading
+
+
+
+class Ranking():
+    """ A count per key (eg, borrows per title), kept grouped by count so the top k keys are found without sorting every key. """
+    def __init__(self):
+        self.counts = {}
+        # count -> keys with that count (a dict is used as an ordered set, so ties come out in the order they were reached)
+        self.keys_by_count = {}
+        self.highest = 0
+
+
+    def add(self, key, amount=1):
+        """ Adds amount (can be negative) to the key's count. Keys whose count drops to 0 are dropped. """
+        if key is None or amount == 0:
+            return
+
+        old = self.counts.get(key, 0)
+        new = old + amount
+        if old:
+            keys = self.keys_by_count[old]
+            del keys[key]
+            if not keys:
+                del self.keys_by_count[old]
+
+        if new > 0:
+            self.counts[key] = new
+            self.keys_by_count.setdefault(new, {})[key] = None
+        else:
+            self.counts.pop(key, None)
+
+        if new > self.highest:
+            self.highest = new
+        while self.highest and self.highest not in self.keys_by_count:
+            self.highest -= 1
+
+
+    def count(self, key):
+        """ Returns:
+                int: The key's count, 0 if it has none. """
+        return self.counts.get(key, 0)
+
+
+    def top(self, k: int):
+        """ Returns:
+                list: (key, count) of the k keys with the highest counts, highest first. """
+        results = []
+        count = self.highest
+        while count > 0 and len(results) < k:
+            keys = self.keys_by_count.get(count)
+            if keys:
+                results.extend((key, count) for key in islice(keys, k - len(results)))
+            count -= 1
+        return results
+
+
+
+class CirculationStats():
+    def __init__(self, data):
+        self.rebuild(data)
+
+
+    def rebuild(self, data):
+        """ Drops the statistics. They're built again from the data the first time they're used. """
+        self.data = data
+        self.built = False
+        self.build_lock = threading.Lock()
+
+        # every time a book was borrowed, and the borrow records not returned yet.
+        self.loans = 0
+        self.active_loans = 0
+
+        # times borrowed per title, per borrower, per genre, and per author.
+        self.by_title = Ranking()
+        self.by_borrower = Ranking()
+        self.by_genre = Ranking()
+        self.by_author = Ranking()
+
+        # books not returned yet per borrower.
+        self.active_by_borrower = Ranking()
+
+
+    def _build(self):
+        """ Counts every borrow from scratch, if it wasn't done yet. """
+        if self.built:
+            return
+
+        with self.build_lock:
+            if self.built:
+                return
+            library = self.data.get('library', {})
+            for title, borrowers in self.data.get('borrows', {}).items():
+                book = library.get(title)
+                for borrower, borrow_info in borrowers.items():
+                    self._count_borrow(title, borrower, borrow_info, book, 1)
+            self.built = True
+
+
+    def _count_borrow(self, title: str, borrower: str, borrow_info: dict, book, amount: int):
+        """ Adds (amount=1) or takes away (amount=-1) a borrow record of the book from every statistic. Borrows of books that aren't in the library (book is None) aren't counted. """
+        if book is None:
+            return
+
+        times_borrowed = (borrow_info.get('times_borrowed') or 1) * amount
+        self.loans += times_borrowed
+        self.by_title.add(title, times_borrowed)
+        self.by_borrower.add(borrower, times_borrowed)
+        self.by_genre.add(book.get('genre'), times_borrowed)
+        self.by_author.add(book.get('author'), times_borrowed)
+
+        if borrow_info.get('returned_on', NO_DATE) in (NO_DATE, None):
+            self.active_loans += amount
+            self.active_by_borrower.add(borrower, amount)
+
+
+    def on_change(self, dataset: str, keys: tuple, old, new):
+        """ Updates the statistics after a borrow or a book was added, changed, or removed. """
+        if not self.built:
+            return
+
+        if dataset == 'borrows':
+            title, borrower = keys
+            book = self.data.get('library', {}).get(title)
+            if old is not None:
+                self._count_borrow(title, borrower, old, book, -1)
+            if new is not None:
+                self._count_borrow(title, borrower, new, book, 1)
+
+        elif dataset == 'library':
+            # a book's borrows count for its current genre and author, and not at all once it's removed.
+            title, = keys
+            if old is not None and new is not None and (old.get('genre'), old.get('author')) == (new.get('genre'), new.get('author')):
+                return
+            for borrower, borrow_info in self.data.get('borrows', {}).get(title, {}).items():
+                self._count_borrow(title, borrower, borrow_info, old, -1)
+                self._count_borrow(title, borrower, borrow_info, new, 1)
+
+
+    def totals(self):
+        """ Returns:
+                dict: The number of users, books, authors, times books were borrowed, and books not returned yet. """
+        self._build()
+        return {'users': len(self.data.get('accounts', {})),
+                'books': len(self.data.get('library', {})),
+                'authors': len(self.data.get('authors', {})),
+                'loans': self.loans,
+                'active_loans': self.active_loans}
+
+
+    def most_borrowed(self, k=10):
+        """ Returns:
+                list: (title, borrows) of the k most borrowed books. """
+        self._build()
+        return self.by_title.top(k)
+
+
+    def top_genres(self, k=10):
+        """ Returns:
+                list: (genre, borrows) of the k most borrowed genres. """
+        self._build()
+        return self.by_genre.top(k)
+
+
+    def top_authors(self, k=10):
+        """ Returns:
+                list: (author, borrows) of the k authors whose books were borrowed most. """
+        self._build()
+        return self.by_author.top(k)
+
+
+    def top_borrowers(self, k=10):
+        """ Returns:
+                list: (username, borrows) of the k users who borrowed most. """
+        self._build()
+        return self.by_borrower.top(k)
+
+
+    def borrows_of(self, username: str):
+        """ Returns:
+                tuple: How many books the user borrowed, and how many of those they didn't return yet. """
+        self._build()
+        return self.by_borrower.count(username), self.active_by_borrower.count(username)
+
+
+    def borrows_of_title(self, title: str):
+        """ Returns:
+                int: How many times the book was borrowed. """
+        self._build()
+        return self.by_title.count(title)
+
+
+    def borrows_of_genre(self, genre: str):
+        self._build()
+        return self.by_genre.count(genre)
+
+
+    def borrows_of_author(self, author: str):
+        self._build()
+        return self.by_author.count(author)
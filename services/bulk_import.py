@@ -0,0 +1,79 @@
+""" This is where records are streamed from CSV/JSONL files for bulk imports. Rows are read one at a time so memory stays the same no matter how big the file is. """
+
+from itertools import islice
+import csv
+import json
+
+
+# fields that have to be converted from text when read from a CSV file.
+INTEGER_FIELDS = ['age', 'quantity']
+
+# how many row errors are kept in the report. The rest are only counted.
+MAX_REPORTED_ERRORS = 1000
+
+
+
+def read_records(path: str):
+    """ Streams the rows of a CSV (with a header row) or JSONL file. Files ending in '.jsonl'/'.json' are read as JSONL, everything else as CSV.
+
+        Yields:
+            tuple: The line number and the row as a dict, or the line number and the error if the line can't be read. """
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        if path.endswith(('.jsonl', '.json')):
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, e
+        else:
+            # the header is line 1, so rows start at line 2.
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                yield line_number, _convert_csv_row(row)
+
+
+def _convert_csv_row(row: dict):
+    """ Drops empty columns and turns number columns back into ints.
+
+        Returns:
+            dict: The converted row. """
+    record = {field: value.strip() for field, value in row.items() if field and value is not None and value.strip()}
+    for field in INTEGER_FIELDS:
+        if field in record and record[field].lstrip('-').isdigit():
+            record[field] = int(record[field])
+    return record
+
+
+def batched(records, size: int):
+    """ Groups the records into lists of (at most) size, without reading ahead more than one batch.
+
+        Yields:
+            list: The next batch of records. """
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+
+class ImportReport():
+    def __init__(self, path: str):
+        self.path = path
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+
+    def add_error(self, line_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+
+    def summary(self):
+        """ Returns:
+                dict: The number of imported and failed rows, with the (first) row errors. """
+        return {'file': self.path, 'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
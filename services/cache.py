@@ -0,0 +1,145 @@
+""" This is where the results of read queries (eg, a book's borrowers) are cached. Each cached result is tagged with the records it was
+    computed from, and it's dropped as soon as one of them is added, changed, or removed (as an observer of the data handlers),
+    so a cached answer is never older than the data. The least recently used results are dropped once the cache is full.
+
+    The size can be set with LIBRARY_CACHE_SIZE (0 turns the cache off). """
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import functools
+import inspect
+import os
+import threading
+
+
+CACHE_SIZE = int(os.environ.get('LIBRARY_CACHE_SIZE') or 1024)
+
+
+
+class ResultCache():
+    def __init__(self, data, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # set per thread while the cache is bypassed (eg, while streaming a whole listing).
+        self.local = threading.local()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rebuild(data)
+
+
+    def rebuild(self, data):
+        """ Drops every cached result, since the data was reloaded. """
+        with self.lock:
+            # key -> (result, tags), least recently used first.
+            self.entries = OrderedDict()
+            # (dataset, name) -> keys of the results computed from it. (dataset, None) is for results that depend on the whole dataset.
+            self.keys_by_tag = {}
+
+
+    @contextmanager
+    def bypass(self):
+        """ Doesn't look up or keep results in this thread while inside. Use as 'with cache.bypass():'. """
+        previous, self.local.bypassed = getattr(self.local, 'bypassed', False), True
+        try:
+            yield
+        finally:
+            self.local.bypassed = previous
+
+
+    def is_bypassed(self):
+        return self.max_size <= 0 or getattr(self.local, 'bypassed', False)
+
+
+    def get(self, key):
+        """ Returns:
+                tuple: Whether the result was cached, and the result. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+
+    def put(self, key, result, tags: list):
+        """ Keeps the result, dropping the least recently used one if the cache is full. """
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (result, tags)
+            for tag in tags:
+                self.keys_by_tag.setdefault(tag, set()).add(key)
+
+            while len(self.entries) > self.max_size:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+
+    def _drop(self, key):
+        result, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_tag[tag]
+
+
+    def on_change(self, dataset: str, keys: tuple, old, new):
+        """ Drops the results computed from the changed record, and those that depend on its whole dataset. """
+        with self.lock:
+            for tag in ((dataset, keys[0] if keys else None), (dataset, None)):
+                for key in list(self.keys_by_tag.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+
+    def stats(self):
+        """ Returns:
+                dict: The number of cached results, hits, misses, evictions, invalidations, and the hit rate. """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self.entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'invalidations': self.invalidations,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+
+def cached(depends_on):
+    """ Method decorator that caches the method's result in its object's cache (self.cache), per arguments.
+        depends_on gets the call's arguments (by name) and returns (dataset, name) of each record the result is computed from,
+        eg, lambda title, **rest: [('library', title)]. A name of None means the result depends on the whole dataset. Errors aren't cached.
+
+        Returns:
+            function: The decorator. """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = self.cache
+            if cache.is_bypassed():
+                return method(self, *args, **kwargs)
+
+            arguments = signature.bind(self, *args, **kwargs)
+            arguments.apply_defaults()
+            arguments = dict(list(arguments.arguments.items())[1:])
+            key = (method.__name__,) + tuple(arguments.items())
+            try:
+                found, result = cache.get(key)
+            except TypeError:
+                # arguments that can't be hashed (eg, lists) aren't cached.
+                return method(self, *args, **kwargs)
+            if found:
+                return result
+
+            result = method(self, *args, **kwargs)
+            cache.put(key, result, list(depends_on(**arguments)))
+            return result
+        return wrapper
+    return decorator
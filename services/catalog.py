@@ -0,0 +1,106 @@
+""" This is where the read-only lookups are handled for processes that only look books and authors up (eg, a catalog kiosk).
+    Unlike GeneralServices, nothing is loaded: every lookup goes through the memory-mapped catalog (see data.catalog). """
+
+from data import Catalog, FileLock, catalog_path_of, instrumented_class, open_storage, write_catalog
+from .validation import Check
+from .error import EmptyValueError, NameNotFoundError, BookUnavailableError
+from .pagination import paginate, decode_cursor
+from .inventory import copies_owned
+from itertools import islice
+import os
+
+
+
+@instrumented_class('service.catalog')
+class CatalogServices():
+    def __init__(self, file='data/storage.json', backend='journal', catalog_file=None):
+        self.file = file
+        catalog_file = catalog_file or catalog_path_of(file)
+
+        # the catalog is built from the storage the first time it's needed.
+        if not os.path.exists(catalog_file):
+            with FileLock(file):
+                write_catalog(catalog_file, open_storage(file, backend).load())
+        self.catalog = Catalog(catalog_file)
+
+
+    def _book(self, title: str):
+        if Check.detect_empty_values(title):
+            raise EmptyValueError()
+        # picks up the catalog if it was built again since the last lookup.
+        self.catalog.refresh()
+        book = self.catalog.get('library', title)
+        if book is None:
+            raise NameNotFoundError(book_title=title)
+        return book
+
+
+    def _author(self, name: str):
+        if Check.detect_empty_values(name):
+            raise EmptyValueError()
+        self.catalog.refresh()
+        author = self.catalog.get('authors', name)
+        if author is None:
+            raise NameNotFoundError(author=name)
+        return author
+
+
+    def is_available(self, title: str):
+        """ Checks if a book is available for borrow, that is, it had a copy that wasn't lent out when the catalog was built
+            (same as GeneralServices.is_available, as of the catalog's version).
+
+            Returns:
+                bool: True if available, otherwise False. """
+        book = self._book(title)
+        copies_left = 0
+        if book.get('is_available') != False:
+            copies_left = max(copies_owned(book) - (self.catalog.get('copies_out', title) or 0), 0)
+
+        if copies_left == 0:
+            raise BookUnavailableError(title)
+        print(f"Book requested, '{title}', is available for borrow! ({copies_left} of {book['quantity']} copies left)")
+        return True
+
+
+    def search(self, what_to_search: str, name: str, limit=10):
+        """ Looks up a book or author by its exact name and prints it. If there's none, the ones whose name starts with it are listed instead.
+
+            Returns:
+                dict: The record if found, otherwise a list of up to limit names that start with it. """
+        datasets = {'book': 'library', 'author': 'authors'}
+        if Check.detect_empty_values(what_to_search, name):
+            raise EmptyValueError()
+        elif what_to_search not in datasets:
+            raise ValueError('Can only search for book and author in the catalog.')
+
+        self.catalog.refresh()
+        record = self.catalog.get(datasets[what_to_search], name)
+        if record is not None:
+            for field, info in record.items():
+                print(f"{field.capitalize().replace('_', ' ')}: {info}")
+            return record
+
+        matches = list(islice(self.catalog.names(datasets[what_to_search], name), limit))
+        if not matches:
+            if what_to_search == 'author':
+                raise NameNotFoundError(author=name)
+            raise NameNotFoundError(book_title=name)
+
+        print('SEARCH RESULTS:')
+        for number, match in enumerate(matches, start=1):
+            print(f'{number}. {match} ({what_to_search})')
+        return matches
+
+
+    def get_written_books(self, name: str, limit=None, cursor=None):
+        """ Gets all the books written by the specified author and prints them.
+            Pass a limit to get one page of them at a time, and the page's next_cursor to get the page after it.
+
+            Returns:
+                Page: The titles on the page. """
+        page = paginate(self._author(name)['books'], limit, cursor)
+
+        print(f'LIST OF BOOKS WRITTEN BY {name}:')
+        for number, book in enumerate(page, start=decode_cursor(cursor) + 1):
+            print(f'{number}. {book}')
+        return page
@@ -58,9 +58,11 @@ class InvalidChangeError(Error):
             message = f'Field, {name}, cannot be change for security reasons and convenience.'
         elif entity_type == 'role':
             message = "Roles are only limited to 'librarian'/'member'."
+        elif entity_type == 'type':
+            message = f"Field, {name}, cannot be change to {value!r}. The value is of the wrong type."
         else:
             message = 'An invalid change has been attempted.'
-        super.__init__(message)
+        super().__init__(message)
 
 
 class InvalidQuantityError(Error):
@@ -84,4 +86,32 @@ class BookUnavailableError(Error):
 class BorrowLimitError(Error):
     """ Raised when the user has exceeded the maximum limit for book borrows. """
     def __init__(self):
-        super().__init__("Maximum book borrow limit reached. Can't borrow more books.")
\ No newline at end of file
+        super().__init__("Maximum book borrow limit reached. Can't borrow more books.")
+
+
+class HoldError(Error):
+    """ Raised when a hold on a book can't be placed or cancelled. """
+    def __init__(self, error_type: str, title=None, username=None):
+        if error_type == 'book_available':
+            message = f"Book, '{title}', still has copies left. Borrow it instead."
+        elif error_type == 'already_holding':
+            message = f"User, '{username}', is already waiting for '{title}'."
+        elif error_type == 'already_borrowing':
+            message = f"User, '{username}', is already borrowing '{title}'."
+        elif error_type == 'no_hold':
+            message = f"User, '{username}', has no hold on '{title}'."
+        else:
+            message = 'Invalid hold.'
+        super().__init__(message)
+
+
+class ReturnError(Error):
+    """ Raised when a loan can't be returned. """
+    def __init__(self, error_type: str, title=None, borrower=None):
+        if error_type == 'already_returned':
+            message = f"Book, '{title}', was already returned by '{borrower}'."
+        elif error_type == 'inactive':
+            message = f"Loan of '{title}' by '{borrower}' is no longer active."
+        else:
+            message = 'Invalid return.'
+        super().__init__(message)
@@ -1,14 +1,61 @@
-""" This is where random and unique IDs are generated for each users that are created to ensure distinct user identifiers. """
+""" This is where unique IDs are given out for each users that are created to ensure distinct user identifiers. """
 
-from random import randint
+from data import Update, IndexManager
 
 
-def generate_unique_id(existing_id):
-    """ Generates a random unique ID for every user, once.
-     
-        Returns:
-            str: The ID that has been generated for the specific user. """
-    while True:
-        id = id = ''.join(str(randint(0, 9)) for n in range(12))
-        if id not in existing_id:
-            return f'#{id}'
\ No newline at end of file
+# where the last given-out id is kept in the 'meta' dataset.
+LAST_ID_KEY = 'last_user_id'
+
+
+
+def format_id(number: int):
+    """ Returns:
+            str: The user ID for the number (eg, '#000000000042'). """
+    return f'#{number:012d}'
+
+
+def parse_id(id: str):
+    """ Returns:
+            int: The number of a user ID, or None if it isn't one. """
+    digits = str(id).lstrip('#')
+    return int(digits) if digits.isdigit() else None
+
+
+
+class IdAllocator():
+    """ Gives out sequential user IDs. The last ID given out (high-water mark) is saved in 'meta', so no ID is ever given out twice
+        and nothing has to be checked against the existing accounts. """
+    def __init__(self, data, update: Update, indexes: IndexManager):
+        self.data = data
+        self.update = update
+        self.indexes = indexes
+
+
+    def _last_id(self):
+        """ Gets the last ID given out. For older data without one saved, it starts after the highest ID among the accounts (checked only once).
+
+            Returns:
+                int: The last ID number given out. """
+        last_id = self.data.get('meta', {}).get(LAST_ID_KEY)
+        if last_id is None:
+            numbers = [parse_id(id) for id in self.indexes.user_ids()]
+            last_id = max((number for number in numbers if number is not None), default=0)
+        return last_id
+
+
+    def reserve(self, count: int):
+        """ Reserves a range of IDs in one go (eg, for bulk imports). IDs that end up unused are simply skipped.
+
+            Returns:
+                list: The reserved IDs. """
+        if count < 1:
+            return []
+        first_id = self._last_id() + 1
+        self.update.update_meta(LAST_ID_KEY, first_id + count - 1)
+        return [format_id(number) for number in range(first_id, first_id + count)]
+
+
+    def next_id(self):
+        """ Returns:
+                str: A new unique user ID. """
+        return self.reserve(1)[0]
\ No newline at end of file
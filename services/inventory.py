@@ -0,0 +1,85 @@
+""" This is where the copies of each book are kept track of. A book's 'quantity' is how many copies the library owns, and every loan that
+    wasn't returned yet holds one of them. The number of copies out is counted per book as loans are added and returned (as an observer of
+    the data handlers), so availability is answered without going through the borrow records. """
+
+from model import NO_DATE
+import threading
+
+
+
+def copies_owned(book: dict):
+    """ Returns:
+            int: How many copies of the book the library owns (0 if its quantity isn't a number). """
+    try:
+        return max(int(book.get('quantity', 0)), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+
+class Inventory():
+    def __init__(self, data):
+        self.rebuild(data)
+
+
+    def rebuild(self, data):
+        """ Drops the counters. Each book's is counted again from its loans the first time it's asked for. """
+        self.data = data
+        self.build_lock = threading.Lock()
+
+        # title -> copies currently lent out (loans not returned yet), for the books counted so far.
+        self.checked_out = {}
+        self.counted = set()
+
+
+    def _build(self, title: str):
+        """ Counts the loans of the book, if it wasn't done yet. Only that book's loans are read (eg, with SQLite, the rest stay on disk). """
+        if title in self.counted:
+            return
+
+        with self.build_lock:
+            if title in self.counted:
+                return
+            for borrow_info in self.data.get('borrows', {}).get(title, {}).values():
+                self._count(title, borrow_info, 1)
+            self.counted.add(title)
+
+
+    def _count(self, title: str, borrow_info: dict, amount: int):
+        if borrow_info.get('returned_on', NO_DATE) not in (NO_DATE, None):
+            return
+        copies = self.checked_out.get(title, 0) + amount
+        if copies:
+            self.checked_out[title] = copies
+        else:
+            self.checked_out.pop(title, None)
+
+
+    def on_change(self, dataset: str, keys: tuple, old, new):
+        """ Updates the copies out after a loan was added, returned, or removed. """
+        if dataset != 'borrows' or keys[0] not in self.counted:
+            return
+
+        title, borrower = keys
+        if old is not None:
+            self._count(title, old, -1)
+        if new is not None:
+            self._count(title, new, 1)
+
+
+    def copies_out(self, title: str):
+        """ Returns:
+                int: How many copies of the book are lent out. """
+        self._build(title)
+        return self.checked_out.get(title, 0)
+
+
+    def copies_left(self, title: str):
+        """ Gets how many copies of the book can still be lent out. Books marked as not available (eg, withdrawn) have none left.
+
+            Returns:
+                int: The number of copies left, 0 if the book doesn't exist. """
+        book = self.data.get('library', {}).get(title)
+        if book is None or book.get('is_available') == False:
+            return 0
+        return max(copies_owned(book) - self.copies_out(title), 0)
@@ -1,43 +1,88 @@
 """ This is the MAIN LOGIC of the program, wherein the different CRUD-based operations are handled according to user roles.  """
 
-from model import User, Author, Book, Borrow
-from data import Create, Update, Delete
+from model import User, Author, Book, Borrow, Hold, DATE_FIELDS, NO_DATE, to_timestamp, format_date
+from data import Transaction, get_repository, read_locked, write_locked, instrumented_class
 from .validation import Check
-from .error import EmptyValueError, NameTakenError, NameNotFoundError, InvalidAgeError, InvalidEmailError, InvalidChangeError, InvalidQuantityError, BookUnavailableError, BorrowLimitError
-from .generate_id import generate_unique_id
+from .error import Error, EmptyValueError, NameTakenError, NameNotFoundError, InvalidAgeError, InvalidEmailError, InvalidChangeError, InvalidQuantityError, BookUnavailableError, BorrowLimitError, HoldError, ReturnError
+from .generate_id import IdAllocator
+from .search import SearchIndex
+from .overdue import OverdueIndex
+from .analytics import CirculationStats
+from .inventory import Inventory
+from .cache import ResultCache, cached
+from .pagination import PAGE_SIZE, paginate, decode_cursor, stream_pages
+from .bulk_import import ImportReport, read_records, batched
 from datetime import datetime, timedelta
-import json
 
 
 
+@instrumented_class('service')
 class GeneralServices():
-    def __init__(self, file='data/storage.json'):
+    def __init__(self, file='data/storage.json', backend='journal', repository=None):
         self.file = file
 
-        with open(file, 'r') as f:
-            self.data = json.load(f)
+        # every service in the process shares one loaded copy of the data (backend: 'journal', 'json', or 'sqlite').
+        # it's only reloaded if the file was changed on disk since it was last loaded.
+        self.repository = repository or get_repository(file, backend)
+        self.repository.refresh()
+        self.data = self.repository.data
 
         # Ensures that each data methods have only one instance and all are synched (or uses the same 'data')
-        self.create = Create(self.data, self.file)
-        self.update = Update(self.data, self.file)
-        self.delete = Delete(self.data, self.file)
-        self.check = Check(self.data, self.file)
+        self.create = self.repository.create
+        self.update = self.repository.update
+        self.delete = self.repository.delete
+        self.indexes = self.repository.indexes
+        self.check = Check(self.data, self.file, self.indexes)
+        self.ids = IdAllocator(self.data, self.update, self.indexes)
 
-        # Shorthands to ease each dataset calls
-        self.accounts = self.data['accounts']
-        self.library = self.data['library']
-        self.borrow = self.data['borrows']
-        self.authors = self.data['authors']
+        # full-text index over book titles, author names, and genres (built once per repository).
+        self.search_index = self.repository.attach('search', SearchIndex)
 
-        # For tracking total numbers of users, books, and authors
-        User.total_number = len(self.accounts)
-        Book.total_number = len(self.library)
-        Author.total_number = len(self.authors)
+        # loans that weren't returned yet, ordered by deadline (built once per repository).
+        self.overdue_index = self.repository.attach('overdue', OverdueIndex)
 
+        # totals and circulation statistics, kept up to date on every change (built once per repository).
+        self.stats = self.repository.attach('analytics', CirculationStats)
 
+        # copies lent out per book, so availability is known without going through the loans (built once per repository).
+        self.inventory = self.repository.attach('inventory', Inventory)
 
+        # results of the read queries, dropped as soon as a record they were computed from changes (shared by the whole repository).
+        self.cache = self.repository.attach('cache', ResultCache)
+
+
+    # Shorthands to ease each dataset calls. Looked up when used, so datasets that aren't needed are never loaded (eg, with sharded storage).
+    @property
+    def accounts(self):
+        return self.data['accounts']
+
+    @property
+    def library(self):
+        return self.data['library']
+
+    @property
+    def borrow(self):
+        return self.data['borrows']
+
+    @property
+    def authors(self):
+        return self.data['authors']
+
+
+    def transaction(self):
+        """ Groups multiple writes into a single save. Use as 'with self.transaction():'.
+            Everything written inside is undone if an error is raised before the block ends.
+
+            Returns:
+                Transaction: The active transaction, or a new one if none is active. """
+        if self.create.transaction is not None:
+            return self.create.transaction
+        return Transaction(self.create, self.update, self.delete)
+
+
+    @read_locked
     def is_available(self, title: str):
-        """ Checks if a book is available for borrow.
+        """ Checks if a book is available for borrow, that is, it has a copy that isn't lent out.
 
             Returns:
                 bool: True if available, otherwise False. """
@@ -46,15 +91,94 @@ class GeneralServices():
             raise EmptyValueError()
         elif not self.check.exists(book_title=title):
             raise NameNotFoundError(book_title=title)
-        elif self.library[title]['is_available'] == False:
+        elif self.inventory.copies_left(title) == 0:
             raise BookUnavailableError(title)
         else:
-            print(f"Book requested, '{title}', is available for borrow!")
+            print(f"Book requested, '{title}', is available for borrow! ({self.inventory.copies_left(title)} of {self.library[title]['quantity']} copies left)")
             return True
 
 
+    @read_locked
+    def holds_of(self, title: str):
+        """ Gets the users waiting for a copy of the book, first come first served, and prints them.
+
+            Returns:
+                list: The usernames, in the order they'll get the book. """
+        if self.check.detect_empty_values(title):
+            raise EmptyValueError()
+        elif not self.check.exists(book_title=title):
+            raise NameNotFoundError(book_title=title)
+
+        holds = self.data.get('holds', {}).get(title, {})
+        print(f'USERS WAITING FOR {title}:')
+        for number, (username, hold) in enumerate(holds.items(), start=1):
+            print(f"{number}. {username} (since {format_date(hold.get('placed_on'))})")
+        return list(holds)
+
+
+    def _lend(self, title: str, borrower: str):
+        """ Lends a copy of the book to the user: adds it to their borrow list and saves the loan, in one write. """
+        # generates the date today
+        borrowed_on = datetime.now()
+
+        # sets a two-week deadline for borrowed_on
+        borrow_deadline = borrowed_on + timedelta(days=14)
+
+        # the dates are stored as timestamps, so they can be compared and sorted (see model.dates).
+        borrowed_on = to_timestamp(borrowed_on)
+        borrow_deadline = to_timestamp(borrow_deadline)
+
+        # adds the book to the borrow_list of the user and monitors borrow count
+        borrowed_books = self.accounts[borrower]['borrowed_books']
+        borrow_count = self.accounts[borrower]['borrow_count']
+
+        # the borrow list and the borrow info are saved together in one write.
+        with self.transaction():
+            # saves the changes to the borrow list if valid, otherwise it raises an error
+            if title not in borrowed_books and borrow_count <= 10:
+                # only the new title is saved, not the whole borrow list.
+                self.update.extend_entry(['accounts', borrower, 'borrowed_books', [title]])
+            else:
+                raise BorrowLimitError()
+
+            # a user who was waiting for the book doesn't need to anymore.
+            if borrower in self.data.get('holds', {}).get(title, {}):
+                self.delete.delete_hold([title, borrower])
+
+            # creates the borrow object and saves it to the database. A user borrowing the book again replaces their old record, which is counted in.
+            previous = self.borrow.get(title, {}).get(borrower)
+            times_borrowed = (previous.get('times_borrowed') or 1) + 1 if previous is not None else 1
+            new_borrow = Borrow(title, borrower, borrowed_on, borrow_deadline, times_borrowed=times_borrowed)
+            self.create.save_borrow(new_borrow)
+
+
+    def _serve_holds(self, title: str):
+        """ Lends the copies left of the book to the users waiting for it, first come first served.
+            Holds of users that were removed are dropped, users who can't borrow it right now keep their place.
+
+            Returns:
+                list: The users who got the book. """
+        served = []
+        with self.transaction():
+            for username in list(self.data.get('holds', {}).get(title, {})):
+                if self.inventory.copies_left(title) == 0:
+                    break
+                if username not in self.accounts:
+                    self.delete.delete_hold([title, username])
+                    continue
+                try:
+                    self._lend(title, username)
+                except BorrowLimitError:
+                    continue
+                served.append(username)
+                print(f"Book, '{title}', has been lent to '{username}', who was waiting for it.")
+        return served
+
+
+    @read_locked
     def search(self, what_to_search: str, name:str):
         """ Searches for any relevant information regarding a particular item (book, user, author) and prints it.
+            Books and authors that don't match the name exactly are looked up in the catalog search instead (see search_catalog).
             
             Returns:
                 str: 'Success!' if found, otherwise None."""
@@ -62,137 +186,308 @@ class GeneralServices():
             raise EmptyValueError()
         
         match what_to_search:
+            case 'book' if not self.check.exists(book_title=name):
+                return self.search_catalog(name, 'book')
+
+            case 'author' if not self.check.exists(author_name=name):
+                return self.search_catalog(name, 'author')
+
+            case 'catalog':
+                return self.search_catalog(name)
+
             case 'user':
                 if not self.check.exists(username=name):
                     raise NameNotFoundError(username=name)
                 else:
-                    for field, info in self.accounts[name].items():
-                        print(f'{field.capitalize().replace('_', ' ')}: {info}')
+                    print('\n'.join(self._describe('accounts', name)))
                     return 'Success!'
 
             case 'book':
                 if not self.check.exists(book_title=name):
                     raise NameNotFoundError(book_title=name)
                 else:
-                    for field, info in self.library[name].items():
-                        print(f'{field.capitalize().replace('_', ' ')}: {info}')
+                    print('\n'.join(self._describe('library', name)))
                     return 'Success!'
 
             case 'author':
                 if not self.check.exists(author_name=name):
                     raise NameNotFoundError(author=name)
                 else:
-                    for field, info in self.authors[name].items():
-                        print(f'{field.capitalize().replace('_', ' ')}: {info}')
+                    print('\n'.join(self._describe('authors', name)))
                     return 'Success!'
 
 
-    def user_borrow_history(self, name: str):
-        """ Gets the list of books borrowed by the specified user and prints the list.  
+    @cached(lambda dataset, name: [(dataset, name)])
+    def _describe(self, dataset: str, name: str):
+        """ Returns:
+                tuple: Each field of the record, formatted to be printed. """
+        return tuple(f"{field.capitalize().replace('_', ' ')}: {info}" for field, info in self.data[dataset][name].items())
+
+
+    @read_locked
+    def search_catalog(self, query: str, kind=None, limit=10, cursor=None):
+        """ Searches book titles, author names, and genres. Matches whole words, prefixes, and words with a typo, ranked best first, and prints them.
+            Pass the page's next_cursor back to get the results after it.
+
+            Returns:
+                Page: (kind, name, score) of each result on the page. """
+        page = self._search_catalog_page(query, kind, limit, cursor)
+        if not page.items and cursor is None:
+            if kind == 'author':
+                raise NameNotFoundError(author=query)
+            raise NameNotFoundError(book_title=query)
+
+        print('SEARCH RESULTS:')
+        for number, (result_kind, result_name, score) in enumerate(page, start=decode_cursor(cursor) + 1):
+            print(f'{number}. {result_name} ({result_kind})')
+        return page
+
+
+    @cached(lambda query, **rest: [('library', None), ('authors', None)])
+    def _search_catalog_page(self, query: str, kind=None, limit=10, cursor=None):
+        if self.check.detect_empty_values(query):
+            raise EmptyValueError()
+        # only the results up to the end of the page are ranked.
+        end = decode_cursor(cursor) + limit + 1 if limit is not None else None
+        return paginate(self.search_index.search(query, kind, end), limit, cursor)
+
+
+    @read_locked
+    def user_borrow_history(self, name: str, limit=None, cursor=None):
+        """ Gets the list of books borrowed by the specified user and prints the list. 
+            Pass a limit to get one page of it at a time, and the page's next_cursor to get the page after it.
             
             Returns:
-                str: 'Success!' if successful, otherwise None."""   
+                Page: The titles on the page. """   
+        page = self._user_borrow_history_page(name, limit, cursor)
+
+        print(f'LIST OF BOOKS BORROWED BY {name}:')
+        for number, book in enumerate(page, start=decode_cursor(cursor) + 1):
+            print(f'{number}. {book}')
+        return page
+
+
+    @cached(lambda name, **rest: [('accounts', name)])
+    def _user_borrow_history_page(self, name: str, limit=None, cursor=None):
         if self.check.detect_empty_values(name):
             raise EmptyValueError()
         elif not self.check.exists(username=name):
             raise NameNotFoundError(username=name)
-        
-        print(f'LIST OF BOOKS BORROWED BY {name}:')
-        borrowed_books = self.accounts[name].get('borrowed_books', [])
-        for number, book in enumerate(borrowed_books, start=1):
-            print(f'{number}. {book}')
-        return 'Successful!'
+        return paginate(self.accounts[name].get('borrowed_books', []), limit, cursor)
 
 
-    def book_borrow_history(self, title: str):
-        """ Gets the list of users who borrowed the specified book and prints it.  
+    @read_locked
+    def book_borrow_history(self, title: str, limit=None, cursor=None):
+        """ Gets the list of users who borrowed the specified book and prints it.
+            Pass a limit to get one page of it at a time, and the page's next_cursor to get the page after it.
             
             Returns:
-                str: 'Successful!' if successful, otherwise None."""
-        if self.check.detect_empty_values(title):
-            raise EmptyValueError()
-        elif not self.check.exists(book_title=title):
-            raise NameNotFoundError(book_title=title)
-        elif not self.check.exists(borrow_bookname=title):
-            raise NameNotFoundError(borrowed_book=title)
+                Page: The borrow info of each borrower on the page (with their username as 'borrowed_by'). """
+        page = self._book_borrow_history_page(title, limit, cursor)
 
         print('LIST OF BORROWERS:')
-        for number, borrower in enumerate(self.borrow[title], start=1):
-            print(f'{number}. {borrower}')
-            for field, value in self.borrow[title][borrower].items():
-                print(f'{field}: {value}\n')
-            return 'Successful!'
+        for number, borrow_info in enumerate(page, start=decode_cursor(cursor) + 1):
+            print(f"{number}. {borrow_info['borrowed_by']}")
+            for field, value in borrow_info.items():
+                if field != 'borrowed_by':
+                    print(f'{field}: {format_date(value) if field in DATE_FIELDS else value}')
+            print()
+        return page
+
+
+    @cached(lambda title, **rest: [('library', title), ('borrows', title)])
+    def _book_borrow_history_page(self, title: str, limit=None, cursor=None):
+        # the records are only copied for the borrowers on the page.
+        borrowers = self._borrowers_of(title)
+        return paginate(({'borrowed_by': borrower, **borrowers[borrower]} for borrower in borrowers), limit, cursor)
+
+
+    @read_locked
+    def overdue_loans(self, as_of=None, limit=None):
+        """ Gets the books that weren't returned by their deadline, as of the given date (today by default), the most overdue first, and prints them.
+
+            Returns:
+                list: (title, borrower, deadline) of each overdue loan. """
+        as_of = to_timestamp(as_of if as_of not in (None, '') else datetime.now())
+        if as_of is None:
+            raise ValueError('A date is needed to list overdue loans.')
 
+        loans = [(title, borrower, deadline) for deadline, title, borrower in self.overdue_index.overdue(as_of, limit)]
 
-    def get_written_books(self, name: str):
-        """ Gets all the books written by the specified author.  
+        print(f'OVERDUE LOANS AS OF {format_date(as_of)}:')
+        for number, (title, borrower, deadline) in enumerate(loans, start=1):
+            print(f'{number}. {title} - borrowed by {borrower}, due {format_date(deadline)}')
+        return loans
+
+
+    @read_locked
+    def get_written_books(self, name: str, limit=None, cursor=None):
+        """ Gets all the books written by the specified author and prints them.
+            Pass a limit to get one page of them at a time, and the page's next_cursor to get the page after it.
             
             Returns:
-                list: All the books written by the author. """
+                Page: The titles on the page. """
+        page = self._written_books_page(name, limit, cursor)
+
+        print(f'LIST OF BOOKS WRITTEN BY {name}:')
+        for number, book in enumerate(page, start=decode_cursor(cursor) + 1):
+            print(f'{number}. {book}')
+        return page
+
+
+    # any book can be added to (or moved to) the author, so the page depends on the whole library.
+    @cached(lambda name, **rest: [('authors', name), ('library', None)])
+    def _written_books_page(self, name: str, limit=None, cursor=None):
         if self.check.detect_empty_values(name):
             raise EmptyValueError()
         elif not self.check.exists(author_name=name):
             raise NameNotFoundError(author=name)
-        else:
-            books_written = self.authors[name]['books']
-            for books in books_written:
-                for number, book in enumerate(books):
-                    print(number, book)
-        return books_written
+        # sorted, so the pages come out in the same order every time.
+        return paginate(sorted(self.indexes.books_of(name)), limit, cursor)
 
 
-    @classmethod
-    def user_metrics(cls):
-        """ Gets the total number of accounts created in the program.
+    def _borrowers_of(self, title: str):
+        """ Returns:
+                dict: borrower -> borrow info of everyone who borrowed the book. """
+        if self.check.detect_empty_values(title):
+            raise EmptyValueError()
+        elif not self.check.exists(book_title=title):
+            raise NameNotFoundError(book_title=title)
+        elif not self.check.exists(borrow_bookname=title):
+            raise NameNotFoundError(borrowed_book=title)
+        return self.borrow[title]
+
+
+    def stream(self, query: str, *arguments, page_size=PAGE_SIZE):
+        """ Goes through every result of a listing query ('user_borrow_history', 'book_borrow_history', 'get_written_books', or 'search_catalog')
+            without printing them, eg, for exports. Which results are gone through is settled once, when it's called, so changes saved while
+            it's going never make it skip or repeat one (results removed in the meantime are left out). After that, the data is only locked
+            while a page of borrow records is copied, so other threads can save in between pages.
+
+            Returns:
+                generator: Each result, in order. """
+        pages = {'user_borrow_history': self._user_borrow_history_page,
+                 'book_borrow_history': self._book_borrow_history_page,
+                 'get_written_books': self._written_books_page,
+                 'search_catalog': self._search_catalog_page}
+        if query not in pages:
+            raise ValueError(f"Can only stream {', '.join(pages)}.")
+
+        # whole listings would push the hot results out of the cache.
+        with self.repository.lock.reading(), self.cache.bypass():
+            if query != 'book_borrow_history':
+                # titles and search results are small, the whole listing is taken at once.
+                return stream_pages(pages[query](*arguments, limit=None).items, page_size=page_size)
+
+            # only the borrowers' names are taken up front, their records are copied a page at a time.
+            title = arguments[0] if arguments else None
+            borrowers = list(self._borrowers_of(title))
+
+        def fetch_page(page):
+            with self.repository.lock.reading():
+                records = self.borrow.get(title, {})
+                return [{'borrowed_by': borrower, **records[borrower]} for borrower in page if borrower in records]
+        return stream_pages(borrowers, fetch_page, page_size)
+
+
+    @read_locked
+    def user_metrics(self, top=5):
+        """ Gets the total number of accounts created in the program, and the users who borrowed the most.
         
             Returns:
                 int: The total number of users. """
-        print(f'The total number of users are: {User.total_number}')
-        return User.total_number
+        totals = self.stats.totals()
+        print(f"The total number of users are: {totals['users']}")
+        print(f'\nTOP BORROWERS:')
+        for number, (username, borrows) in enumerate(self.stats.top_borrowers(top), start=1):
+            print(f'{number}. {username} ({borrows} borrows, {self.stats.borrows_of(username)[1]} not returned)')
+        return totals['users']
 
 
-    @classmethod
-    def book_metrics(cls):
-        """ Gets the total number of books added to the library.
+    @read_locked
+    def book_metrics(self, top=5):
+        """ Gets the total number of books added to the library, and the most borrowed ones.
 
             Returns:
                 int: The total number of books in the library. """
-        print(f'The total number of books in the library are: {Book.total_number}')
-        return Book.total_number
+        totals = self.stats.totals()
+        print(f"The total number of books in the library are: {totals['books']}")
+        print(f'\nMOST BORROWED BOOKS:')
+        for number, (title, borrows) in enumerate(self.stats.most_borrowed(top), start=1):
+            print(f'{number}. {title} ({borrows} borrows)')
+        return totals['books']
+
+
+    @read_locked
+    def circulation_metrics(self, top=5):
+        """ Gets the totals of every entity, the loans not returned yet, and the most borrowed books, genres, and authors, and prints them.
+
+            Returns:
+                dict: The totals, and (name, borrows) of the top books, genres, authors, and borrowers. """
+        metrics = {'totals': self.stats.totals(),
+                   'books': self.stats.most_borrowed(top),
+                   'genres': self.stats.top_genres(top),
+                   'authors': self.stats.top_authors(top),
+                   'borrowers': self.stats.top_borrowers(top)}
+
+        totals = metrics['totals']
+        print(f"Users: {totals['users']}, books: {totals['books']}, authors: {totals['authors']}")
+        print(f"Borrows: {totals['loans']}, not returned yet: {totals['active_loans']}")
+        headings = {'books': 'MOST BORROWED BOOKS', 'genres': 'MOST BORROWED GENRES', 'authors': 'MOST BORROWED AUTHORS', 'borrowers': 'TOP BORROWERS'}
+        for label, heading in headings.items():
+            print(f'\n{heading}:')
+            for number, (name, borrows) in enumerate(metrics[label], start=1):
+                print(f'{number}. {name} ({borrows} borrows)')
+        return metrics
+
+
+    def cache_metrics(self):
+        """ Gets how well the read queries are served from the result cache, and prints it.
+
+            Returns:
+                dict: The number of cached results, hits, misses, evictions, invalidations, and the hit rate. """
+        stats = self.cache.stats()
+        print(f"Cached results: {stats['size']} of {stats['max_size']}")
+        print(f"Hits: {stats['hits']}, misses: {stats['misses']} (hit rate: {stats['hit_rate']:.1%})")
+        print(f"Evicted: {stats['evictions']}, dropped after a change: {stats['invalidations']}")
+        return stats
     
 
 
 
 
+@instrumented_class('service')
 class LibrarianServices(GeneralServices):
-    def __init__(self, file='data/storage.json'):
-        super().__init__(file)
+    def __init__(self, file='data/storage.json', backend='journal', repository=None):
+        super().__init__(file, backend, repository)
 
     """ USER-RELATED OPERATIONS """
-    def add_user(self, user_name: str, user_email: str, user_age: int):
+    @write_locked
+    def add_user(self, user_name: str, user_email: str, user_age: int, user_id=None):
         if self.check.detect_empty_values(user_name, user_email, user_age):
             raise EmptyValueError()
         elif self.check.exists(username=user_name):
             raise NameTakenError(user_name)
         elif not self.check.is_valid(email=user_email):
             raise InvalidEmailError()
+        elif self.check.email_taken(user_email):
+            raise NameTakenError(user_email)
         elif not self.check.is_valid(age=user_age):
             raise InvalidAgeError()
         else:
-            # generates a random unique id for the user
-            existing_ids = [user['id'] for user in self.accounts.values()]
-            id = generate_unique_id(existing_ids)
-            
-            # creates user object
-            new_user = User(user_name, user_email, user_age, id)
+            # the user's id and the new last id given out are saved together in one write.
+            with self.transaction():
+                # gives the user the next unique id (unless one was already reserved for them, eg, in bulk imports)
+                id = user_id or self.ids.next_id()
+                
+                # creates user object
+                new_user = User(user_name, user_email, user_age, id)
 
-            # increments the total number of users in the program by 1
-            User.total_number += 1
-
-            # save to json
-            self.create.save_user(new_user)
+                # save to json
+                self.create.save_user(new_user)
 
 
+    @write_locked
     def update_user(self, name, field_name, new_value):
         changes =  ['accounts', name, field_name, new_value]
 
@@ -200,19 +495,26 @@ class LibrarianServices(GeneralServices):
             raise EmptyValueError()
         elif not self.check.exists(username=name):
             raise NameNotFoundError(username=name)
-        elif not self.check.field_exists(field=field_name):
+        elif not self.check.field_exists(field_name, 'accounts'):
             raise NameNotFoundError(field=field_name)
         elif field_name == 'age' and not self.check.is_valid(age=new_value):
             raise InvalidAgeError()
         elif field_name == 'role' and not self.check.is_valid(role=new_value):
             raise InvalidChangeError('role')
-        elif field_name in ['id', 'borrow_count']:
+        elif field_name == 'email' and not self.check.is_valid(email=new_value):
+            raise InvalidEmailError()
+        elif field_name == 'email' and self.check.email_taken(new_value, name):
+            raise NameTakenError(new_value)
+        elif not self.check.is_mutable(field_name, 'accounts'):
             raise InvalidChangeError('field', field_name)
+        elif not self.check.is_valid_type(field_name, 'accounts', new_value):
+            raise InvalidChangeError('type', field_name, new_value)
         else:
             # update and save changes to json
             self.update.update_entry(changes)
 
 
+    @write_locked
     def remove_user(self, name: str):
         user_entry = ['accounts', name]
 
@@ -225,33 +527,30 @@ class LibrarianServices(GeneralServices):
 
 
     """ LIBRARY-RELATED OPERATIONS """
+    @write_locked
     def add_book(self, title:str, author: str, quantity=1, date_published='unknown', genre='unknown', age_restriction='all-ages', is_available=True):
         if self.check.detect_empty_values(title, author, quantity, date_published, genre, age_restriction, is_available):
             raise EmptyValueError()
         elif self.check.exists(book_title=title):
-            raise NameTakenError('book', title)
+            raise NameTakenError(title)
         elif quantity < 0:
             raise InvalidQuantityError('quantity_less_than_zero')
         elif not self.check.is_valid(quantity=quantity):
             raise InvalidQuantityError('quantity_not_int')
-        else:       
+        else:
             new_book = Book(title, author, quantity, date_published, genre, age_restriction, is_available)
 
-            # adds author to the database if new.
-            if author not in self.authors:
-                new_author = Author(author, books=[title])
-                self.create.save_author(new_author)
-        
-            # updates the author's written books list.
-            written_books = self.authors[author]['books']
-            if title not in written_books:
-                written_books.append(title)
-                self.update.update_entry(['authors', author, 'books', written_books])
+            # the author and the book are saved together in one write. The author's written books are looked up from the library (see IndexManager.books_of).
+            with self.transaction():
+                # adds author to the database if new.
+                if author not in self.authors:
+                    self.create.save_author(Author(author))
 
-            # saves the new book to the database
-            self.create.save_book(new_book)
+                # saves the new book to the database
+                self.create.save_book(new_book)
 
 
+    @write_locked
     def update_book(self, title: str, field_name: str, new_value):
         changes =  ['library', title, field_name, new_value]
 
@@ -259,20 +558,26 @@ class LibrarianServices(GeneralServices):
             raise EmptyValueError()
         elif not self.check.exists(book_title=title):
             raise NameNotFoundError(book_title=title)
-        elif not self.check.field_exists(field=field_name):
+        elif not self.check.field_exists(field_name, 'library'):
             raise NameNotFoundError(field=field_name)
-        elif field_name == 'quantity' and new_value < 0:
-            raise InvalidQuantityError('quantity_less_then_zero')
         elif field_name == 'quantity' and not self.check.is_valid(quantity=new_value):
             raise InvalidQuantityError('quantity_not_int')
+        elif field_name == 'quantity' and new_value < 0:
+            raise InvalidQuantityError('quantity_less_then_zero')
+        elif not self.check.is_valid_type(field_name, 'library', new_value):
+            raise InvalidChangeError('type', field_name, new_value)
         elif field_name == 'age_restriction' and new_value not in ['all-ages', 'mature']:
             raise InvalidChangeError('field', field_name, new_value)
-        elif field_name == 'is_available' and not self.check.is_valid(is_available=new_value):
-            raise ValueError(f"Field, '{field_name}', must be a string data type.")
         else:
-            self.update.update_entry(changes)
+            with self.transaction():
+                self.update.update_entry(changes)
+
+                # more copies (or the book being available again) go to the users waiting for it first.
+                if field_name in ('quantity', 'is_available'):
+                    self._serve_holds(title)
 
 
+    @write_locked
     def remove_book(self, title: str):
         book_entry = ['library', title]
 
@@ -281,28 +586,37 @@ class LibrarianServices(GeneralServices):
         elif not self.check.exists(book_title=title):
             raise NameNotFoundError(book_title=title)
         else:
-            self.delete.delete_entry(book_entry)
+            with self.transaction():
+                self.delete.delete_entry(book_entry)
+
+                # no one can get the book anymore.
+                for username in list(self.data.get('holds', {}).get(title, {})):
+                    self.delete.delete_hold([title, username])
 
 
     """ AUTHOR-RELATED OPERATIONS """
+    @write_locked
     def update_author(self, name: str, field_name: str, new_value: str):
         changes = ['authors', name, field_name, new_value]
 
         if self.check.detect_empty_values(name, field_name, new_value):
             raise EmptyValueError()
-        elif not self.check.exists(name):
+        elif not self.check.exists(author_name=name):
             raise NameNotFoundError(author=name)
-        elif not self.check.exists(field=field_name):
+        elif not self.check.field_exists(field_name, 'authors'):
             raise NameNotFoundError(field=field_name)
-        elif field_name  == 'books':
-            raise InvalidChangeError('books list', field_name)
-        elif field_name == 'age' and not self.check.is_valid(new_value):
+        elif not self.check.is_mutable(field_name, 'authors'):
+            raise InvalidChangeError('field', field_name)
+        elif field_name == 'age' and not self.check.is_valid(age=new_value):
             raise InvalidAgeError()
+        elif not self.check.is_valid_type(field_name, 'authors', new_value):
+            raise InvalidChangeError('type', field_name, new_value)
         else:
             self.update.update_entry(changes)
 
 
     """ BORROW-RELATED OPERATIONS """
+    @write_locked
     def update_borrow(self, title: str, borrower: str, field_name: str, new_value: str):
         changes = [title, borrower, field_name, new_value]
 
@@ -316,60 +630,136 @@ class LibrarianServices(GeneralServices):
         # checks if the book title and borrower exists in the borrow database.
         elif not self.check.exists(borrow_bookname=title):
             raise NameNotFoundError(borrowed_book=title)
-        elif not self.check.exists(borrow_username=borrower):
+        elif borrower not in self.indexes.borrowers_of(title):
             raise NameNotFoundError(borrower=borrower)
 
-        elif not self.check.field_exists(field=field_name):
+        elif not self.check.field_exists(field_name, 'borrows'):
             raise NameNotFoundError(field=field_name)
-        elif field_name == 'borrow_deadline' or field_name == 'borrowed_on':
+        elif not self.check.is_mutable(field_name, 'borrows'):
             raise InvalidChangeError('field', field_name)
         else:
+            # dates are stored as timestamps ('unknown' while not set).
+            if field_name in DATE_FIELDS:
+                timestamp = to_timestamp(new_value)
+                changes[3] = NO_DATE if timestamp is None else timestamp
+
+            if not self.check.is_valid_type(field_name, 'borrows', changes[3]):
+                raise InvalidChangeError('type', field_name, new_value)
             self.update.update_borrow(changes)
+
+
+    """ BULK OPERATIONS """
+    def import_records(self, kind: str, path: str, batch_size=1000):
+        """ Imports 'books', 'users', or 'authors' from a CSV (with a header row) or JSONL file.
+            Rows are streamed and saved every batch_size rows. Rows that fail validation are skipped and reported.
+
+            Returns:
+                dict: The number of imported and failed rows, with the errors per line. """
+        importers = {'books': self._import_book, 'users': self._import_user, 'authors': self._import_author}
+
+        if self.check.detect_empty_values(kind, path):
+            raise EmptyValueError()
+        elif kind not in importers:
+            raise ValueError(f"Can only import {', '.join(importers)}.")
+
+        report = ImportReport(path)
+        for batch in batched(read_records(path), batch_size):
+            # every row of the batch is saved in one write. Other threads can read (or write) in between batches.
+            with self.repository.writing(), self.transaction() as transaction:
+                # user ids are reserved for the whole batch at once.
+                reserved_ids = iter(self.ids.reserve(len(batch))) if kind == 'users' else None
+
+                for line_number, record in batch:
+                    # a row that fails halfway (eg, the book was saved but not its author) leaves nothing behind.
+                    savepoint = transaction.savepoint()
+                    try:
+                        if isinstance(record, Exception):
+                            raise ValueError(f'Unreadable line: {record}')
+                        elif not isinstance(record, dict):
+                            raise ValueError('Each line must be an object with the fields of the record.')
+                        importers[kind](record, reserved_ids)
+                        report.imported += 1
+                    except KeyError as e:
+                        transaction.rollback_to(savepoint)
+                        report.add_error(line_number, f'Missing field {e}.')
+                    except (Error, ValueError, TypeError) as e:
+                        transaction.rollback_to(savepoint)
+                        report.add_error(line_number, str(e))
+        return report.summary()
+
+
+    def _import_book(self, record: dict, reserved_ids=None):
+        # add_book also adds the author if they're new.
+        self.add_book(record['title'], record['author'], record.get('quantity', 1), record.get('date_published', 'unknown'),
+                      record.get('genre', 'unknown'), record.get('age_restriction', 'all-ages'))
+
+
+    def _import_user(self, record: dict, reserved_ids):
+        self.add_user(record['username'], record['email'], record['age'], next(reserved_ids))
+
+
+    def _import_author(self, record: dict, reserved_ids=None):
+        name = record['name']
+        if self.check.detect_empty_values(name):
+            raise EmptyValueError()
+        elif self.check.exists(author_name=name):
+            raise NameTakenError(name)
+        self.create.save_author(Author(name, record.get('age', 'unknown'), record.get('birthday', 'unknown'), record.get('nationality', 'unknown')))
         
 
 
 
+@instrumented_class('service')
 class MemberServices(GeneralServices):
-    def __init__(self, file='data/storage.json'):
-        super().__init__(file)
+    def __init__(self, file='data/storage.json', backend='journal', repository=None):
+        super().__init__(file, backend, repository)
 
     """ BORROW-RELATED OPERATIONS FOR MEMBERS """
+    @write_locked
     def borrow_book(self, title: str, borrower: str):
-           # generates the date today
-        borrowed_on = datetime.now()
-
-        # sets a two-week deadline for borrowed_on
-        borrow_deadline = borrowed_on + timedelta(days=14)
-
         if self.check.detect_empty_values(title, borrower):
             raise EmptyValueError()
         elif not self.check.exists(book_title=title):
             raise NameNotFoundError(book_title=title)
         elif not self.check.exists(username=borrower):
             raise NameNotFoundError(username=borrower)
-        elif not self.library[title]['is_available']:
+        elif self.inventory.copies_left(title) == 0:
             raise BookUnavailableError(title)
         else:
-            # this makes the dates readable (format: weekday_name, month_name day, year)
-            borrowed_on = borrowed_on.strftime("%A, %B %d, %Y")
-            borrow_deadline = borrow_deadline.strftime("%A, %B %d, %Y")
+            # checking the copies left and lending one happen under the same write lock, so two users can't get the last copy.
+            self._lend(title, borrower)
 
-            # adds the book to the borrow_list of the user and monitors borrow count
-            borrowed_books = self.accounts[borrower]['borrowed_books']
-            borrow_count = self.accounts[borrower]['borrow_count']
-            
-            # saves the changes to the borrow list if valid, otherwise it raises an error
-            if title not in borrowed_books and borrow_count <= 10:
-                updated_borrowed_list = borrowed_books.append(title)
-                self.update.update_entry('accounts', borrower, 'borrowed_books', updated_borrowed_list)
-            else:
-                raise BorrowLimitError()
 
-            # creates the borrow object and saves it to the database.
-            new_borrow = Borrow(title, borrower, borrowed_on, borrow_deadline)
-            self.create.save_borrow(new_borrow)
+    @write_locked
+    def place_hold(self, title: str, username: str):
+        """ Puts the user in line for the book when no copy is left. They get it as soon as a copy is returned, in the order holds were placed. """
+        if self.check.detect_empty_values(title, username):
+            raise EmptyValueError()
+        elif not self.check.exists(book_title=title):
+            raise NameNotFoundError(book_title=title)
+        elif not self.check.exists(username=username):
+            raise NameNotFoundError(username=username)
+        elif title in self.accounts[username]['borrowed_books']:
+            raise HoldError('already_borrowing', title, username)
+        elif username in self.data.get('holds', {}).get(title, {}):
+            raise HoldError('already_holding', title, username)
+        elif self.inventory.copies_left(title) > 0:
+            raise HoldError('book_available', title)
+        else:
+            self.create.save_hold(Hold(title, username, to_timestamp(datetime.now())))
+
+
+    @write_locked
+    def cancel_hold(self, title: str, username: str):
+        if self.check.detect_empty_values(title, username):
+            raise EmptyValueError()
+        elif username not in self.data.get('holds', {}).get(title, {}):
+            raise HoldError('no_hold', title, username)
+        else:
+            self.delete.delete_hold([title, username])
     
 
+    @write_locked
     def return_book(self, title: str, borrower: str):
         if self.check.detect_empty_values(title, borrower):
             raise EmptyValueError()
@@ -381,25 +771,35 @@ class MemberServices(GeneralServices):
         # checks if the book title and borrower exists in the borrow database.
         elif not self.check.exists(borrow_bookname=title):
             raise NameNotFoundError(borrowed_book=title)
-        elif not self.check.exists(borrow_username=borrower):
+        elif borrower not in self.indexes.borrowers_of(title):
             raise NameNotFoundError(borrower=borrower)
+
+        # a loan can only be returned once, otherwise the borrow count goes up again and the copy is handed out twice.
+        elif self.borrow[title][borrower].get('returned_on', NO_DATE) not in (NO_DATE, None):
+            raise ReturnError('already_returned', title, borrower)
+        elif self.borrow[title][borrower].get('user_status', 'active') != 'active':
+            raise ReturnError('inactive', title, borrower)
         else:
             returned_date = datetime.now()
-            return_info = [title, borrower, 'returned_on', returned_date]
+            return_info = [title, borrower, 'returned_on', to_timestamp(returned_date)]
 
             # idk what to do with late returns for borrows. I could implement a penalty system. But idk.
             if self.check._is_borrow_overdue(title, borrower, returned_date):
                 print('Book returned late.')
 
-            # increases the book borrow count of user by 1, since book has been returned.
-            borrow_count = self.accounts[borrower]['borrow_count'] + 1
-            self.update.update_entry('accounts', borrower, 'borrow_count', borrow_count)
+            # every change for the return is saved together in one write.
+            with self.transaction():
+                # increases the book borrow count of user by 1, since book has been returned.
+                borrow_count = self.accounts[borrower]['borrow_count'] + 1
+                self.update.update_entry(['accounts', borrower, 'borrow_count', borrow_count])
+
+                # removes the book title from borrow list.
+                borrowed_books = self.accounts[borrower]['borrowed_books']
+                if title in borrowed_books:
+                    self.update.update_entry(['accounts', borrower, 'borrowed_books', [book for book in borrowed_books if book != title]])
 
-            # removes the book title from borrow list.
-            borrowed_books = self.accounts[borrower]['borrowed_books']
-            if title in borrowed_books:
-                borrowed_books.remove(title)
-                self.update.update_entry('accounts', borrower, 'borrowed_books', borrowed_books)
+                # saves the update
+                self.update.update_borrow(return_info)
 
-            # saves the update
-            self.update.update_borrow(return_info)
\ No newline at end of file
+                # the returned copy goes to the next user waiting for it, if any.
+                self._serve_holds(title)
\ No newline at end of file
@@ -0,0 +1,86 @@
+""" This is where loans are kept ordered by deadline, so overdue loans can be listed without going through every borrow record. """
+
+from model import NO_DATE, to_timestamp
+from bisect import bisect_left, insort
+import threading
+
+
+
+class OverdueIndex():
+    def __init__(self, data):
+        self.rebuild(data)
+
+
+    def rebuild(self, data):
+        """ Drops the index. It's built again from the data the first time it's used. """
+        self.data = data
+        self.built = False
+        self.build_lock = threading.Lock()
+
+        # (deadline, title, borrower) of every book that wasn't returned yet, sorted by deadline.
+        self.deadlines = []
+        # (title, borrower) -> deadline, so a loan can be found in 'deadlines' without searching for it.
+        self.loans = {}
+
+
+    def _build(self):
+        """ Indexes every loan from scratch, if it wasn't built yet. """
+        if self.built:
+            return
+
+        with self.build_lock:
+            if self.built:
+                return
+            for title, borrowers in self.data.get('borrows', {}).items():
+                for borrower, borrow_info in borrowers.items():
+                    deadline = self._deadline_of(borrow_info)
+                    if deadline is not None:
+                        self.deadlines.append((deadline, title, borrower))
+                        self.loans[(title, borrower)] = deadline
+
+            # sorted once at the end instead of inserting every loan in order.
+            self.deadlines.sort()
+            self.built = True
+
+
+    @staticmethod
+    def _deadline_of(borrow_info: dict):
+        """ Returns:
+                int: The deadline of the loan, or None if the book was already returned (or it has no readable deadline). """
+        if borrow_info.get('returned_on', NO_DATE) not in (NO_DATE, None):
+            return None
+        try:
+            return to_timestamp(borrow_info.get('borrow_deadline'))
+        except ValueError:
+            return None
+
+
+    def on_change(self, dataset: str, keys: tuple, old, new):
+        """ Moves a loan in the index after it was added, changed (eg, returned), or removed. """
+        if not self.built or dataset != 'borrows':
+            return
+
+        loan = tuple(keys)
+        deadline = self.loans.pop(loan, None)
+        if deadline is not None:
+            # the loan's exact entry, found by binary search.
+            position = bisect_left(self.deadlines, (deadline,) + loan)
+            del self.deadlines[position]
+
+        deadline = self._deadline_of(new) if new is not None else None
+        if deadline is not None:
+            insort(self.deadlines, (deadline,) + loan)
+            self.loans[loan] = deadline
+
+
+    def overdue(self, as_of: int, limit=None):
+        """ Gets the loans whose deadline is before as_of, the most overdue first.
+
+            Returns:
+                list: (deadline, title, borrower) of each overdue loan. """
+        self._build()
+        # everything before the first loan due at as_of (or later) is overdue.
+        end = bisect_left(self.deadlines, (as_of,))
+        if limit is not None:
+            end = min(end, limit)
+        return self.deadlines[:end]
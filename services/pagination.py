@@ -0,0 +1,90 @@
+""" This is where listing queries (eg, a book's borrowers) are split into pages. A page holds at most 'limit' results and a cursor,
+    an opaque token that's passed back to get the page after it. A cursor is a position in the listing, so results added or removed
+    before it between two calls shift the pages after it. Whole listings that must not skip or repeat a result (eg, exports) are streamed
+    with stream_pages instead, from keys taken once. """
+
+from itertools import islice
+import base64
+import json
+
+
+# how many results are fetched at a time while streaming.
+PAGE_SIZE = 500
+
+
+
+class Page():
+    def __init__(self, items: list, next_cursor=None):
+        self.items = items
+        # None on the last page.
+        self.next_cursor = next_cursor
+
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def to_record(self):
+        """ Returns:
+                dict: The page's results and the cursor of the next page. """
+        return {'items': self.items, 'next_cursor': self.next_cursor}
+
+
+    def __repr__(self):
+        return f'Page(items={self.items!r}, next_cursor={self.next_cursor!r})'
+
+
+
+def encode_cursor(offset: int):
+    """ Returns:
+            str: The cursor of the page starting at offset. """
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """ Returns:
+            int: Where the cursor's page starts, 0 for no cursor (the first page). """
+    if cursor in (None, ''):
+        return 0
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['offset']
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError(f"Invalid cursor, '{cursor}'.")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"Invalid cursor, '{cursor}'.")
+    return offset
+
+
+def paginate(items, limit=None, cursor=None):
+    """ Takes one page out of the results. Only the results up to the end of the page are ever gone through, so items can be a lazy iterable.
+
+        Returns:
+            Page: At most limit results (every remaining one if limit is None), starting where the cursor points. """
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        raise ValueError('The page limit must be a whole number greater than 0.')
+
+    offset = decode_cursor(cursor)
+    if limit is None:
+        return Page(list(islice(items, offset, None)))
+
+    # one more result than needed tells whether there's a next page.
+    results = list(islice(items, offset, offset + limit + 1))
+    if len(results) > limit:
+        return Page(results[:limit], encode_cursor(offset + limit))
+    return Page(results)
+
+
+def stream_pages(keys: list, fetch_page=None, page_size=PAGE_SIZE):
+    """ Goes through every result of a listing whose keys were taken up front, page_size of them at a time, fetching the next page only
+        once the one before it was used up. Each key is only gone through once, so the whole listing takes one pass.
+        fetch_page gets the keys of a page and returns their results, leaving out the ones that are gone. If it's None, the keys are the results.
+
+        Returns:
+            generator: Each result, in order. """
+    for start in range(0, len(keys), page_size):
+        page = keys[start:start + page_size]
+        yield from (page if fetch_page is None else fetch_page(page))
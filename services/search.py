@@ -0,0 +1,233 @@
+""" This is where the catalog search is handled. Book titles, author names, and genres are kept in an inverted index that is updated as books and authors change. """
+
+from bisect import bisect_left, insort
+import heapq
+import re
+import threading
+
+
+# how much a match counts depending on where it was found.
+FIELD_WEIGHTS = {'title': 3.0, 'name': 3.0, 'author': 2.0, 'genre': 1.0}
+
+# how much a match counts depending on how close it was to the searched word.
+EXACT_MATCH, PREFIX_MATCH, TYPO_MATCH = 1.0, 0.6, 0.4
+
+# words shorter than this (or with digits in them) are not matched with typos, and prefixes shorter than this are not expanded.
+MIN_TYPO_LENGTH = 4
+MIN_PREFIX_LENGTH = 2
+
+# upper limit on how many indexed words a single prefix can expand to, so short prefixes stay fast.
+MAX_PREFIX_EXPANSIONS = 50
+
+
+
+def tokenize(text):
+    """ Splits the text into lowercase words.
+
+        Returns:
+            list: The words found in the text. """
+    return re.findall(r'\w+', str(text).casefold())
+
+
+def _typo_matchable(word: str):
+    """ Returns:
+            bool: True if the word can be matched with a typo, otherwise False. """
+    return len(word) >= MIN_TYPO_LENGTH and word.isalpha()
+
+
+def _deletes(word: str):
+    """ Gets the word along with every version of it with one letter removed. Two words within one typo of each other always share one of these.
+
+        Returns:
+            set: The word and its one-letter deletions. """
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _within_one_typo(a: str, b: str):
+    """ Checks if two words are at most one insertion, deletion, substitution, or swap of neighbouring letters apart.
+
+        Returns:
+            bool: True if within one typo, otherwise False. """
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+
+    # finds the first position where the words differ, then checks that the rest lines up.
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i + 2:] == b[i + 2:] and a[i:i + 2] == b[i:i + 2][::-1])
+    return a[i:] == b[i + 1:]
+
+
+
+class SearchIndex():
+    def __init__(self, data):
+        self.rebuild(data)
+
+
+    def rebuild(self, data):
+        """ Drops the index. It's built again from the data on the next search, so a reload doesn't pay for it unless someone searches. """
+        self.data = data
+        self.built = False
+        self.build_lock = threading.Lock()
+        self._bulk_loading = False
+
+        # word -> {(kind, name): weight}
+        self.postings = {}
+        # (kind, name) -> words indexed for it, so it can be removed without searching for it.
+        self.document_words = {}
+        # every indexed word, sorted, for prefix matching.
+        self.vocabulary = []
+        # one-letter deletion -> words, for typo matching.
+        self.typo_variants = {}
+
+
+    def _build(self):
+        """ Indexes every book and author from scratch, if it wasn't built yet. """
+        if self.built:
+            return
+
+        # several readers may search at the same time, only the first one builds the index.
+        with self.build_lock:
+            if self.built:
+                return
+            data = self.data
+
+            # the vocabulary is sorted once at the end instead of inserting every new word in order.
+            self._bulk_loading = True
+            for title, book in data.get('library', {}).items():
+                self._index('library', (title,), None, book)
+            for name, author in data.get('authors', {}).items():
+                self._index('authors', (name,), None, author)
+            self.vocabulary = sorted(self.postings)
+            self._bulk_loading = False
+
+            # only marked as built once it's complete, so other readers never search a half-built index.
+            self.built = True
+
+
+    def on_change(self, dataset: str, keys: tuple, old, new):
+        """ Re-indexes a book or an author after it was added, changed, or removed. """
+        # the whole index will be built from the current data anyway.
+        if self.built:
+            self._index(dataset, keys, old, new)
+
+
+    def _index(self, dataset: str, keys: tuple, old, new):
+        if dataset == 'library':
+            # changes to fields that aren't searched (eg, quantity) don't need re-indexing.
+            if old and new and (old.get('author'), old.get('genre')) == (new.get('author'), new.get('genre')):
+                return
+            document = ('book', keys[0])
+            fields = {'title': keys[0], 'author': new.get('author'), 'genre': new.get('genre')} if new else None
+        elif dataset == 'authors':
+            if old and new:
+                return
+            document = ('author', keys[0])
+            fields = {'name': keys[0]} if new else None
+        else:
+            return
+
+        self._remove(document)
+        if fields is not None:
+            self._add(document, fields)
+
+
+    def _add(self, document: tuple, fields: dict):
+        weights = {}
+        for field, text in fields.items():
+            if text in (None, 'unknown'):
+                continue
+            for word in tokenize(text):
+                weights[word] = max(weights.get(word, 0), FIELD_WEIGHTS[field])
+
+        for word, weight in weights.items():
+            if word not in self.postings:
+                self.postings[word] = {}
+                if not self._bulk_loading:
+                    insort(self.vocabulary, word)
+                if _typo_matchable(word):
+                    # lists are much smaller than sets, and only ever hold a handful of words.
+                    for variant in _deletes(word):
+                        self.typo_variants.setdefault(variant, []).append(word)
+            self.postings[word][document] = weight
+        self.document_words[document] = list(weights)
+
+
+    def _remove(self, document: tuple):
+        for word in self.document_words.pop(document, []):
+            documents = self.postings.get(word, {})
+            documents.pop(document, None)
+            if documents:
+                continue
+
+            # the word isn't used anymore, so it's dropped from every lookup.
+            del self.postings[word]
+            position = bisect_left(self.vocabulary, word)
+            if position < len(self.vocabulary) and self.vocabulary[position] == word:
+                self.vocabulary.pop(position)
+            if _typo_matchable(word):
+                for variant in _deletes(word):
+                    similar = self.typo_variants.get(variant)
+                    if similar is not None and word in similar:
+                        similar.remove(word)
+                        if not similar:
+                            del self.typo_variants[variant]
+
+
+    def _matching_words(self, query_word: str):
+        """ Finds the indexed words that match a searched word, exactly, as a prefix, or within one typo.
+
+            Returns:
+                dict: The matching words and how close each match is. """
+        matches = {}
+        if query_word in self.postings:
+            matches[query_word] = EXACT_MATCH
+
+        if len(query_word) >= MIN_PREFIX_LENGTH:
+            position = bisect_left(self.vocabulary, query_word)
+            for word in self.vocabulary[position:position + MAX_PREFIX_EXPANSIONS]:
+                if not word.startswith(query_word):
+                    break
+                matches.setdefault(word, PREFIX_MATCH)
+
+        if _typo_matchable(query_word):
+            for variant in _deletes(query_word):
+                for word in self.typo_variants.get(variant, ()):
+                    if word not in matches and _within_one_typo(query_word, word):
+                        matches[word] = TYPO_MATCH
+        return matches
+
+
+    def search(self, query: str, kind=None, limit=10):
+        """ Searches the books and authors for every word in the query. Results are ranked by how well and where they matched.
+
+            Returns:
+                list: (kind, name, score) of the best results (every result if limit is None), best first. """
+        self._build()
+        scores = None
+        for query_word in tokenize(query):
+            word_scores = {}
+            for word, closeness in self._matching_words(query_word).items():
+                for document, weight in self.postings[word].items():
+                    if kind is None or document[0] == kind:
+                        word_scores[document] = max(word_scores.get(document, 0), closeness * weight)
+
+            # every searched word has to match something in the result.
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {document: score + word_scores[document] for document, score in scores.items() if document in word_scores}
+            if not scores:
+                return []
+
+        if not scores:
+            return []
+        rank = lambda item: (-item[1], item[0][1])
+        ranked = sorted(scores.items(), key=rank) if limit is None else heapq.nsmallest(limit, scores.items(), key=rank)
+        return [(document_kind, name, round(score, 2)) for (document_kind, name), score in ranked]
@@ -1,22 +1,38 @@
 """ Where validation and checks are handled. """
 
+from data import IndexManager, instrumented_class
+from model import SCHEMAS, get_field, to_timestamp
 from datetime import datetime
 
 
+@instrumented_class('check')
 class Check():
-    def __init__(self, data, file):
+    def __init__(self, data, file, indexes: IndexManager = None):
         self.file = file
 
         if data is not None:
             self.data = data
 
-        # Shorthands to ease each dataset calls
-        self.accounts = self.data['accounts']
-        self.library = self.data['library']
-        self.authors = self.data['authors']
-        self.borrows = self.data['authors']
-        self.borrow_booklist = self.data['borrows'].keys()
-        self.borrow_userlist = [user for users in self.data['borrows'].values() for user in users]
+        # hash-based lookups (eg, borrower -> titles) that stay up to date as data is changed.
+        self.indexes = indexes or IndexManager(self.data)
+
+
+    # Shorthands to ease each dataset calls. Looked up when used, so datasets that aren't needed are never loaded.
+    @property
+    def accounts(self):
+        return self.data['accounts']
+
+    @property
+    def library(self):
+        return self.data['library']
+
+    @property
+    def authors(self):
+        return self.data['authors']
+
+    @property
+    def borrows(self):
+        return self.data['borrows']
 
 
     @staticmethod
@@ -73,36 +89,59 @@ class Check():
             
             Returns:
                 bool: True if item found (or it exists), otherwise False. """
-        if username in self.accounts:
+        # only the datasets asked about are looked up (eg, with SQLite, each lookup is a query).
+        if username is not None and username in self.accounts:
             return True
-        if book_title in self.library:
+        if book_title is not None and book_title in self.library:
             return True
-        if author_name in self.authors:
+        if author_name is not None and author_name in self.authors:
             return True
-        if borrow_bookname in self.borrow_booklist:
+        if borrow_bookname is not None and self.indexes.borrowers_of(borrow_bookname):
             return True
-        if borrow_username in self.borrow_userlist:
+        if borrow_username is not None and self.indexes.borrowed_titles(borrow_username):
             return True
         return False
         
 
-    def field_exists(self, field: str):
-        """ Validates the existence of a field name in the database for users, books, authors, and borrow-related data.
+    def email_taken(self, email: str, username=None):
+        """ Checks if another user (not the one named username) is registered with the email. Looked up in the email index, not through the accounts.
+
+            Returns:
+                bool: True if the email is taken, otherwise False. """
+        owner = self.indexes.username_of_email(email)
+        return owner is not None and owner != username
+
+
+    @staticmethod
+    def field_exists(field: str, dataset=None):
+        """ Validates the existence of a field name for users ('accounts'), books ('library'), authors, and borrow-related data ('borrows').
+            Looks it up in the schema registry instead of going through the records. Checks every entity if no dataset is given.
          
             Returns:
                 True if found, False otherwise. """
-        # This only works for the first three datasets: accounts, library, and authors
-        for dataset in self.data.values():
-            for names in dataset.values():
-                if field in names.keys():
-                    return True
-        
-        # borrow dataset has a very specific structure
-        for user_and_borrow_info in self.borrows.values():
-            for borrow_info in user_and_borrow_info.values():
-                if field in borrow_info.keys():
-                    return True
-        return False
+        if dataset is not None:
+            return get_field(dataset, field) is not None
+        return any(field in schema.fields for schema in SCHEMAS.values())
+
+
+    @staticmethod
+    def is_mutable(field: str, dataset: str):
+        """ Checks if the field of the entity stored in the dataset is allowed to be changed.
+
+            Returns:
+                bool: True if it can be changed, otherwise False. """
+        field_info = get_field(dataset, field)
+        return field_info is not None and field_info.mutable
+
+
+    @staticmethod
+    def is_valid_type(field: str, dataset: str, value):
+        """ Checks if the value is of the type the field holds (eg, an int for a book's 'quantity'), as declared in the schema registry.
+
+            Returns:
+                bool: True if it is, otherwise False. """
+        field_info = get_field(dataset, field)
+        return field_info is not None and field_info.accepts(value)
 
 
     def _is_borrow_overdue(self, book_title: str, borrower: str, returned_on: datetime):
@@ -110,9 +149,9 @@ class Check():
             
             Returns:
                 bool: True if borrow deadline is long overdue, False otherwise. """
-        # extracts the borrow_deadline from the user's borrow info and convert it back to datetime object.
-        borrow_deadline = datetime.strptime(self.borrows[book_title][borrower]['borrow_deadline'], "%A, %B %d, %Y")
-        
-        if returned_on > borrow_deadline:
+        # the deadline is stored as a timestamp (older data may still have it as text, which is converted).
+        borrow_deadline = to_timestamp(self.borrows[book_title][borrower]['borrow_deadline'])
+
+        if to_timestamp(returned_on) > borrow_deadline:
             return True
         return False
\ No newline at end of file
@@ -0,0 +1,65 @@
+""" Tests for running commands in batch mode (presentation.batch). Run with 'python -m unittest discover tests'. """
+
+from presentation.batch import run_batch
+from data import get_repository
+import json
+import os
+import tempfile
+import unittest
+
+
+
+class BatchTypesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, 'storage.json')
+        with open(self.file, 'w') as storage:
+            json.dump({'accounts': {}, 'authors': {}, 'library': {}, 'borrows': {}}, storage)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def run_lines(self, *lines):
+        summary = run_batch(lines, file=self.file)
+        errors = [result for line_number, command, result, output in summary['results'] if result != 'ok']
+        return summary, errors
+
+
+    def test_answers_are_converted_to_the_field_types(self):
+        summary, errors = self.run_lines('add_book Dune Herbert 1 n',
+                                         'update_book Dune quantity 3',
+                                         'update_book Dune is_available no',
+                                         'add_user ann ann@gmail.com 20',
+                                         'update_user ann age 30',
+                                         'update_author Herbert age 65')
+        self.assertEqual(errors, [])
+        self.assertTrue(summary['saved'])
+
+        data = get_repository(self.file).data
+        self.assertEqual(data['library']['Dune']['quantity'], 3)
+        self.assertIs(data['library']['Dune']['is_available'], False)
+        self.assertEqual(data['accounts']['ann']['age'], 30)
+        self.assertEqual(data['authors']['Herbert']['age'], 65)
+
+
+    def test_answers_of_the_wrong_type_are_rejected(self):
+        summary, errors = self.run_lines('add_book Dune Herbert 1 n',
+                                         'update_book Dune quantity lots',
+                                         'update_book Dune is_available maybe',
+                                         'add_user ann ann@gmail.com 20',
+                                         'update_user ann borrowed_books oops')
+        self.assertEqual(summary['failed'], 3)
+        self.assertTrue(all(error.startswith(('InvalidQuantityError', 'InvalidChangeError')) for error in errors))
+
+        # the lines that failed left nothing behind.
+        data = get_repository(self.file).data
+        self.assertEqual(data['library']['Dune']['quantity'], 1)
+        self.assertIs(data['library']['Dune']['is_available'], True)
+        self.assertEqual(data['accounts']['ann']['borrowed_books'], [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()